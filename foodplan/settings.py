@@ -38,6 +38,13 @@ LOGOUT_REDIRECT_URL = 'index'
 
 AUTH_USER_MODEL = "foodplan_app.User"
 
+# вход на сайте — по email (одним запросом по уникальному индексу),
+# в админке — по имени пользователя
+AUTHENTICATION_BACKENDS = [
+    "foodplan_app.backends.EmailBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -71,13 +78,68 @@ WSGI_APPLICATION = "foodplan.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite настроен на одновременную работу нескольких процессов (foodplan_app.sqlite):
+# WAL — читатели не ждут писателя, busy_timeout — ожидание блокировки вместо ошибки,
+# BEGIN IMMEDIATE — транзакция сразу встаёт в очередь на запись.
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    # 64 МБ кэша страниц и 256 МБ файла в памяти на соединение
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+]
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "foodplan_app.sqlite",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "init_command": ";".join(SQLITE_PRAGMAS),
+            "transaction_mode": "IMMEDIATE",
+        },
+    }
+}
+
+# Профиль для продакшена (FOODPLAN_SQLITE_PRODUCTION=1): постоянные соединения
+# с проверкой перед использованием и отдельное соединение только для чтения,
+# через которое идут представления с read_only_view (foodplan_app.routers).
+if os.environ.get("FOODPLAN_SQLITE_PRODUCTION") == "1":
+    DATABASES["default"].update(CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True)
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "OPTIONS": {
+            # режим WAL хранится в файле и включается соединением default
+            "init_command": ";".join(SQLITE_PRAGMAS[1:] + ["PRAGMA query_only = ON"]),
+            "transaction_mode": "DEFERRED",
+        },
+        "TEST": {"MIRROR": "default"},
     }
+    DATABASE_ROUTERS = ["foodplan_app.routers.ReadOnlyRouter"]
+
+
+# Cache
+# Версии каталога рецептов, тарифов и промокодов (foodplan_app.versions) лежат
+# в отдельном файловом кэше, общем для всех процессов приложения: правка
+# в админке или импорт в одном процессе сбрасывают кэш во всех остальных.
+# Всё прочее кэшируется в памяти процесса под ключами с этими версиями.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get(
+            "FOODPLAN_SHARED_CACHE_DIR", os.path.join(BASE_DIR, "var", "shared-cache")
+        ),
+        "TIMEOUT": None,
+    },
 }
 
+# Максимум профилей (типы меню + аллергии) в кэше безопасных рецептов процесса
+SAFE_RECIPE_CACHE_SIZE = 1024
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -118,6 +180,15 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
+# Загрузки называются по хешу содержимого (foodplan_app.storage): одинаковые
+# файлы хранятся один раз, а /media/ можно кэшировать навсегда. Уменьшенные
+# копии изображений (foodplan_app.renditions) уже приходят с такими именами.
+STORAGES = {
+    "default": {"BACKEND": "foodplan_app.storage.ContentAddressedStorage"},
+    "renditions": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
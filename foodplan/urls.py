@@ -16,8 +16,12 @@ urlpatterns = [
     path('recipes/<int:recipe_id>/', recipe_detail, name='recipe_detail'),
     path('logout/', LogoutView.as_view(next_page='index'), name='logout'),
     path('subscription-recipes/', views.subscription_recipes_view, name='subscription_recipes'),
+    path('lk/shopping-list/', views.shopping_list_view, name='shopping_list'),
+    path('lk/shopping-list.csv', views.shopping_list_csv_view, name='shopping_list_csv'),
     path("ajax/check-promocode/", views.ajax_check_promocode, name="check_promocode"),
+    path("stats/safe-recipe-cache/", views.safe_recipe_cache_stats, name="safe_recipe_cache_stats"),
+    path("catalog/export/", views.catalog_export_view, name="catalog_export"),
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, view=views.media_view, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,5 +1,9 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.auth.admin import UserAdmin
+from django.template.response import TemplateResponse
 from .models import (
     User,
     FoodTag,
@@ -12,8 +16,91 @@ from .models import (
     MenuType,
     Subscription,
     PromoCode,
+    Tariff,
+    TariffPrice,
 )
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Prefetch
+from django.utils.functional import cached_property
 from django.utils.html import format_html
+from .promocodes import generate_promocodes
+from .renditions import image_url
+from .search import search
+
+
+def join_names(objects, attr="name"):
+    # объекты берутся из prefetch_related, поэтому без exists() и лишних запросов
+    names = [getattr(obj, attr) for obj in objects]
+    return ", ".join(names) if names else "-"
+
+
+def estimate_row_count(queryset):
+    """
+    Примерное число строк таблицы без COUNT(*) из статистики ANALYZE
+    (sqlite_stat1); None, если статистики нет. Наибольший rowid не годится:
+    после удалений он сильно больше числа строк, и ссылки на последние
+    страницы ведут в пустоту.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "sqlite":
+        return None
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        if cursor.fetchone():
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            if row:
+                return int(row[0].split()[0])
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Для списка без фильтров и поиска по большой таблице берёт оценку числа
+    строк; отфильтрованный или небольшой список считается точно.
+    """
+
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset)
+            if estimate is not None and estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+class IndexedBooleanFieldListFilter(admin.BooleanFieldListFilter):
+    """
+    Фильтр «да/нет», который сравнивает поле явно: «"premium" IN (1)» вместо
+    голого «"premium"» — такое условие SQLite не ищет по составному индексу.
+    """
+
+    def queryset(self, request, queryset):
+        lookups = dict(self.used_parameters)
+        if self.lookup_kwarg in lookups:
+            lookups[f"{self.field_path}__in"] = [lookups.pop(self.lookup_kwarg)]
+        try:
+            return queryset.filter(**lookups)
+        except (ValueError, ValidationError) as error:
+            raise IncorrectLookupParameters(error)
+
+
+class IndexedSearchMixin:
+    """Поиск по названию через индексы из search.py вместо icontains."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search(queryset, search_term), False
 
 
 @admin.register(User)
@@ -46,14 +133,15 @@ class SubscriptionAdmin(admin.ModelAdmin):
     list_filter = ("months", "breakfast", "lunch", "dinner", "dessert")
     list_editable = ("breakfast", "lunch", "dinner", "dessert")
     filter_horizontal = ("menu_types",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("user").prefetch_related("menu_types")
     
     def userpage(self, obj):
         return obj.user.username
     
     def menu_types_list(self, obj):
-        if obj.menu_types.exists():
-            return ", ".join(menu_type.title for menu_type in obj.menu_types.all())
-        return "-"
+        return join_names(obj.menu_types.all(), "title")
     
     userpage.short_description = "Страница пользователя"
     menu_types_list.short_description = "Типы меню"
@@ -84,24 +172,23 @@ class UserPageAdmin(admin.ModelAdmin):
     list_filter = ("is_subscribed", "menu_types")
     filter_horizontal = ("menu_types", "allergies", "liked_recipes", "disliked_recipes")
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("user").prefetch_related(
+            "menu_types",
+            "allergies",
+            Prefetch("daily_menu", queryset=DailyMenu.objects.only("id", "date")),
+        )
+
     def menu_types_list(self, obj):
-        if obj.menu_types.exists():
-            return ", ".join(menu_type.title for menu_type in obj.menu_types.all())
-        return "-"
+        return join_names(obj.menu_types.all(), "title")
     
     menu_types_list.short_description = "Типы меню"
 
     def all_allergies(self, obj):
-        if obj.allergies:
-            return ", ".join(allergy.name for allergy in obj.allergies.all())
-        return "-"
+        return join_names(obj.allergies.all())
 
     def daily_menus(self, obj):
-        if obj.daily_menu:
-            return ", ".join(
-                f"{menu.date}" for menu in obj.daily_menu.all()
-            )
-        return "-"
+        return join_names(obj.daily_menu.all(), "date")
 
     def image_preview(self, obj):
         if obj.image:
@@ -109,7 +196,7 @@ class UserPageAdmin(admin.ModelAdmin):
                 '<img src="{url}" style="max-width: {max_width}px; max-height: {max_height}px; width: auto; height: auto;"/>',
                 max_width=200,
                 max_height=200,
-                url=obj.image.url,
+                url=image_url(obj, "thumb"),
             )
         return format_html('<span style="color: gray;">Нет изображения</span>')
 
@@ -118,16 +205,19 @@ class UserPageAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(IndexedSearchMixin, admin.ModelAdmin):
     search_fields = ("name",)
+    # порядок по индексу названия; нужен и для выдачи автодополнения
+    ordering = ("name",)
     list_display = ("name", "price", "allergens_list")
     list_filter = ("allergens",)
     filter_horizontal = ("allergens",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("allergens")
     
     def allergens_list(self, obj):
-        if obj.allergens.exists():
-            return ", ".join(allergen.name for allergen in obj.allergens.all())
-        return "-"
+        return join_names(obj.allergens.all())
     
     allergens_list.short_description = "Аллергены"
 
@@ -137,10 +227,15 @@ class RecipeIngredientInline(admin.TabularInline):
     extra = 0
     fields = ("ingredient", "mass", "get_allergens")
     autocomplete_fields = ["ingredient"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("ingredient").prefetch_related(
+            "ingredient__allergens"
+        )
     
     def get_allergens(self, obj):
-        if obj.ingredient and obj.ingredient.allergens.exists():
-            return ", ".join(allergen.name for allergen in obj.ingredient.allergens.all())
+        if obj.ingredient_id:
+            return join_names(obj.ingredient.allergens.all())
         return "-"
     
     get_allergens.short_description = "Аллергены"
@@ -148,7 +243,7 @@ class RecipeIngredientInline(admin.TabularInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = [
         "title",
         "description",
@@ -160,23 +255,29 @@ class RecipeAdmin(admin.ModelAdmin):
         "menu_types_list",
         "on_index",
     ]
-    list_filter = ("meal_type", "premium", "ingredients__ingredient__allergens", "menu_types")
+    # premium вместе с meal_type ищется по индексу recipe_meal_premium_idx;
+    # allergens — связь, заранее посчитанная в rollups.recompute_recipe_allergens
+    list_filter = (
+        "meal_type",
+        ("premium", IndexedBooleanFieldListFilter),
+        "allergens",
+        "menu_types",
+    )
     inlines = [RecipeIngredientInline]
-    readonly_fields = ["image_preview"]
+    # итоги считаются по ингредиентам (rollups) и перезаписали бы ручную правку
+    readonly_fields = ["image_preview", "price", "mass", "calories"]
     search_fields = ("title",)
     list_editable = ("on_index", "premium")
     filter_horizontal = ("menu_types",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("allergens", "menu_types")
     
     def allergens_list(self, obj):
-        allergens = obj.get_allergens()
-        if allergens:
-            return ", ".join(allergen.name for allergen in allergens)
-        return "-"
+        return join_names(obj.get_allergens())
     
     def menu_types_list(self, obj):
-        if obj.menu_types.exists():
-            return ", ".join(menu_type.title for menu_type in obj.menu_types.all())
-        return "-"
+        return join_names(obj.menu_types.all(), "title")
     
     allergens_list.short_description = "Аллергены в рецепте"
     menu_types_list.short_description = "Типы меню"
@@ -187,7 +288,7 @@ class RecipeAdmin(admin.ModelAdmin):
                 '<img src="{url}" style="max-width: {max_width}px; max-height: {max_height}px; width: auto; height: auto; border-radius: 50%"/>',
                 max_width=100,
                 max_height=100,
-                url=obj.image.url,
+                url=image_url(obj, "thumb"),
             )
         return format_html('<span style="color: gray;">Нет изображения</span>')
 
@@ -204,7 +305,7 @@ class MenuTypeAdmin(admin.ModelAdmin):
                 '<img src="{url}" style="max-width: {max_width}px; max-height: {max_height}px; width: auto; height: auto;"/>',
                 max_width=200,
                 max_height=200,
-                url=obj.image.url,
+                url=image_url(obj, "thumb"),
             )
         return format_html('<span style="color: gray;">Нет изображения</span>')
 
@@ -216,10 +317,13 @@ class DailyMenuAdmin(admin.ModelAdmin):
     list_display = ("date", "breakfast", "lunch", "dinner", "menu_types_list")
     filter_horizontal = ("menu_types", "users")
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            "breakfast", "lunch", "dinner"
+        ).prefetch_related("menu_types")
+
     def menu_types_list(self, obj):
-        if obj.menu_types.exists():
-            return ", ".join(menu_type.title for menu_type in obj.menu_types.all())
-        return "-"
+        return join_names(obj.menu_types.all(), "title")
     
     menu_types_list.short_description = "Типы меню"
 
@@ -230,8 +334,65 @@ class PriceRangeAdmin(admin.ModelAdmin):
     search_fields = ["name"]
 
 
+class GeneratePromoCodesForm(forms.Form):
+    count = forms.IntegerField(
+        min_value=1,
+        max_value=1_000_000,
+        initial=100,
+        label="Количество"
+    )
+    prefix = forms.CharField(
+        required=False,
+        max_length=20,
+        label="Префикс"
+    )
+
+
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
-    list_display = ('code', 'discount_percent', 'is_active', 'valid_from', 'valid_to')
+    list_display = ('code', 'discount_percent', 'is_active', 'valid_from', 'valid_to', 'uses', 'max_uses')
     list_filter = ('is_active',)
-    search_fields = ('code',)
\ No newline at end of file
+    search_fields = ('code',)
+    readonly_fields = ('uses',)
+    actions = ['generate_similar']
+
+    @admin.action(description="Сгенерировать промокоды по образцу")
+    def generate_similar(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Выберите один промокод-образец.", messages.WARNING)
+            return None
+        sample = queryset.get()
+
+        form = GeneratePromoCodesForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            codes = generate_promocodes(
+                form.cleaned_data["count"],
+                sample.discount_percent,
+                prefix=form.cleaned_data["prefix"],
+                valid_from=sample.valid_from,
+                valid_to=sample.valid_to,
+                max_uses=sample.max_uses,
+            )
+            self.message_user(request, f"Создано промокодов: {len(codes)}.", messages.SUCCESS)
+            return None
+
+        return TemplateResponse(request, "admin/foodplan_app/promocode/generate_promocodes.html", {
+            **self.admin_site.each_context(request),
+            "title": "Генерация промокодов",
+            "opts": self.model._meta,
+            "sample": sample,
+            "form": form,
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        })
+
+
+class TariffPriceInline(admin.TabularInline):
+    model = TariffPrice
+    extra = 0
+
+
+@admin.register(Tariff)
+class TariffAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "is_active", "created_at")
+    list_filter = ("is_active",)
+    inlines = [TariffPriceInline]
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class FoodplanAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'foodplan_app'
\ No newline at end of file
+    name = 'foodplan_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+UserModel = get_user_model()
+
+
+class EmailBackend(ModelBackend):
+    """
+    Вход по email: пользователь читается одним запросом по уникальному
+    индексу email, пароль и флаг is_active проверяются как в ModelBackend.
+    Вход по имени пользователя (админка) остаётся за ModelBackend.
+    """
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if email is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get(email=email)
+        except UserModel.DoesNotExist:
+            # хешируем и для неизвестного email, чтобы по времени ответа
+            # нельзя было узнать, зарегистрирован ли адрес
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,33 @@
+from itertools import islice
+
+from django.db import connections, router
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def insert_rows(model, fields, rows, batch_size=2000):
+    """
+    Вставляет кортежи значений в таблицу модели через executemany,
+    минуя создание экземпляров моделей. Подходит для таблиц связей M2M
+    и других строк, которым не нужны сигналы и значения по умолчанию.
+    Значения должны быть уже приведены к типам базы данных.
+    Возвращает количество вставленных строк.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns = [model._meta.get_field(name).column for name in fields]
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        quote(model._meta.db_table),
+        ", ".join(quote(column) for column in columns),
+        ", ".join(["%s"] * len(columns)),
+    )
+    inserted = 0
+    with connection.cursor() as cursor:
+        for batch in batches(rows, batch_size):
+            cursor.executemany(sql, batch)
+            inserted += len(batch)
+    return inserted
@@ -0,0 +1,163 @@
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+
+from .models import Recipe
+from .versions import bump_version, get_version
+
+
+CATALOG_VERSION_KEY = "foodplan:catalog-version"
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def _union(groups, keys):
+    keys = list(keys)
+    if len(keys) == 1:
+        # без копии: результат дальше только пересекается или вычитается
+        return groups.get(keys[0], frozenset())
+    result = set()
+    for key in keys:
+        result |= groups.get(key, frozenset())
+    return result
+
+
+class CatalogIndex:
+    """
+    Снимок каталога рецептов в памяти процесса: id рецептов
+    по типу меню, приёму пищи и аллергену.
+    """
+
+    def __init__(self, version, meal_types, menu_types, allergens):
+        self.version = version
+        self.recipe_ids_all = frozenset(meal_types)
+        self.by_meal_type = self._group(
+            (meal_type, recipe_id) for recipe_id, meal_type in meal_types.items()
+        )
+        self.by_menu_type = self._group(menu_types)
+        self.by_allergen = self._group(allergens)
+
+    @staticmethod
+    def _group(pairs):
+        groups = defaultdict(set)
+        for key, recipe_id in pairs:
+            groups[key].add(recipe_id)
+        return {key: frozenset(ids) for key, ids in groups.items()}
+
+    @classmethod
+    def build(cls, version):
+        through_menu_types = Recipe.menu_types.through.objects.order_by()
+        through_allergens = Recipe.allergens.through.objects.order_by()
+        return cls(
+            version,
+            meal_types=dict(Recipe.objects.order_by().values_list("id", "meal_type")),
+            menu_types=through_menu_types.values_list("menutype_id", "recipe_id"),
+            allergens=through_allergens.values_list("foodtag_id", "recipe_id"),
+        )
+
+    def recipe_ids(self, menu_type_ids=(), meal_types=(), allergy_ids=()):
+        """
+        Отсортированные id рецептов с теми же правилами, что и
+        Recipe.objects.safe_for(): пустой список — без ограничения.
+        """
+        ids = self.recipe_ids_all
+        if menu_type_ids:
+            ids = ids & _union(self.by_menu_type, menu_type_ids)
+        if meal_types:
+            ids = ids & _union(self.by_meal_type, meal_types)
+        if allergy_ids:
+            ids = ids - self.unsafe_ids(allergy_ids)
+        return sorted(ids)
+
+    def unsafe_ids(self, allergy_ids):
+        return _union(self.by_allergen, allergy_ids)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_catalog_index():
+    global _index
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = CatalogIndex.build(version)
+        return _index
+
+
+class SafeRecipeCache:
+    """
+    LRU-кэш списков безопасных рецептов. Ключ — отпечаток профиля:
+    отсортированные id типов меню, аллергий, приёмы пищи и версия каталога,
+    поэтому пользователи с одинаковыми настройками делят одну запись.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(version, menu_type_ids, allergy_ids, meal_types):
+        return (
+            tuple(sorted(set(menu_type_ids))),
+            tuple(sorted(set(allergy_ids))),
+            tuple(sorted(set(meal_types))),
+            version,
+        )
+
+    def recipe_ids(self, menu_type_ids=(), allergy_ids=(), meal_types=()):
+        """Кортеж id безопасных рецептов; количество — его длина."""
+        catalog = get_catalog_index()
+        key = self.fingerprint(catalog.version, menu_type_ids, allergy_ids, meal_types)
+        with self._lock:
+            if self._version != catalog.version:
+                self._entries.clear()
+                self._version = catalog.version
+            ids = self._entries.get(key)
+            if ids is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return ids
+            self.misses += 1
+
+        ids = tuple(catalog.recipe_ids(menu_type_ids, meal_types, allergy_ids))
+        with self._lock:
+            if self._version == catalog.version:
+                self._entries[key] = ids
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return ids
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "catalog_version": self._version,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+safe_recipe_cache = SafeRecipeCache(getattr(settings, "SAFE_RECIPE_CACHE_SIZE", 1024))
@@ -0,0 +1,592 @@
+import gzip
+import json
+import zlib
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, connections, router, transaction
+
+from .bulk import insert_rows
+from .catalog import bump_catalog_version
+from .models import FoodTag, Ingredient, MenuType, PriceRange, Recipe, RecipeIngredient
+from .rollups import recompute_recipe_allergens, recompute_recipe_rollups
+
+
+BATCH_SIZE = 2000
+READ_CHUNK_SIZE = 1024 * 1024
+EXPORT_CHUNK_SIZE = 2000
+# размер куска, который отдаётся в файл или HTTP-ответ
+WRITE_BUFFER_SIZE = 64 * 1024
+
+# Настройки SQLite на время загрузки: без fsync и с журналом в памяти.
+# При сбое посреди импорта база может остаться частично загруженной,
+# но каждый пакет — отдельная транзакция, повторный импорт её дозагрузит.
+BULK_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "journal_mode": "MEMORY",
+    "temp_store": "MEMORY",
+    "cache_size": "-262144",
+}
+
+
+class CatalogFormatError(ValueError):
+    pass
+
+
+class JSONStream:
+    """
+    Потоковый разбор JSON вида {"раздел": [запись, ...], ...}:
+    записи читаются по одной через JSONDecoder.raw_decode, в памяти
+    держится только буфер чтения и текущая запись.
+    """
+
+    WHITESPACE = " \t\n\r"
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _next(self):
+        char = self._peek()
+        self.pos += 1
+        return char
+
+    def _expect(self, expected):
+        char = self._next()
+        if char != expected:
+            raise CatalogFormatError(f"Ожидался {expected!r}, получен {char!r}")
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # число на границе буфера могло быть прочитано не целиком
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self):
+        """Пары (раздел, запись); разделы, значение которых не список, пропускаются."""
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            section = self._value()
+            self._expect(":")
+            if self._peek() == "[":
+                self._next()
+                if self._peek() == "]":
+                    self._next()
+                else:
+                    while True:
+                        yield section, self._value()
+                        char = self._next()
+                        if char == "]":
+                            break
+                        if char != ",":
+                            raise CatalogFormatError(f"Ожидался ',' или ']', получен {char!r}")
+            else:
+                self._value()
+            char = self._next()
+            if char == "}":
+                return
+            if char != ",":
+                raise CatalogFormatError(f"Ожидался ',' или '}}', получен {char!r}")
+
+
+def iter_ndjson(stream):
+    """Пары (раздел, запись) из NDJSON: по объекту на строку с ключом "section"."""
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        try:
+            section = record.pop("section")
+        except (AttributeError, KeyError):
+            raise CatalogFormatError(f"Строка {number}: нет ключа 'section'")
+        yield section, record
+
+
+def catalog_format(path):
+    name = str(path).removesuffix(".gz")
+    return "ndjson" if name.endswith((".ndjson", ".jsonl")) else "json"
+
+
+@contextmanager
+def open_catalog(path, file_format=None, chunk_size=READ_CHUNK_SIZE):
+    """Открывает файл каталога (в том числе .gz) и отдаёт итератор пар (раздел, запись)."""
+    file_format = file_format or catalog_format(path)
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as stream:
+        if file_format == "ndjson":
+            yield iter_ndjson(stream)
+        else:
+            yield iter(JSONStream(stream, chunk_size))
+
+
+@contextmanager
+def bulk_load_pragmas(enabled=True):
+    if not enabled or connection.vendor != "sqlite":
+        yield
+        return
+    with connection.cursor() as cursor:
+        previous = {}
+        for name, value in BULK_LOAD_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}")
+            previous[name] = cursor.fetchone()[0]
+            # режим WAL сам подходит для загрузки, а выход из него требует монопольного доступа
+            if name == "journal_mode" and str(previous[name]).lower() == "wal":
+                del previous[name]
+                continue
+            cursor.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+
+
+class CatalogImporter:
+    """
+    Загружает каталог пакетами с обновлением по естественному ключу:
+    аллергены, диапазоны цен и ингредиенты — по name, типы меню и рецепты —
+    по title, ингредиенты рецепта — по паре (рецепт, ингредиент).
+    Ссылки на другие записи задаются либо id из того же файла, либо
+    естественным ключом. Каждый пакет сохраняется отдельной транзакцией.
+    Сигналы при пакетной записи не срабатывают, поэтому итоги рецептов
+    пересчитываются в finish().
+    """
+
+    # раздел: (модель, естественный ключ, обновляемые поля)
+    ENTITIES = {
+        "food_tags": (FoodTag, "name", []),
+        "price_ranges": (PriceRange, "name", ["min_price", "max_price"]),
+        "menu_types": (MenuType, "title", ["image"]),
+        "ingredients": (Ingredient, "name", ["price", "caloricity"]),
+        "recipes": (
+            Recipe,
+            "title",
+            ["image", "description", "sequence", "meal_type", "premium", "on_index"],
+        ),
+    }
+    # раздел связей: (модель-владелец, поле M2M, ключ владельца, ключ цели)
+    LINKS = {
+        "ingredient_allergens": (Ingredient, "allergens", "ingredient_id", "foodtag_id"),
+        "recipe_menu_types": (Recipe, "menu_types", "recipe_id", "menutype_id"),
+    }
+    NATURAL_KEYS = {model: key for model, key, _ in ENTITIES.values()}
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.source_ids = defaultdict(dict)
+        self.stats = defaultdict(Counter)
+        self.records = 0
+
+    def run(self, records):
+        section, batch = None, []
+        for record_section, record in records:
+            if record_section != section or len(batch) >= self.batch_size:
+                self.flush(section, batch)
+                section, batch = record_section, []
+            batch.append(record)
+        self.flush(section, batch)
+
+    def flush(self, section, batch):
+        if not batch:
+            return
+        self.records += len(batch)
+        with transaction.atomic():
+            if section in self.ENTITIES:
+                self.import_entities(section, batch)
+            elif section == "recipe_ingredients":
+                self.import_recipe_ingredients(batch)
+            elif section in self.LINKS:
+                self.import_links(section, batch)
+            else:
+                self.stats[section]["skipped"] += len(batch)
+
+    def finish(self):
+        recompute_recipe_rollups()
+        recompute_recipe_allergens()
+        bump_catalog_version()
+        if connection.vendor == "sqlite":
+            # свежая статистика нужна планировщику и оценке числа строк в админке
+            with connection.cursor() as cursor:
+                for model in (Ingredient, Recipe, RecipeIngredient):
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+    def resolve(self, model, refs):
+        """id в базе для ссылок: число — id из файла, строка — естественный ключ."""
+        resolved = {}
+        names = set()
+        for ref in refs:
+            if isinstance(ref, str):
+                names.add(ref)
+            elif ref in self.source_ids[model]:
+                resolved[ref] = self.source_ids[model][ref]
+        if names:
+            key = self.NATURAL_KEYS[model]
+            rows = model.objects.filter(**{f"{key}__in": names}).order_by("-pk")
+            found = dict(rows.values_list(key, "pk"))
+            resolved.update((name, found[name]) for name in names if name in found)
+        return resolved
+
+    def insert(self, model, records):
+        """
+        Вставляет новые строки мимо ORM: значения по умолчанию и приведение
+        к типам базы берутся из полей модели.
+        """
+        db = connections[router.db_for_write(model)]
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        # значения по умолчанию приводятся один раз на пакет
+        defaults = [field.get_db_prep_save(field.get_default(), db) for field in fields]
+        insert_rows(
+            model,
+            [field.name for field in fields],
+            (
+                [
+                    field.get_db_prep_save(values[field.name], db) if field.name in values else default
+                    for field, default in zip(fields, defaults)
+                ]
+                for values in records
+            ),
+            batch_size=self.batch_size,
+        )
+
+    def import_entities(self, section, batch):
+        model, key, fields = self.ENTITIES[section]
+        stats = self.stats[section]
+        rows = {}
+        for record in batch:
+            name = str(record.get(key) or "").strip()
+            if name:
+                rows[name] = record
+            else:
+                stats["skipped"] += 1
+
+        # хеш изображения сбрасывается вместе с самим изображением,
+        # копии потом строит generate_renditions
+        columns = [*fields, "image_hash"] if "image" in fields else fields
+        # при повторах имени в базе обновляется самая ранняя запись
+        existing = {
+            values[key]: values
+            for values in model.objects.filter(**{f"{key}__in": rows})
+            .order_by("-pk")
+            .values("pk", key, *columns)
+        }
+        created, changed = [], []
+        for name, record in rows.items():
+            values = {
+                field: model._meta.get_field(field).to_python(record[field])
+                for field in fields
+                if field in record and record[field] is not None
+            }
+            current = existing.get(name)
+            if current is None:
+                created.append({key: name, **values})
+            elif any(current[field] != value for field, value in values.items()):
+                if "image" in values and values["image"] != current["image"]:
+                    values["image_hash"] = ""
+                changed.append(model(**{**current, **values}))
+            else:
+                stats["unchanged"] += 1
+        self.insert(model, created)
+        if changed:
+            model.objects.bulk_update(changed, columns, batch_size=self.batch_size)
+        stats["created"] += len(created)
+        stats["updated"] += len(changed)
+
+        pks = {name: values["pk"] for name, values in existing.items()}
+        if created:
+            pks.update(
+                model.objects.filter(**{f"{key}__in": [values[key] for values in created]})
+                .values_list(key, "pk")
+            )
+        for name, record in rows.items():
+            if record.get("id") is not None:
+                self.source_ids[model][record["id"]] = pks[name]
+
+        if model is Ingredient:
+            self.set_links(model, "allergens", FoodTag, rows, pks, ["allergens"])
+        elif model is Recipe:
+            self.set_links(model, "menu_types", MenuType, rows, pks, ["menu_types", "menu_type_id"])
+
+    def set_links(self, model, field, target, rows, pks, record_keys):
+        """Заменяет связи M2M у записей, в которых они указаны."""
+        wanted = {}
+        for name, record in rows.items():
+            refs = []
+            present = False
+            for record_key in record_keys:
+                value = record.get(record_key)
+                if value is None:
+                    continue
+                present = True
+                refs.extend(value if isinstance(value, list) else [value])
+            if present:
+                wanted[pks[name]] = refs
+        if not wanted:
+            return
+
+        resolved = self.resolve(target, {ref for refs in wanted.values() for ref in refs})
+        through = getattr(model, field).through
+        owner_column = f"{model._meta.model_name}_id"
+        target_column = f"{target._meta.model_name}_id"
+        existing = defaultdict(dict)
+        for pk, owner_id, target_id in through.objects.filter(
+            **{f"{owner_column}__in": wanted}
+        ).values_list("pk", owner_column, target_column):
+            existing[owner_id][target_id] = pk
+
+        stale, new = [], []
+        for owner_id, refs in wanted.items():
+            target_ids = {resolved[ref] for ref in refs if ref in resolved}
+            current = existing[owner_id]
+            stale.extend(pk for target_id, pk in current.items() if target_id not in target_ids)
+            new.extend((owner_id, target_id) for target_id in target_ids - current.keys())
+        if stale:
+            through.objects.filter(pk__in=stale).delete()
+        insert_rows(through, [owner_column, target_column], new, batch_size=self.batch_size)
+
+    def import_recipe_ingredients(self, batch):
+        stats = self.stats["recipe_ingredients"]
+        recipes = self.resolve(Recipe, {r.get("recipe", r.get("recipe_id")) for r in batch} - {None})
+        ingredients = self.resolve(
+            Ingredient, {r.get("ingredient", r.get("ingredient_id")) for r in batch} - {None}
+        )
+        mass_field = RecipeIngredient._meta.get_field("mass")
+        rows = {}
+        for record in batch:
+            recipe_id = recipes.get(record.get("recipe", record.get("recipe_id")))
+            ingredient_id = ingredients.get(record.get("ingredient", record.get("ingredient_id")))
+            if recipe_id is None or ingredient_id is None:
+                stats["skipped"] += 1
+                continue
+            rows[recipe_id, ingredient_id] = mass_field.to_python(record.get("mass") or 0)
+
+        existing = {
+            (recipe_id, ingredient_id): (pk, mass)
+            for pk, recipe_id, ingredient_id, mass in RecipeIngredient.objects.filter(
+                recipe_id__in={recipe_id for recipe_id, _ in rows}
+            )
+            .order_by("-pk")
+            .values_list("pk", "recipe_id", "ingredient_id", "mass")
+        }
+        created, changed = [], []
+        for (recipe_id, ingredient_id), mass in rows.items():
+            current = existing.get((recipe_id, ingredient_id))
+            if current is None:
+                created.append({"recipe": recipe_id, "ingredient": ingredient_id, "mass": mass})
+            elif current[1] != mass:
+                changed.append(RecipeIngredient(pk=current[0], mass=mass))
+            else:
+                stats["unchanged"] += 1
+        self.insert(RecipeIngredient, created)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["mass"], batch_size=self.batch_size)
+        stats["created"] += len(created)
+        stats["updated"] += len(changed)
+
+    def import_links(self, section, batch):
+        model, field, owner_key, target_key = self.LINKS[section]
+        target = model._meta.get_field(field).related_model
+        owner_ref = owner_key.removesuffix("_id")
+        target_ref = target_key.removesuffix("_id")
+        owners = self.resolve(model, {r.get(owner_ref, r.get(owner_key)) for r in batch} - {None})
+        targets = self.resolve(target, {r.get(target_ref, r.get(target_key)) for r in batch} - {None})
+        through = getattr(model, field).through
+        links = set()
+        for record in batch:
+            owner_id = owners.get(record.get(owner_ref, record.get(owner_key)))
+            target_id = targets.get(record.get(target_ref, record.get(target_key)))
+            if owner_id is None or target_id is None:
+                self.stats[section]["skipped"] += 1
+            else:
+                links.add((owner_id, target_id))
+        through.objects.bulk_create(
+            [through(**{owner_key: owner_id, target_key: target_id}) for owner_id, target_id in links],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        self.stats[section]["linked"] += len(links)
+
+
+def _number(value):
+    # Decimal -> число JSON, как в all_selected_data.json
+    if value is None:
+        return None
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def _with_links(rows, through, owner_column, target_column, chunk_size):
+    """
+    Добавляет к строкам, отсортированным по id, списки связанных id: строки
+    и таблица связей читаются параллельно, слиянием по id владельца,
+    без prefetch_related и без создания экземпляров моделей.
+    """
+    links = through.objects.order_by(owner_column, target_column).values_list(
+        owner_column, target_column
+    ).iterator(chunk_size)
+    link = next(links, None)
+    for row in rows:
+        pk = row[0]
+        target_ids = []
+        while link is not None and link[0] <= pk:
+            if link[0] == pk:
+                target_ids.append(link[1])
+            link = next(links, None)
+        yield row, target_ids
+
+
+def _export_food_tags(chunk_size):
+    for pk, name in FoodTag.objects.order_by("pk").values_list("pk", "name").iterator(chunk_size):
+        yield {"id": pk, "name": name}
+
+
+def _export_menu_types(chunk_size):
+    rows = MenuType.objects.order_by("pk").values_list("pk", "title", "image")
+    for pk, title, image in rows.iterator(chunk_size):
+        yield {"id": pk, "title": title, "image": image or ""}
+
+
+def _export_price_ranges(chunk_size):
+    rows = PriceRange.objects.order_by("pk").values_list("pk", "name", "min_price", "max_price")
+    for pk, name, min_price, max_price in rows.iterator(chunk_size):
+        yield {"id": pk, "name": name, "min_price": _number(min_price), "max_price": _number(max_price)}
+
+
+def _export_ingredients(chunk_size):
+    rows = Ingredient.objects.order_by("pk").values_list("pk", "name", "price", "caloricity")
+    for (pk, name, price, caloricity), allergens in _with_links(
+        rows.iterator(chunk_size), Ingredient.allergens.through, "ingredient_id", "foodtag_id", chunk_size
+    ):
+        yield {
+            "id": pk,
+            "name": name,
+            "price": _number(price),
+            "caloricity": _number(caloricity),
+            "allergens": allergens,
+        }
+
+
+RECIPE_EXPORT_FIELDS = [
+    "title",
+    "image",
+    "description",
+    "sequence",
+    "meal_type",
+    "premium",
+    "on_index",
+    "price",
+    "mass",
+    "calories",
+]
+
+
+def _export_recipes(chunk_size):
+    rows = Recipe.objects.order_by("pk").values_list("pk", *RECIPE_EXPORT_FIELDS)
+    for (pk, *values), menu_types in _with_links(
+        rows.iterator(chunk_size), Recipe.menu_types.through, "recipe_id", "menutype_id", chunk_size
+    ):
+        record = {"id": pk, **dict(zip(RECIPE_EXPORT_FIELDS, values))}
+        for field in ("price", "mass", "calories"):
+            record[field] = _number(record[field])
+        record["image"] = record["image"] or ""
+        record["menu_types"] = menu_types
+        yield record
+
+
+def _export_recipe_ingredients(chunk_size):
+    rows = RecipeIngredient.objects.order_by("pk").values_list(
+        "pk", "mass", "ingredient_id", "recipe_id"
+    )
+    for pk, mass, ingredient_id, recipe_id in rows.iterator(chunk_size):
+        yield {"id": pk, "mass": _number(mass), "ingredient_id": ingredient_id, "recipe_id": recipe_id}
+
+
+# порядок разделов важен для импорта: ссылки идут на уже выгруженные записи
+EXPORT_SECTIONS = {
+    "food_tags": _export_food_tags,
+    "menu_types": _export_menu_types,
+    "price_ranges": _export_price_ranges,
+    "ingredients": _export_ingredients,
+    "recipes": _export_recipes,
+    "recipe_ingredients": _export_recipe_ingredients,
+}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def iter_catalog_json(chunk_size=EXPORT_CHUNK_SIZE):
+    """Каталог в формате all_selected_data.json, по одной записи за кусок."""
+    yield "{"
+    for number, (section, export) in enumerate(EXPORT_SECTIONS.items()):
+        yield f'{"," if number else ""}\n  {_dumps(section)}: ['
+        separator = "\n    "
+        for record in export(chunk_size):
+            yield separator + _dumps(record)
+            separator = ",\n    "
+        yield "]" if separator == "\n    " else "\n  ]"
+    yield "\n}\n"
+
+
+def iter_catalog_ndjson(chunk_size=EXPORT_CHUNK_SIZE):
+    for section, export in EXPORT_SECTIONS.items():
+        for record in export(chunk_size):
+            yield _dumps({"section": section, **record}) + "\n"
+
+
+def iter_catalog_export(file_format="json", compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Выгрузка каталога кусками bytes по WRITE_BUFFER_SIZE, при compress — в gzip.
+    Память не зависит от размера каталога: строки читаются через iterator().
+    """
+    pieces = iter_catalog_ndjson(chunk_size) if file_format == "ndjson" else iter_catalog_json(chunk_size)
+    # wbits=31 — zlib пишет заголовок и контрольную сумму gzip
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        if compressor is not None:
+            data = compressor.compress(data)
+        buffer.append(data)
+        size += len(data)
+        if size >= WRITE_BUFFER_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if compressor is not None:
+        buffer.append(compressor.flush())
+    if buffer:
+        yield b"".join(buffer)
@@ -0,0 +1,83 @@
+import uuid
+
+from django.db import IntegrityError, transaction
+
+from .models import Subscription, UserPage
+from .promocodes import invalidate_promocode, redeem_promocode
+
+
+class PromoCodeExhausted(Exception):
+    """Лимит использований промокода закончился до оплаты."""
+
+
+def parse_checkout_token(value):
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _load_user_page(user):
+    user_page = (
+        UserPage.objects.filter(user=user)
+        .prefetch_related("allergies", "menu_types")
+        .first()
+    )
+    if user_page is None:
+        user_page = UserPage.objects.create(user=user, username=user.username)
+    return user_page
+
+
+def _sync(manager, current_ids, objects):
+    # M2M меняется, только если выбор отличается от сохранённого
+    if {obj.pk for obj in objects} != set(current_ids):
+        manager.set(objects)
+
+
+def checkout(user, *, token, menu_types, allergies, price, promo=None, **options):
+    """
+    Оформляет подписку одной транзакцией: создаёт новую подписку, засчитывает
+    промокод, удаляет прежние подписки и обновляет профиль пользователя.
+    menu_types и allergies — уже загруженные объекты, options — поля подписки
+    (months, persons, breakfast, lunch, dinner, dessert).
+    Повторная отправка формы с тем же token возвращает уже созданную подписку.
+    Возвращает (subscription, created).
+    """
+    # профиль читается до транзакции: в SQLite первая операция транзакции
+    # должна быть записью, иначе параллельные оплаты упираются в блокировку
+    user_page = _load_user_page(user)
+    try:
+        with transaction.atomic():
+            subscription = Subscription.objects.create(
+                user=user_page,
+                price=price,
+                promocode=promo,
+                checkout_token=token,
+                **options,
+            )
+            if promo is not None and not redeem_promocode(promo):
+                raise PromoCodeExhausted(promo.code)
+            Subscription.objects.filter(user=user_page).exclude(pk=subscription.pk).delete()
+
+            Subscription.menu_types.through.objects.bulk_create([
+                Subscription.menu_types.through(subscription=subscription, menutype=menu_type)
+                for menu_type in menu_types
+            ])
+            _sync(user_page.allergies, user_page.get_allergy_ids(), allergies)
+            _sync(user_page.menu_types, user_page.get_menu_type_ids(), menu_types)
+            if not user_page.is_subscribed:
+                user_page.is_subscribed = True
+                user_page.save(update_fields=["is_subscribed"])
+    except PromoCodeExhausted:
+        # откат отменил и сброс кэша, запланированный redeem_promocode,
+        # а в кэше мог остаться объект, по которому код ещё доступен
+        invalidate_promocode()
+        raise
+    except IntegrityError:
+        if token is None:
+            raise
+        subscription = Subscription.objects.filter(checkout_token=token, user=user_page).first()
+        if subscription is None:
+            raise
+        return subscription, False
+    return subscription, True
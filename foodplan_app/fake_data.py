@@ -0,0 +1,426 @@
+"""
+Синтетические данные для замеров на объёмах продакшена: аллергены, типы
+меню, ингредиенты, рецепты, промокоды, пользователи с профилями
+и подписками, меню на неделю. Всё, что выбирается случайно, берётся из
+random.Random(seed), поэтому одно и то же зерно на пустой базе даёт
+те же данные (даты отсчитываются от дня запуска).
+Модели пишутся через bulk_create, таблицы связей — insert_rows; каждый
+пакет — отдельная транзакция. Сигналы не срабатывают, поэтому итоги
+рецептов, версия каталога и статистика SQLite обновляются в конце.
+Подпискам достаются только коды, действующие сегодня, в пределах
+max_uses; счётчики uses записываются после создания подписок.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .bulk import batches, insert_rows
+from .catalog import bump_catalog_version
+from .menus import generate_weekly_menus
+from .models import (
+    FoodTag,
+    Ingredient,
+    MenuType,
+    PromoCode,
+    Recipe,
+    RecipeIngredient,
+    Subscription,
+    User,
+    UserPage,
+    normalize_promocode,
+)
+from .pricing import MEALS, apply_discount, quote
+from .promocodes import CODE_ALPHABET, CODE_LENGTH
+from .rollups import recompute_recipe_allergens, recompute_recipe_rollups
+
+
+BATCH_SIZE = 5000
+FAKE_USER_PREFIX = "fake-"
+FAKE_PASSWORD = "Fake-pantry-4821"
+FAKE_PROMOCODE_PREFIX = "FAKE-"
+
+# количества при scale=1; scale=100 — миллион пользователей
+BASE_COUNTS = {
+    "ingredients": 200,
+    "recipes": 1000,
+    "promocodes": 2000,
+    "users": 10000,
+}
+
+MENU_TYPES = [
+    ("Классическое", "menus/menu_classical.png"),
+    ("Низкоуглеводное", "menus/menu_nizkougl.png"),
+    ("Вегетарианское", "menus/menu_veg.png"),
+    ("Кето", "menus/menu_keto.png"),
+]
+
+# название, аллерген, цена за 100 г, ккал на 100 г
+INGREDIENTS = [
+    ("Куриное филе", None, 45, 113),
+    ("Говядина", None, 90, 187),
+    ("Индейка", None, 65, 144),
+    ("Лосось", "Рыба", 150, 208),
+    ("Треска", "Рыба", 70, 82),
+    ("Креветки", "Морепродукты", 160, 95),
+    ("Мидии", "Морепродукты", 110, 77),
+    ("Яйцо куриное", "Яйца", 12, 157),
+    ("Молоко", "Молоко", 9, 60),
+    ("Сыр твёрдый", "Молоко", 80, 350),
+    ("Творог", "Молоко", 35, 121),
+    ("Сливочное масло", "Молоко", 75, 748),
+    ("Сметана", "Молоко", 25, 206),
+    ("Пшеничная мука", "Глютен", 6, 334),
+    ("Макароны", "Глютен", 12, 344),
+    ("Хлеб цельнозерновой", "Глютен", 15, 247),
+    ("Овсяные хлопья", "Глютен", 9, 352),
+    ("Грецкий орех", "Орехи", 120, 654),
+    ("Миндаль", "Орехи", 140, 576),
+    ("Арахис", "Арахис", 40, 552),
+    ("Соевый соус", "Соя", 20, 53),
+    ("Тофу", "Соя", 45, 76),
+    ("Мёд", "Мёд", 60, 304),
+    ("Апельсин", "Цитрусовые", 18, 47),
+    ("Лимон", "Цитрусовые", 20, 29),
+    ("Рис", None, 10, 344),
+    ("Гречка", None, 11, 313),
+    ("Нут", None, 15, 364),
+    ("Чечевица", None, 14, 352),
+    ("Картофель", None, 4, 77),
+    ("Морковь", None, 4, 35),
+    ("Лук репчатый", None, 3, 41),
+    ("Томаты", None, 25, 20),
+    ("Огурцы", None, 18, 15),
+    ("Кабачок", None, 9, 24),
+    ("Брокколи", None, 30, 34),
+    ("Шпинат", None, 50, 23),
+    ("Авокадо", None, 60, 160),
+    ("Яблоко", None, 12, 47),
+    ("Оливковое масло", None, 70, 898),
+]
+
+DISHES = {
+    "breakfast": ["Омлет", "Сырники", "Овсяная каша", "Гранола", "Блины", "Тост с авокадо"],
+    "lunch": ["Борщ", "Куриный суп", "Уха", "Плов", "Паста с морепродуктами", "Салат с халуми"],
+    "dinner": ["Запечённый лосось", "Рагу", "Котлеты", "Гречка с грибами", "Рыбные фрикадельки"],
+    "dessert": ["Шарлотка", "Рисовый пудинг", "Чизкейк", "Крем-брюле", "Фруктовый салат"],
+}
+
+FIRST_NAMES = [
+    "Анна", "Мария", "Елена", "Ольга", "Дарья", "Ирина", "Алексей", "Дмитрий",
+    "Сергей", "Иван", "Максим", "Никита", "Татьяна", "Павел", "Юлия", "Артём",
+]
+
+# значение: вес
+MEAL_TYPE_WEIGHTS = {"breakfast": 25, "lunch": 30, "dinner": 30, "dessert": 15}
+ALLERGY_COUNT_WEIGHTS = {0: 55, 1: 30, 2: 10, 3: 5}
+MENU_TYPE_COUNT_WEIGHTS = {1: 80, 2: 20}
+MONTHS_WEIGHTS = {1: 45, 3: 30, 6: 15, 12: 10}
+PERSONS_WEIGHTS = {1: 35, 2: 35, 3: 15, 4: 10, 5: 5}
+DISCOUNT_WEIGHTS = {5: 30, 10: 35, 15: 15, 20: 15, 30: 5}
+MAX_USES_WEIGHTS = {None: 60, 1: 30, 100: 10}
+# вероятность выбрать приём пищи в подписке
+MEAL_SHARES = {"breakfast": 0.7, "lunch": 0.6, "dinner": 0.7, "dessert": 0.3}
+
+SUBSCRIBER_SHARE = 0.4
+PREMIUM_SHARE = 0.2
+PROMOCODE_USE_SHARE = 0.1
+LIKES_SHARE = 0.25
+DISLIKES_SHARE = 0.1
+PREMIUM_RECIPE_SHARE = 0.15
+ON_INDEX_RECIPES = 12
+
+
+def weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+class FakeDataGenerator:
+    def __init__(self, scale=1.0, seed=0, batch_size=BATCH_SIZE):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.counts = {name: max(1, round(count * scale)) for name, count in BASE_COUNTS.items()}
+        self.today = timezone.localdate()
+        self.stats = {}
+
+    def run(self):
+        """Создаёт все данные и возвращает {раздел: строк} и время в секундах."""
+        started = perf_counter()
+        self.create_reference_data()
+        self.create_ingredients()
+        self.create_recipes()
+        self.create_promocodes()
+        self.create_users()
+        self.save_promocode_uses()
+        menus = generate_weekly_menus()
+        self.stats["дневные меню"] = menus["menus"]
+        self.analyze()
+        return self.stats, perf_counter() - started
+
+    def count(self, section, rows):
+        self.stats[section] = self.stats.get(section, 0) + rows
+
+    def create_reference_data(self):
+        names = sorted({allergen for _, allergen, _, _ in INGREDIENTS if allergen})
+        self.allergens = {name: FoodTag.objects.get_or_create(name=name)[0].pk for name in names}
+        self.menu_type_ids = [
+            MenuType.objects.get_or_create(title=title, defaults={"image": image})[0].pk
+            for title, image in MENU_TYPES
+        ]
+        self.count("аллергены", len(self.allergens))
+        self.count("типы меню", len(self.menu_type_ids))
+
+    def create_ingredients(self):
+        rng = self.rng
+        self.ingredient_ids = []
+        for numbers in batches(range(self.counts["ingredients"]), self.batch_size):
+            ingredients = []
+            allergen_ids = []
+            for number in numbers:
+                name, allergen, price, caloricity = INGREDIENTS[number % len(INGREDIENTS)]
+                # разные поставщики одного продукта — с разбросом цены
+                factor = Decimal(rng.randint(80, 120)) / 100
+                ingredients.append(Ingredient(
+                    name=f"{name} №{number // len(INGREDIENTS) + 1}",
+                    price=(price * factor).quantize(Decimal("0.01")),
+                    caloricity=caloricity,
+                ))
+                allergen_ids.append(self.allergens.get(allergen))
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(ingredients)
+                insert_rows(
+                    Ingredient.allergens.through,
+                    ("ingredient", "foodtag"),
+                    (
+                        (ingredient.pk, allergen_id)
+                        for ingredient, allergen_id in zip(ingredients, allergen_ids)
+                        if allergen_id
+                    ),
+                )
+            self.ingredient_ids.extend(ingredient.pk for ingredient in ingredients)
+            self.count("ингредиенты", len(ingredients))
+
+    def create_recipes(self):
+        rng = self.rng
+        images = sorted(default_storage.listdir("recipes")[1]) if default_storage.exists("recipes") else []
+        on_index = set(rng.sample(range(self.counts["recipes"]), min(ON_INDEX_RECIPES, self.counts["recipes"])))
+        self.recipe_ids = []
+        for numbers in batches(range(self.counts["recipes"]), self.batch_size):
+            recipes = []
+            compositions = []
+            menu_types = []
+            for number in numbers:
+                meal_type = weighted(rng, MEAL_TYPE_WEIGHTS)
+                dish = rng.choice(DISHES[meal_type])
+                recipes.append(Recipe(
+                    title=f"{dish} №{number + 1}",
+                    image=f"recipes/{rng.choice(images)}" if images else "",
+                    description=f"{dish}: домашний рецепт на каждый день.",
+                    meal_type=meal_type,
+                    premium=rng.random() < PREMIUM_RECIPE_SHARE,
+                    on_index=number in on_index,
+                ))
+                size = min(rng.randint(4, 10), len(self.ingredient_ids))
+                compositions.append([
+                    (ingredient_id, Decimal(rng.randrange(20, 400, 10)))
+                    for ingredient_id in rng.sample(self.ingredient_ids, size)
+                ])
+                menu_types.append(rng.sample(self.menu_type_ids, weighted(rng, MENU_TYPE_COUNT_WEIGHTS)))
+            with transaction.atomic():
+                Recipe.objects.bulk_create(recipes)
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id, mass=mass)
+                    for recipe, composition in zip(recipes, compositions)
+                    for ingredient_id, mass in composition
+                )
+                insert_rows(
+                    Recipe.menu_types.through,
+                    ("recipe", "menutype"),
+                    (
+                        (recipe.pk, menu_type_id)
+                        for recipe, menu_type_ids in zip(recipes, menu_types)
+                        for menu_type_id in menu_type_ids
+                    ),
+                )
+            self.recipe_ids.extend(recipe.pk for recipe in recipes)
+            self.count("рецепты", len(recipes))
+            self.count("ингредиенты рецептов", sum(len(composition) for composition in compositions))
+
+        recompute_recipe_rollups()
+        recompute_recipe_allergens()
+        bump_catalog_version()
+
+    def create_promocodes(self):
+        rng = self.rng
+        codes = set()
+        while len(codes) < self.counts["promocodes"]:
+            codes.add(FAKE_PROMOCODE_PREFIX + "".join(rng.choices(CODE_ALPHABET, k=CODE_LENGTH)))
+        # коды, которые можно применить сегодня: id -> [скидка, лимит, использований]
+        self.promocodes = {}
+        for batch in batches(sorted(codes), self.batch_size):
+            promocodes = []
+            for code in batch:
+                promo = PromoCode(
+                    code=code,
+                    lookup_key=normalize_promocode(code),
+                    discount_percent=weighted(rng, DISCOUNT_WEIGHTS),
+                    is_active=rng.random() < 0.8,
+                    max_uses=weighted(rng, MAX_USES_WEIGHTS),
+                )
+                # половина без срока, остальные — действующие, истёкшие и будущие
+                window = rng.random()
+                if window < 0.3:
+                    promo.valid_from = self.today - timedelta(days=rng.randint(0, 60))
+                    promo.valid_to = self.today + timedelta(days=rng.randint(1, 90))
+                elif window < 0.4:
+                    promo.valid_to = self.today - timedelta(days=rng.randint(1, 365))
+                elif window < 0.5:
+                    promo.valid_from = self.today + timedelta(days=rng.randint(1, 60))
+                promocodes.append(promo)
+            PromoCode.objects.bulk_create(promocodes)
+            self.promocodes.update(
+                (promo.pk, [promo.discount_percent, promo.max_uses, 0])
+                for promo in promocodes
+                if promo.is_active
+                and not (promo.valid_from and promo.valid_from > self.today)
+                and not (promo.valid_to and promo.valid_to < self.today)
+            )
+            self.count("промокоды", len(promocodes))
+        self.usable_promocodes = sorted(self.promocodes)
+
+    def use_promocode(self):
+        """
+        Случайный применимый код с учётом лимита: (id, скидка) или None.
+        Исчерпанный код больше не выдаётся.
+        """
+        if not self.usable_promocodes:
+            return None
+        position = self.rng.randrange(len(self.usable_promocodes))
+        pk = self.usable_promocodes[position]
+        usage = self.promocodes[pk]
+        usage[2] += 1
+        if usage[1] is not None and usage[2] >= usage[1]:
+            # на место выбывшего — последний, чтобы не сдвигать список
+            self.usable_promocodes[position] = self.usable_promocodes[-1]
+            self.usable_promocodes.pop()
+        return pk, usage[0]
+
+    def save_promocode_uses(self):
+        # одним UPDATE на каждое встречающееся число использований
+        by_uses = {}
+        for pk, (_, _, uses) in self.promocodes.items():
+            if uses:
+                by_uses.setdefault(uses, []).append(pk)
+        with transaction.atomic():
+            for uses, pks in by_uses.items():
+                for batch in batches(pks, self.batch_size):
+                    PromoCode.objects.filter(pk__in=batch).update(uses=uses)
+
+    def create_users(self):
+        password = make_password(FAKE_PASSWORD)
+        now = timezone.now()
+        for numbers in batches(range(self.counts["users"]), self.batch_size):
+            profiles = [self.fake_profile() for _ in numbers]
+            users = [
+                User(
+                    username=f"{FAKE_USER_PREFIX}{number}",
+                    email=f"{FAKE_USER_PREFIX}{number}@example.com",
+                    password=password,
+                    date_joined=now - timedelta(days=profile["age"]),
+                )
+                for number, profile in zip(numbers, profiles)
+            ]
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                pages = UserPage.objects.bulk_create(
+                    UserPage(
+                        user=user,
+                        username=profile["name"],
+                        is_subscribed=profile["premium"],
+                    )
+                    for user, profile in zip(users, profiles)
+                )
+                for relation, key in (
+                    (UserPage.allergies, "allergies"),
+                    (UserPage.menu_types, "menu_types"),
+                    (UserPage.liked_recipes, "liked"),
+                    (UserPage.disliked_recipes, "disliked"),
+                ):
+                    through = relation.through
+                    target = relation.rel.model._meta.model_name
+                    self.count(f"связи профилей: {key}", insert_rows(
+                        through,
+                        ("userpage", target),
+                        ((page.pk, pk) for page, profile in zip(pages, profiles) for pk in profile[key]),
+                    ))
+
+                subscribed = [(page, profile) for page, profile in zip(pages, profiles) if profile["subscription"]]
+                subscriptions = Subscription.objects.bulk_create(
+                    Subscription(user=page, **profile["subscription"]) for page, profile in subscribed
+                )
+                insert_rows(
+                    Subscription.menu_types.through,
+                    ("subscription", "menutype"),
+                    (
+                        (subscription.pk, menu_type_id)
+                        for subscription, (_, profile) in zip(subscriptions, subscribed)
+                        for menu_type_id in profile["menu_types"]
+                    ),
+                )
+            self.count("пользователи", len(users))
+            self.count("подписки", len(subscriptions))
+
+    def fake_profile(self):
+        rng = self.rng
+        profile = {
+            "name": rng.choice(FIRST_NAMES),
+            "age": rng.randint(0, 730),
+            "allergies": rng.sample(sorted(self.allergens.values()), weighted(rng, ALLERGY_COUNT_WEIGHTS)),
+            "menu_types": rng.sample(self.menu_type_ids, weighted(rng, MENU_TYPE_COUNT_WEIGHTS)),
+            "liked": rng.sample(self.recipe_ids, min(rng.randint(1, 5), len(self.recipe_ids)))
+            if rng.random() < LIKES_SHARE else [],
+            "disliked": [],
+            "premium": False,
+            "subscription": None,
+        }
+        if rng.random() < DISLIKES_SHARE:
+            candidates = [pk for pk in rng.sample(self.recipe_ids, min(8, len(self.recipe_ids)))
+                          if pk not in profile["liked"]]
+            profile["disliked"] = candidates[:rng.randint(1, 3)]
+        if rng.random() < SUBSCRIBER_SHARE:
+            profile["premium"] = rng.random() < PREMIUM_SHARE
+            profile["subscription"] = self.fake_subscription()
+        return profile
+
+    def fake_subscription(self):
+        rng = self.rng
+        meals = {meal: rng.random() < MEAL_SHARES[meal] for meal in MEALS}
+        if not any(meals.values()):
+            meals["lunch"] = True
+        months = weighted(rng, MONTHS_WEIGHTS)
+        persons = weighted(rng, PERSONS_WEIGHTS)
+        price = quote(months, persons, *meals.values())
+        promocode_id = None
+        if rng.random() < PROMOCODE_USE_SHARE:
+            promocode = self.use_promocode()
+            if promocode is not None:
+                promocode_id, discount = promocode
+                price = apply_discount(price, discount)
+        return {
+            "months": months,
+            "persons": persons,
+            "price": price,
+            "promocode_id": promocode_id,
+            **meals,
+        }
+
+    def analyze(self):
+        if connection.vendor == "sqlite":
+            # свежая статистика нужна планировщику и оценке числа строк в админке
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
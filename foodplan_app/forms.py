@@ -1,7 +1,6 @@
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth import get_user_model, authenticate
-from django.core.exceptions import ValidationError
 
 User = get_user_model()
 
@@ -20,12 +19,8 @@ class EmailAuthenticationForm(AuthenticationForm):
         password = self.cleaned_data.get('password')
 
         if email is not None and password:
-            # Ищем пользователя по email
-            try:
-                user_obj = User.objects.get(email=email)
-                self.user_cache = authenticate(self.request, username=user_obj.username, password=password)
-            except User.DoesNotExist:
-                self.user_cache = None
+            # пользователь ищется по email в EmailBackend
+            self.user_cache = authenticate(self.request, email=email, password=password)
 
             if self.user_cache is None:
                 raise self.get_invalid_login_error()
@@ -70,12 +65,11 @@ class CustomUserCreationForm(UserCreationForm):
     class Meta:
         model = User
         fields = ('username', 'email', 'password1', 'password2')
-
-    def clean_email(self):
-        email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
-            raise forms.ValidationError('Пользователь с таким email уже существует')
-        return email
+        # уникальность email проверяет validate_unique формы модели,
+        # отдельный запрос не нужен
+        error_messages = {
+            'email': {'unique': 'Пользователь с таким email уже существует'},
+        }
 
     def save(self, commit=True):
         user = super().save(commit=False)
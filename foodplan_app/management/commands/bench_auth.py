@@ -0,0 +1,143 @@
+import threading
+from statistics import median, quantiles
+from time import perf_counter
+
+from django.contrib.auth.hashers import check_password, get_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from foodplan_app.models import User
+
+
+BENCH_USER_PREFIX = "bench-auth-"
+BENCH_PASSWORD = "Lemon-harbor-7319"
+HASHING_SAMPLES = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет входы и регистрации в секунду через формы сайта "
+        "и отдельно стоимость хеширования пароля"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4, help="Одновременных клиентов")
+        parser.add_argument("--requests", type=int, default=20, help="Входов и регистраций на клиента")
+
+    def handle(self, *args, **options):
+        threads, requests = options["threads"], options["requests"]
+        self.cleanup()
+        try:
+            users = [
+                User(
+                    username=f"{BENCH_USER_PREFIX}{number}",
+                    email=f"{BENCH_USER_PREFIX}{number}@example.com",
+                    password=make_password(BENCH_PASSWORD),
+                )
+                for number in range(threads)
+            ]
+            User.objects.bulk_create(users)
+            hashing = self.measure_hashing()
+            queries = self.count_login_queries(users[0])
+
+            def register(client, thread, number):
+                name = f"{BENCH_USER_PREFIX}{thread}-{number}"
+                response = client.post(reverse("registration"), {
+                    "username": name,
+                    "email": f"{name}@example.com",
+                    "password1": BENCH_PASSWORD,
+                    "password2": BENCH_PASSWORD,
+                })
+                client.logout()
+                return response
+
+            def log_in(client, thread, number):
+                response = client.post(reverse("auth"), {
+                    "username": users[thread].email,
+                    "password": BENCH_PASSWORD,
+                })
+                client.logout()
+                return response
+
+            logins = self.run(log_in, threads, requests)
+            registrations = self.run(register, threads, requests)
+        finally:
+            self.cleanup()
+
+        hasher = get_hasher()
+        self.stdout.write(
+            f"Хеширование ({hasher.algorithm}, итераций: {getattr(hasher, 'iterations', '-')}): "
+            f"{hashing:.1f} мс на пароль, не больше {1000 / hashing:.1f} входов/с на ядро"
+        )
+        self.stdout.write(f"Запросов к базе на один вход: {queries}")
+        for title, (timings, seconds, errors) in (("Вход", logins), ("Регистрация", registrations)):
+            self.report(title, timings, seconds, errors, hashing, threads)
+
+    def cleanup(self):
+        User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+
+    def measure_hashing(self):
+        encoded = make_password(BENCH_PASSWORD)
+        started = perf_counter()
+        for _ in range(HASHING_SAMPLES):
+            check_password(BENCH_PASSWORD, encoded)
+        return (perf_counter() - started) * 1000 / HASHING_SAMPLES
+
+    def count_login_queries(self, user):
+        client = Client()
+        with CaptureQueriesContext(connection) as context:
+            response = client.post(reverse("auth"), {"username": user.email, "password": BENCH_PASSWORD})
+        if response.status_code != 302:
+            raise CommandError("Не удалось войти под тестовым пользователем")
+        return len(context.captured_queries)
+
+    def run(self, action, threads, requests):
+        timings = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(thread):
+            client = Client()
+            try:
+                for number in range(requests):
+                    started = perf_counter()
+                    try:
+                        response = action(client, thread, number)
+                    except Exception as error:
+                        with lock:
+                            errors.append(error)
+                        continue
+                    elapsed = perf_counter() - started
+                    with lock:
+                        if response.status_code == 302:
+                            timings.append(elapsed)
+                        else:
+                            errors.append(f"HTTP {response.status_code}")
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(thread,)) for thread in range(threads)]
+        started = perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return timings, perf_counter() - started, errors
+
+    def report(self, title, timings, seconds, errors, hashing, threads):
+        if len(timings) < 2:
+            raise CommandError(f"{title}: успешных запросов {len(timings)}, ошибок {len(errors)}")
+        timings = [timing * 1000 for timing in timings]
+        line = (
+            f"{title}: {len(timings) / seconds:.1f} в секунду, ошибок: {len(errors)}; "
+            f"задержка, мс: медиана {median(timings):.1f}, p95 {quantiles(timings, n=20)[-1]:.1f}"
+        )
+        # в несколько потоков задержка включает ожидание соседей, доля не показательна
+        if threads == 1:
+            line += f"; хеширование — {min(hashing / median(timings), 1) * 100:.0f}% времени запроса"
+        self.stdout.write(line)
+        for error in errors[:3]:
+            self.stderr.write(str(error))
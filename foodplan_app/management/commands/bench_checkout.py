@@ -0,0 +1,90 @@
+import threading
+import uuid
+from statistics import median, quantiles
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from foodplan_app.checkout import checkout
+from foodplan_app.models import FoodTag, MenuType, User
+
+
+BENCH_USER_PREFIX = "bench-checkout-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время оформления подписки при одновременных оплатах "
+        "от нескольких пользователей"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Одновременных покупателей")
+        parser.add_argument("--requests", type=int, default=50, help="Оплат на покупателя")
+
+    def handle(self, *args, **options):
+        menu_types = list(MenuType.objects.all()[:2])
+        if not menu_types:
+            raise CommandError("Нет ни одного типа меню")
+        allergies = list(FoodTag.objects.all()[:2])
+
+        users = [
+            User.objects.get_or_create(
+                username=f"{BENCH_USER_PREFIX}{number}",
+                defaults={"email": f"{BENCH_USER_PREFIX}{number}@example.com"},
+            )[0]
+            for number in range(options["threads"])
+        ]
+        timings = []
+        errors = []
+        lock = threading.Lock()
+
+        def buyer(user):
+            try:
+                for number in range(options["requests"]):
+                    started = perf_counter()
+                    try:
+                        checkout(
+                            user,
+                            token=uuid.uuid4(),
+                            # чередуем выбор, чтобы профиль действительно менялся
+                            menu_types=menu_types[number % len(menu_types):],
+                            allergies=allergies[number % 2:],
+                            price=1000,
+                            months=1,
+                            persons=1,
+                            breakfast=True,
+                        )
+                    except OperationalError as error:
+                        with lock:
+                            errors.append(error)
+                        continue
+                    with lock:
+                        timings.append(perf_counter() - started)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer, args=(user,)) for user in users]
+        started = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = perf_counter() - started
+
+        User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+
+        if len(timings) < 2:
+            raise CommandError(f"Успешных оплат: {len(timings)}, ошибок: {len(errors)}")
+        timings = [timing * 1000 for timing in timings]
+        self.stdout.write(
+            f"Покупателей: {len(users)}, оплат: {len(timings)}, ошибок: {len(errors)}"
+        )
+        self.stdout.write(
+            f"Задержка, мс: медиана {median(timings):.1f}, "
+            f"p95 {quantiles(timings, n=20)[-1]:.1f}, максимум {max(timings):.1f}"
+        )
+        self.stdout.write(f"Пропускная способность: {len(timings) / seconds:.0f} оплат/с")
+        for error in errors[:3]:
+            self.stderr.write(str(error))
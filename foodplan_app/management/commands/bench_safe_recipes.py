@@ -0,0 +1,70 @@
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from foodplan_app.models import FoodTag, MenuType, Recipe
+
+
+def chained_excludes(allergy_ids, menu_type_ids):
+    # прежняя реализация UserPage.get_safe_recipes — для сравнения
+    recipes = Recipe.objects.all()
+    if menu_type_ids:
+        recipes = recipes.filter(menu_types__in=menu_type_ids).distinct()
+    for allergy_id in allergy_ids:
+        recipes = recipes.exclude(ingredients__ingredient__allergens=allergy_id)
+    return recipes.distinct()
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время подбора безопасных рецептов при росте числа аллергий "
+        "от 0 до всех FoodTag"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20, help="Повторов на точку")
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Также замерить прежнюю цепочку exclude()",
+        )
+
+    def measure(self, build_queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = perf_counter()
+            list(build_queryset().values_list("id", flat=True))
+            timings.append(perf_counter() - started)
+        return median(timings) * 1000
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        allergy_ids = list(FoodTag.objects.order_by("id").values_list("id", flat=True))
+        menu_type_ids = list(MenuType.objects.order_by("id").values_list("id", flat=True))
+        self.stdout.write(
+            f"Рецептов: {Recipe.objects.count()}, аллергенов: {len(allergy_ids)}, "
+            f"типов меню: {len(menu_type_ids)}"
+        )
+
+        header = f"{'аллергий':>9} {'safe_for, мс':>14}"
+        if options["compare"]:
+            header += f" {'exclude(), мс':>14}"
+        self.stdout.write(header)
+
+        for count in range(len(allergy_ids) + 1):
+            selected = allergy_ids[:count]
+            line = "{:>9} {:>14.2f}".format(
+                count,
+                self.measure(
+                    lambda: Recipe.objects.safe_for(
+                        allergy_ids=selected, menu_type_ids=menu_type_ids
+                    ),
+                    repeat,
+                ),
+            )
+            if options["compare"]:
+                line += " {:>14.2f}".format(
+                    self.measure(lambda: chained_excludes(selected, menu_type_ids), repeat)
+                )
+            self.stdout.write(line)
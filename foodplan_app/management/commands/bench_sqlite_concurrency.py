@@ -0,0 +1,142 @@
+import threading
+import uuid
+from statistics import quantiles
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from foodplan_app.checkout import checkout
+from foodplan_app.models import FoodTag, MenuType, Recipe, User, UserPage
+
+
+BENCH_USER_PREFIX = "bench-sqlite-"
+# поля карточек рецептов, как в subscription_recipes_view
+READ_FIELDS = ("id", "title", "image", "image_hash", "meal_type", "calories", "price")
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает ошибки «database is locked» при одновременных оплатах, правках "
+        "профиля и чтении страниц: стандартный SQLite против настроек из settings "
+        "(WAL, busy_timeout, BEGIN IMMEDIATE). Переключает режим журнала базы, "
+        "поэтому запускать без работающего сервера."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8, help="Потоков с записью")
+        parser.add_argument("--readers", type=int, default=8, help="Потоков только с чтением")
+        parser.add_argument("--requests", type=int, default=30, help="Операций на поток")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Замер имеет смысл только для SQLite")
+        if connection.is_in_memory_db():
+            raise CommandError("Нужна база в файле")
+        self.menu_types = list(MenuType.objects.all()[:2])
+        if not self.menu_types:
+            raise CommandError("Нет ни одного типа меню")
+        self.allergies = list(FoodTag.objects.all()[:2])
+        users = [
+            User.objects.get_or_create(
+                username=f"{BENCH_USER_PREFIX}{number}",
+                defaults={"email": f"{BENCH_USER_PREFIX}{number}@example.com"},
+            )[0]
+            for number in range(max(options["writers"], options["readers"]))
+        ]
+
+        configured = connection.settings_dict["OPTIONS"]
+        results = []
+        try:
+            for title, database_options in (
+                ("Стандартный SQLite", {}),
+                ("Настройки проекта", configured),
+            ):
+                self.configure(database_options)
+                results.append((title, self.run(users, **options)))
+        finally:
+            self.configure(configured)
+            User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+
+        for title, (stats, seconds) in results:
+            self.stdout.write(f"{title}:")
+            for operation, (timings, errors) in stats.items():
+                p95 = quantiles(timings, n=20)[-1] * 1000 if len(timings) > 1 else 0
+                self.stdout.write(
+                    f"  {operation}: {len(timings) / seconds:.0f} в секунду, "
+                    f"ошибок блокировки: {errors}, p95 {p95:.1f} мс"
+                )
+
+    def configure(self, database_options):
+        # соединения потоков создаются заново и читают OPTIONS при подключении
+        connection.close()
+        connection.settings_dict["OPTIONS"] = database_options
+        if not database_options:
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode = DELETE")
+        connection.close()
+
+    def run(self, users, writers, readers, requests, **options):
+        stats = {name: ([], 0) for name in ("оплата", "правка профиля", "чтение")}
+        lock = threading.Lock()
+
+        def measure(name, action):
+            started = perf_counter()
+            try:
+                action()
+            except OperationalError:
+                with lock:
+                    timings, errors = stats[name]
+                    stats[name] = (timings, errors + 1)
+                return
+            with lock:
+                stats[name][0].append(perf_counter() - started)
+
+        def writer(user):
+            def pay():
+                checkout(
+                    user,
+                    token=uuid.uuid4(),
+                    menu_types=self.menu_types,
+                    allergies=self.allergies,
+                    price=1000,
+                    months=1,
+                    persons=1,
+                )
+
+            def edit_profile():
+                # чтение и запись в одной транзакции, как при сохранении формы
+                with transaction.atomic():
+                    user_page = UserPage.objects.filter(user=user).first()
+                    if user_page is not None:
+                        user_page.username = f"{user.username}-{uuid.uuid4().hex[:6]}"
+                        user_page.save(update_fields=["username"])
+
+            try:
+                for number in range(requests):
+                    if number % 2:
+                        measure("правка профиля", edit_profile)
+                    else:
+                        measure("оплата", pay)
+            finally:
+                connection.close()
+
+        def reader(user):
+            def read_page():
+                UserPage.objects.filter(user=user).first()
+                list(Recipe.objects.only(*READ_FIELDS)[:60])
+
+            try:
+                for _ in range(requests):
+                    measure("чтение", read_page)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(users[n],)) for n in range(writers)]
+        threads += [threading.Thread(target=reader, args=(users[n],)) for n in range(readers)]
+        started = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats, perf_counter() - started
@@ -0,0 +1,97 @@
+import posixpath
+
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from foodplan_app.catalog import bump_catalog_version
+from foodplan_app.models import MenuType, Recipe, UserPage
+from foodplan_app.storage import ContentAddressedStorage, is_content_addressed
+
+
+IMAGE_MODELS = (Recipe, MenuType, UserPage)
+
+
+class Command(BaseCommand):
+    help = (
+        "Переименовывает загруженные изображения по хешу содержимого и удаляет "
+        "файлы-дубликаты, на которые больше не ссылается ни одна запись"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать, ничего не меняя",
+        )
+
+    def handle(self, *args, **options):
+        storage = storages["default"]
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError("Хранилище по умолчанию не ContentAddressedStorage")
+        dry_run = options["dry_run"]
+
+        # старое имя -> имя из хеша; файлы копируются до изменения записей
+        renamed = {}
+        referenced = set()
+        missing = 0
+        names = {
+            model: set(
+                model.objects.exclude(image="").exclude(image__isnull=True)
+                .values_list("image", flat=True).distinct()
+            )
+            for model in IMAGE_MODELS
+        }
+        for model_names in names.values():
+            for name in model_names:
+                if is_content_addressed(name) or name in renamed:
+                    continue
+                try:
+                    with storage.open(name, "rb") as source:
+                        renamed[name] = (
+                            storage.content_name(name, source) if dry_run
+                            else storage.save(name, source)
+                        )
+                except OSError:
+                    missing += 1
+        for model_names in names.values():
+            referenced.update(renamed.get(name, name) for name in model_names)
+
+        if not dry_run:
+            with transaction.atomic():
+                for model, model_names in names.items():
+                    for name in model_names & renamed.keys():
+                        model.objects.filter(image=name).update(image=renamed[name])
+            # закэшированные карточки ссылаются на файлы, которые сейчас будут удалены
+            if renamed:
+                bump_catalog_version()
+
+        # лишние файлы: прежние имена и повторные загрузки того же содержимого
+        directories = {model._meta.get_field("image").upload_to.rstrip("/") for model in IMAGE_MODELS}
+        deleted, freed, unreferenced = 0, 0, 0
+        for directory in sorted(directories):
+            if not storage.exists(directory):
+                continue
+            for filename in storage.listdir(directory)[1]:
+                name = posixpath.join(directory, filename)
+                if name in referenced:
+                    continue
+                with storage.open(name, "rb") as source:
+                    duplicate = storage.content_name(name, source) in referenced
+                if not duplicate:
+                    unreferenced += 1
+                    continue
+                deleted += 1
+                freed += storage.size(name)
+                if not dry_run:
+                    storage.delete(name)
+
+        prefix = "Будет переименовано" if dry_run else "Переименовано"
+        self.stdout.write(
+            f"{prefix} файлов: {len(renamed)}, удалено дубликатов: {deleted} "
+            f"({freed / 1024:.0f} КБ)"
+        )
+        self.stdout.write(
+            f"Файлов без ссылок из базы (оставлены): {unreferenced}, "
+            f"отсутствующих файлов: {missing}"
+        )
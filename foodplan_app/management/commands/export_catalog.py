@@ -0,0 +1,58 @@
+import sys
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from foodplan_app.catalog_io import EXPORT_CHUNK_SIZE, catalog_format, iter_catalog_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает каталог (аллергены, типы меню, ингредиенты, рецепты) в JSON "
+        "или NDJSON в формате import_catalog"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл .json, .ndjson или с суффиксом .gz; '-' — stdout")
+        parser.add_argument(
+            "--format",
+            choices=["json", "ndjson"],
+            help="Формат файла; по умолчанию определяется по расширению",
+        )
+        parser.add_argument("--gzip", action="store_true", help="Сжать gzip")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help="Строк, читаемых из базы за один запрос",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        compress = options["gzip"] or path.endswith(".gz")
+        chunks = iter_catalog_export(
+            options["format"] or catalog_format(path),
+            compress=compress,
+            chunk_size=options["chunk_size"],
+        )
+
+        started = perf_counter()
+        written = 0
+        if path == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+                written += len(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(path, "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+                    written += len(chunk)
+        seconds = perf_counter() - started
+
+        # при выводе в stdout отчёт не должен попасть в данные
+        report = self.stderr if path == "-" else self.stdout
+        report.write(
+            f"Записано {written / 1024 / 1024:.1f} МБ за {seconds:.2f} с "
+            f"({written / 1024 / 1024 / seconds if seconds else 0:.1f} МБ/с)"
+        )
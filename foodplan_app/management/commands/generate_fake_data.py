@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foodplan_app.catalog_io import bulk_load_pragmas
+from foodplan_app.fake_data import (
+    BASE_COUNTS,
+    BATCH_SIZE,
+    FAKE_PASSWORD,
+    FAKE_USER_PREFIX,
+    FakeDataGenerator,
+)
+from foodplan_app.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими данными для замеров: каталог, промокоды, "
+        "пользователи с подписками и меню на неделю. С одним и тем же --seed "
+        "на пустой базе данные повторяются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1.0,
+            help="Множитель объёма; при 1 — "
+            + ", ".join(f"{name}: {count}" for name, count in BASE_COUNTS.items()),
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Зерно генератора случайных чисел")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Записей в одном пакете и одной транзакции",
+        )
+        parser.add_argument(
+            "--no-pragmas",
+            action="store_true",
+            help="Не отключать синхронную запись SQLite на время загрузки",
+        )
+
+    def handle(self, *args, **options):
+        if options["scale"] <= 0:
+            raise CommandError("--scale должен быть больше нуля")
+        if User.objects.filter(username__startswith=FAKE_USER_PREFIX).exists():
+            raise CommandError(
+                f"В базе уже есть пользователи {FAKE_USER_PREFIX}*: "
+                "синтетические данные загружаются в пустую базу"
+            )
+        generator = FakeDataGenerator(options["scale"], options["seed"], options["batch_size"])
+        with bulk_load_pragmas(not options["no_pragmas"]):
+            stats, seconds = generator.run()
+
+        for section, rows in stats.items():
+            self.stdout.write(f"{section}: {rows}")
+        total = sum(stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Строк: {total} за {seconds:.1f} с, {total / seconds:.0f} строк/с"
+        ))
+        self.stdout.write(f"Пароль пользователей {FAKE_USER_PREFIX}*: {FAKE_PASSWORD}")
@@ -0,0 +1,50 @@
+from datetime import date
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodplan_app.promocodes import CODE_LENGTH, GENERATE_BATCH_SIZE, generate_promocodes
+
+
+class Command(BaseCommand):
+    help = "Создаёт партию уникальных случайных промокодов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("count", type=int, help="Сколько промокодов создать")
+        parser.add_argument("--discount", type=int, required=True, help="Скидка, %%")
+        parser.add_argument("--prefix", default="", help="Общее начало кодов")
+        parser.add_argument("--length", type=int, default=CODE_LENGTH, help="Длина случайной части")
+        parser.add_argument("--valid-from", type=date.fromisoformat, help="Действует с (ГГГГ-ММ-ДД)")
+        parser.add_argument("--valid-to", type=date.fromisoformat, help="Действует до (ГГГГ-ММ-ДД)")
+        parser.add_argument("--max-uses", type=int, help="Лимит использований каждого кода")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=GENERATE_BATCH_SIZE,
+            help="Размер пакета вставки",
+        )
+        parser.add_argument("--output", help="Файл, в который записать созданные коды")
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        try:
+            codes = generate_promocodes(
+                options["count"],
+                options["discount"],
+                prefix=options["prefix"],
+                length=options["length"],
+                valid_from=options["valid_from"],
+                valid_to=options["valid_to"],
+                max_uses=options["max_uses"],
+                batch_size=options["batch_size"],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        seconds = perf_counter() - started
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                output.writelines(f"{code}\n" for code in sorted(codes))
+
+        self.stdout.write(self.style.SUCCESS(f"Создано промокодов: {len(codes)}"))
+        self.stdout.write(f"Время: {seconds:.2f} с, {len(codes) / seconds:.0f} кодов/с")
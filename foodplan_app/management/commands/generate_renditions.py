@@ -0,0 +1,124 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from foodplan_app.catalog import bump_catalog_version
+from foodplan_app.models import MenuType, Recipe, UserPage
+from foodplan_app.renditions import (
+    has_renditions,
+    RENDER_ERRORS,
+    image_digest,
+    render_renditions,
+    save_renditions,
+)
+
+
+IMAGE_MODELS = {"recipes": Recipe, "menu_types": MenuType, "avatars": UserPage}
+UPDATE_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит уменьшенные копии изображений рецептов, типов меню и аватаров "
+        "(JPEG и WebP) в нескольких процессах"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Процессов для обработки изображений",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Проверить и записи с уже посчитанным хешем; иначе только новые",
+        )
+        parser.add_argument(
+            "--only",
+            choices=list(IMAGE_MODELS),
+            action="append",
+            help="Обработать только эти изображения; можно указать несколько раз",
+        )
+
+    def handle(self, *args, **options):
+        self.stats = {"images": 0, "rendered": 0, "errors": 0, "source": 0, "card": 0}
+        started = perf_counter()
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            for name in options["only"] or IMAGE_MODELS:
+                self.process(pool, IMAGE_MODELS[name], options["all"], options["workers"] * 2)
+        seconds = perf_counter() - started
+
+        stats = self.stats
+        self.stdout.write(
+            f"Изображений: {stats['images']}, построено копий: {stats['rendered']}, "
+            f"ошибок: {stats['errors']}, {seconds:.2f} с"
+        )
+        if stats["card"]:
+            self.stdout.write(
+                f"Исходные файлы: {stats['source'] / 1024:.0f} КБ, "
+                f"карточки WebP: {stats['card'] / 1024:.0f} КБ"
+            )
+
+    def process(self, pool, model, process_all, max_pending):
+        rows = model.objects.exclude(image="").exclude(image__isnull=True)
+        if not process_all:
+            rows = rows.filter(image_hash="")
+        field = model._meta.get_field("image")
+
+        digests = {}
+        failed = set()
+        rendering = {}
+        pending = set()
+
+        def collect(done):
+            for future in done:
+                digest, size, name = rendering.pop(future)
+                try:
+                    renditions = future.result()
+                except RENDER_ERRORS as error:
+                    failed.add(digest)
+                    self.stats["errors"] += 1
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                save_renditions(digest, renditions)
+                self.stats["rendered"] += len(renditions)
+                self.stats["source"] += size
+                self.stats["card"] += len(renditions["card", "webp"])
+
+        for pk, name, current in rows.values_list("pk", "image", "image_hash").iterator():
+            try:
+                with field.storage.open(name, "rb") as source:
+                    data = source.read()
+            except OSError as error:
+                self.stats["errors"] += 1
+                self.stderr.write(f"{name}: {error}")
+                continue
+            self.stats["images"] += 1
+            digest = image_digest(data)
+            if digest != current:
+                digests[pk] = digest
+            # одинаковые файлы обрабатываются один раз
+            if digest in {queued for queued, _, _ in rendering.values()} or has_renditions(digest):
+                continue
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = pool.submit(render_renditions, data)
+            rendering[future] = digest, len(data), name
+            pending.add(future)
+        collect(wait(pending).done)
+
+        # хеш сохраняется, только когда копии уже лежат в хранилище
+        updated = [
+            model(pk=pk, image_hash=digest)
+            for pk, digest in digests.items()
+            if digest not in failed
+        ]
+        model.objects.bulk_update(updated, ["image_hash"], batch_size=UPDATE_BATCH_SIZE)
+        # карточки рецептов в кэше ссылаются на прежние изображения
+        if updated and model is not UserPage:
+            bump_catalog_version()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from foodplan_app.menus import BATCH_SIZE, generate_weekly_menus
+
+
+class Command(BaseCommand):
+    help = "Составляет меню на неделю для всех подписчиков"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Размер пакета для bulk_create",
+        )
+
+    def handle(self, *args, **options):
+        stats = generate_weekly_menus(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Подписчиков: {stats['subscribers']}, профилей: {stats['profiles']}, "
+            f"дневных меню: {stats['menus']}"
+        ))
+        self.stdout.write(
+            f"Время: {stats['seconds']:.2f} с, "
+            f"{stats['subscribers_per_second']:.0f} подписчиков/с"
+        )
@@ -0,0 +1,68 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodplan_app.catalog_io import (
+    BATCH_SIZE,
+    READ_CHUNK_SIZE,
+    CatalogFormatError,
+    CatalogImporter,
+    bulk_load_pragmas,
+    open_catalog,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает каталог (аллергены, типы меню, ингредиенты, рецепты) из JSON "
+        "или NDJSON, обновляя существующие записи по названию"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл .json или .ndjson, можно сжатый .gz")
+        parser.add_argument(
+            "--format",
+            choices=["json", "ndjson"],
+            help="Формат файла; по умолчанию определяется по расширению",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Записей в одном пакете и одной транзакции",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=READ_CHUNK_SIZE,
+            help="Размер блока чтения файла, символов",
+        )
+        parser.add_argument(
+            "--no-pragmas",
+            action="store_true",
+            help="Не отключать синхронную запись SQLite на время загрузки",
+        )
+
+    def handle(self, *args, **options):
+        importer = CatalogImporter(batch_size=options["batch_size"])
+        started = perf_counter()
+        try:
+            with bulk_load_pragmas(not options["no_pragmas"]):
+                with open_catalog(options["path"], options["format"], options["chunk_size"]) as records:
+                    importer.run(records)
+        except FileNotFoundError:
+            raise CommandError(f"Файл {options['path']} не найден")
+        except (CatalogFormatError, ValueError) as error:
+            raise CommandError(f"Ошибка в файле каталога: {error}")
+        loaded = perf_counter() - started
+        importer.finish()
+        seconds = perf_counter() - started
+
+        for section, stats in importer.stats.items():
+            counts = ", ".join(f"{name}: {count}" for name, count in sorted(stats.items()))
+            self.stdout.write(f"{section}: {counts}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Записей: {importer.records}, загрузка {loaded:.2f} с, "
+            f"всего с пересчётом рецептов {seconds:.2f} с, "
+            f"{importer.records / loaded if loaded else 0:.0f} записей/с"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from foodplan_app.catalog import bump_catalog_version
+from foodplan_app.rollups import recompute_recipe_allergens, recompute_recipe_rollups
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает стоимость, массу, калорийность и аллергены всех рецептов"
+
+    def handle(self, *args, **options):
+        updated = recompute_recipe_rollups()
+        pairs = recompute_recipe_allergens()
+        # снимки каталога и карточки в работающих процессах построены по прежним итогам
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитано рецептов: {updated}, связей с аллергенами: {pairs}"
+        ))
@@ -0,0 +1,236 @@
+from collections import defaultdict
+from itertools import islice
+from time import perf_counter
+
+from django.db import transaction
+
+from .bulk import batches, insert_rows
+from .catalog import get_catalog_index
+from .models import DailyMenu, Recipe, Subscription, UserPage
+
+
+MEALS = ("breakfast", "lunch", "dinner", "dessert")
+DAYS = [day for day, _ in DailyMenu.DAYS_OF_WEEK]
+BATCH_SIZE = 2000
+
+
+def _pks(objects):
+    if hasattr(objects, "values_list"):
+        return list(objects.values_list("pk", flat=True))
+    return [obj.pk for obj in objects]
+
+
+def _ids_by_user(through, user_ids, column):
+    ids = defaultdict(set)
+    rows = through.objects.filter(userpage_id__in=user_ids).values_list("userpage_id", column)
+    for user_id, value in rows:
+        ids[user_id].add(value)
+    return ids
+
+
+def resolve_safe_menus(daily_menus, user_pages):
+    """
+    Безопасные меню для всех пар (пользователь, дневное меню) за фиксированное
+    число запросов, независимо от количества пар.
+    Возвращает {(user_page.pk, daily_menu.pk): {"breakfast": Recipe | None, ...}}.
+    Блюдо с аллергеном пользователя заменяется первым безопасным рецептом того же
+    приёма пищи из его типов меню, как раньше в DailyMenu.get_safe_menu_for_user.
+    """
+    menus = list(DailyMenu.objects.filter(pk__in=_pks(daily_menus)).select_related(*MEALS))
+    user_ids = _pks(user_pages)
+    allergies = _ids_by_user(UserPage.allergies.through, user_ids, "foodtag_id")
+    menu_types = _ids_by_user(UserPage.menu_types.through, user_ids, "menutype_id")
+
+    catalog = get_catalog_index()
+    unsafe_by_allergies = {}
+    replacement_ids = {}
+    pending = []
+
+    plans = {}
+    for user_id in user_ids:
+        allergy_ids = frozenset(allergies[user_id])
+        menu_type_ids = frozenset(menu_types[user_id])
+        if allergy_ids not in unsafe_by_allergies:
+            unsafe_by_allergies[allergy_ids] = catalog.unsafe_ids(allergy_ids)
+        unsafe_ids = unsafe_by_allergies[allergy_ids]
+
+        for menu in menus:
+            plan = plans[(user_id, menu.pk)] = {}
+            for meal in MEALS:
+                recipe = getattr(menu, meal)
+                plan[meal] = recipe
+                if recipe is None or recipe.pk not in unsafe_ids:
+                    continue
+                key = (menu_type_ids, allergy_ids, recipe.meal_type)
+                if key not in replacement_ids:
+                    candidates = []
+                    if menu_type_ids:
+                        candidates = catalog.recipe_ids(
+                            menu_type_ids, [recipe.meal_type], allergy_ids
+                        )
+                    replacement_ids[key] = candidates[0] if candidates else None
+                pending.append((plan, meal, replacement_ids[key]))
+
+    replacements = Recipe.objects.in_bulk(
+        {pk for pk in replacement_ids.values() if pk is not None}
+    )
+    for plan, meal, replacement_id in pending:
+        plan[meal] = replacements.get(replacement_id)
+    return plans
+
+
+def rotate(candidates, offset):
+    """Кандидаты со сдвигом offset, чтобы разные профили не получали одинаковое меню."""
+    if not candidates:
+        return []
+    shift = offset % len(candidates)
+    return candidates[shift:] + candidates[:shift]
+
+
+def plan_week(ordered, candidate_ids, liked=frozenset(), disliked=frozenset()):
+    """
+    Рецепты на 7 дней: сначала понравившиеся из candidate_ids, затем первые
+    подходящие из ordered (кандидаты профиля после rotate) без дизлайков.
+    Просматривается только начало списка, поэтому пересчёт под пользователя
+    дешёвый. Повторы — только если кандидатов меньше семи.
+    """
+    preferred = sorted(pk for pk in liked if pk in candidate_ids and pk not in disliked)
+    others = islice(
+        (pk for pk in ordered if pk not in liked and pk not in disliked),
+        max(len(DAYS) - len(preferred), 0),
+    )
+    week = preferred + list(others)
+    if not week:
+        return (None,) * len(DAYS)
+    return tuple(week[day % len(week)] for day in range(len(DAYS)))
+
+
+def _load_profiles(subscriptions):
+    """
+    Группирует подписчиков по настройкам, от которых зависит подбор:
+    {(приёмы пищи, типы меню, аллергии): [user_page_id, ...]}.
+    Лайки и дизлайки возвращаются отдельно — {user_page_id: {recipe_id}} —
+    и учитываются уже внутри профиля. Подписки без приёмов пищи пропускаются.
+    """
+    rows = subscriptions.order_by("user_id", "pk").values_list("pk", "user_id", *MEALS)
+    user_ids = subscriptions.values("user_id")
+    subscription_menu_types = defaultdict(set)
+    for subscription_id, menu_type_id in Subscription.menu_types.through.objects.filter(
+        subscription__in=subscriptions
+    ).values_list("subscription_id", "menutype_id"):
+        subscription_menu_types[subscription_id].add(menu_type_id)
+    allergies = _ids_by_user(UserPage.allergies.through, user_ids, "foodtag_id")
+    menu_types = _ids_by_user(UserPage.menu_types.through, user_ids, "menutype_id")
+    liked = _ids_by_user(UserPage.liked_recipes.through, user_ids, "recipe_id")
+    disliked = _ids_by_user(UserPage.disliked_recipes.through, user_ids, "recipe_id")
+
+    profiles = defaultdict(list)
+    seen = set()
+    for subscription_id, user_id, *meal_flags in rows.iterator(chunk_size=BATCH_SIZE):
+        # у пользователя учитывается одна (первая) подписка
+        if user_id in seen:
+            continue
+        seen.add(user_id)
+        meals = tuple(meal for meal, selected in zip(MEALS, meal_flags) if selected)
+        if not meals:
+            continue
+        key = (
+            meals,
+            frozenset(subscription_menu_types[subscription_id] or menu_types[user_id]),
+            frozenset(allergies[user_id]),
+        )
+        profiles[key].append(user_id)
+    return profiles, liked, disliked
+
+
+def generate_weekly_menus(subscriptions=None, batch_size=BATCH_SIZE):
+    """
+    Составляет меню на неделю для каждого подписчика и заменяет его прежние
+    DailyMenu. Кандидаты подбираются один раз на профиль (приёмы пищи, типы
+    меню, аллергии); лайки и дизлайки только переставляют начало списка.
+    Подписчики с одинаковой неделей получают общие DailyMenu (через M2M
+    users), запись — пакетными INSERT.
+    Возвращает статистику прогона.
+    """
+    started = perf_counter()
+    if subscriptions is None:
+        subscriptions = Subscription.objects.all()
+    profiles, liked, disliked = _load_profiles(subscriptions)
+    catalog = get_catalog_index()
+    # кандидаты одного приёма пищи общие для профилей с теми же типами меню и аллергиями
+    candidates = {}
+
+    menus = []
+    menu_users = []
+    menu_menu_types = []
+    for (meals, menu_type_ids, allergy_ids), user_ids in profiles.items():
+        ordered = {}
+        for meal in meals:
+            key = (meal, menu_type_ids, allergy_ids)
+            if key not in candidates:
+                ids = catalog.recipe_ids(menu_type_ids, [meal], allergy_ids)
+                candidates[key] = (ids, frozenset(ids))
+            ids, candidate_ids = candidates[key]
+            ordered[meal] = (rotate(ids, offset=user_ids[0]), candidate_ids)
+
+        base_week = tuple(plan_week(*ordered[meal]) for meal in meals)
+        weeks = defaultdict(list)
+        for user_id in user_ids:
+            if user_id in liked or user_id in disliked:
+                week = tuple(
+                    plan_week(*ordered[meal], liked[user_id], disliked[user_id])
+                    for meal in meals
+                )
+            else:
+                week = base_week
+            weeks[week].append(user_id)
+
+        for week, week_user_ids in weeks.items():
+            for day_number, day in enumerate(DAYS):
+                menus.append(DailyMenu(
+                    date=day,
+                    **{f"{meal}_id": plan[day_number] for meal, plan in zip(meals, week)},
+                ))
+                menu_users.append(week_user_ids)
+                menu_menu_types.append(menu_type_ids)
+
+    users_through = DailyMenu.users.through
+    menu_types_through = DailyMenu.menu_types.through
+    with transaction.atomic():
+        regenerated = users_through.objects.filter(userpage_id__in=subscriptions.values("user_id"))
+        old_menu_ids = list(regenerated.values_list("dailymenu_id", flat=True).distinct())
+        regenerated.delete()
+        for batch in batches(old_menu_ids, batch_size):
+            DailyMenu.objects.filter(pk__in=batch, users__isnull=True).delete()
+
+        DailyMenu.objects.bulk_create(menus, batch_size=batch_size)
+        insert_rows(
+            users_through,
+            ("dailymenu", "userpage"),
+            (
+                (menu.pk, user_id)
+                for menu, user_ids in zip(menus, menu_users)
+                for user_id in user_ids
+            ),
+            batch_size,
+        )
+        insert_rows(
+            menu_types_through,
+            ("dailymenu", "menutype"),
+            (
+                (menu.pk, menu_type_id)
+                for menu, menu_type_ids in zip(menus, menu_menu_types)
+                for menu_type_id in menu_type_ids
+            ),
+            batch_size,
+        )
+
+    elapsed = perf_counter() - started
+    subscribers = sum(len(user_ids) for user_ids in profiles.values())
+    return {
+        "subscribers": subscribers,
+        "profiles": len(profiles),
+        "menus": len(menus),
+        "seconds": elapsed,
+        "subscribers_per_second": subscribers / elapsed if elapsed else 0,
+    }
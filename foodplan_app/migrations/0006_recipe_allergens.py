@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 03:34
+
+from django.db import migrations, models
+
+
+def fill_recipe_allergens(apps, schema_editor):
+    RecipeIngredient = apps.get_model('foodplan_app', 'RecipeIngredient')
+    Recipe = apps.get_model('foodplan_app', 'Recipe')
+    through = Recipe.allergens.through
+    pairs = (
+        RecipeIngredient.objects.filter(ingredient__allergens__isnull=False)
+        .values_list('recipe_id', 'ingredient__allergens')
+        .distinct()
+    )
+    through.objects.bulk_create(
+        [through(recipe_id=recipe_id, foodtag_id=foodtag_id) for recipe_id, foodtag_id in pairs],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodplan_app', '0005_promocode_alter_subscription_promocode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='allergens',
+            field=models.ManyToManyField(blank=True, editable=False, related_name='recipes', to='foodplan_app.foodtag', verbose_name='Аллергены'),
+        ),
+        migrations.RunPython(fill_recipe_allergens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2 on 2026-10-18 03:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BASE_PRICES = {
+    1: (100, 300, 200, 100),
+    3: (200, 600, 400, 200),
+    6: (300, 900, 600, 300),
+    12: (400, 1200, 800, 400),
+}
+
+
+def create_base_tariff(apps, schema_editor):
+    Tariff = apps.get_model('foodplan_app', 'Tariff')
+    TariffPrice = apps.get_model('foodplan_app', 'TariffPrice')
+    tariff = Tariff.objects.create(name='Базовый')
+    TariffPrice.objects.bulk_create([
+        TariffPrice(
+            tariff=tariff,
+            months=months,
+            breakfast=breakfast,
+            lunch=lunch,
+            dinner=dinner,
+            dessert=dessert,
+        )
+        for months, (breakfast, lunch, dinner, dessert) in BASE_PRICES.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodplan_app', '0006_recipe_allergens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+            ],
+            options={
+                'verbose_name': 'Тариф',
+                'verbose_name_plural': 'Тарифы',
+                'ordering': ['-pk'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TariffPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('months', models.PositiveIntegerField(verbose_name='Количество месяцев')),
+                ('breakfast', models.PositiveIntegerField(verbose_name='Завтраки, руб.')),
+                ('lunch', models.PositiveIntegerField(verbose_name='Обеды, руб.')),
+                ('dinner', models.PositiveIntegerField(verbose_name='Ужины, руб.')),
+                ('dessert', models.PositiveIntegerField(verbose_name='Десерты, руб.')),
+                ('tariff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='foodplan_app.tariff', verbose_name='Тариф')),
+            ],
+            options={
+                'verbose_name': 'Цена тарифа',
+                'verbose_name_plural': 'Цены тарифа',
+                'ordering': ['months'],
+                'unique_together': {('tariff', 'months')},
+            },
+        ),
+        migrations.RunPython(create_base_tariff, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+def fill_lookup_keys(apps, schema_editor):
+    PromoCode = apps.get_model('foodplan_app', 'PromoCode')
+    promocodes = list(PromoCode.objects.all())
+    for promocode in promocodes:
+        promocode.lookup_key = (promocode.code or '').strip().upper()
+    PromoCode.objects.bulk_update(promocodes, ['lookup_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodplan_app', '0007_tariffs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='lookup_key',
+            field=models.CharField(editable=False, max_length=50, null=True, verbose_name='Ключ поиска'),
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='promocode',
+            name='lookup_key',
+            field=models.CharField(editable=False, max_length=50, unique=True, verbose_name='Ключ поиска'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodplan_app', '0008_promocode_lookup_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses',
+            field=models.PositiveIntegerField(blank=True, help_text='Пусто — без ограничений', null=True, verbose_name='Лимит использований'),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='uses',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Использован, раз'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodplan_app', '0009_promocode_usage_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='checkout_token',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True, verbose_name='Ключ оформления'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodplan_app', '0011_ingredient_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menutype',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Хеш изображения'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Хеш изображения'),
+        ),
+        migrations.AddField(
+            model_name='userpage',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Хеш изображения'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+from foodplan_app.search import drop_search_index_sql, search_index_sql, trigram_search_supported
+
+
+# таблица, столбец названия, таблица индекса FTS5
+SEARCH_INDEXES = [
+    ('foodplan_app_ingredient', 'name', 'foodplan_app_ingredient_search'),
+    ('foodplan_app_recipe', 'title', 'foodplan_app_recipe_search'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    # без FTS5 с trigram поиск работает через icontains (search.search)
+    if schema_editor.connection.vendor != 'sqlite' or not trigram_search_supported():
+        return
+    for source, column, table in SEARCH_INDEXES:
+        # индекс мог остаться от прежней установки через post_migrate
+        for sql in drop_search_index_sql(table) + search_index_sql(source, column, table):
+            schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for _, _, table in SEARCH_INDEXES:
+        for sql in drop_search_index_sql(table):
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodplan_app', '0013_recipe_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -2,7 +2,9 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Sum, Value
+from django.db.models.functions import Coalesce
+from decimal import Decimal
 
 
 class User(AbstractUser):
@@ -98,6 +100,8 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        # поиск по началу названия в админке, см. search.search
+        indexes = [models.Index(fields=["name"], name="ingredient_name_idx")]
 
 
 class MenuType(models.Model):
@@ -108,6 +112,13 @@ class MenuType(models.Model):
         blank=True,
         null=True,
     )
+    image_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Хеш изображения",
+    )
 
     def __str__(self):
         return self.title
@@ -117,6 +128,44 @@ class MenuType(models.Model):
         verbose_name_plural = "Типы меню"
 
 
+# Вклад одной строки RecipeIngredient в итоговые поля рецепта
+RECIPE_TOTALS = {
+    "price": F("ingredient__price") * F("mass") * Decimal("0.01"),
+    "mass": F("mass"),
+    "calories": F("ingredient__caloricity") * F("mass") * Decimal("0.01"),
+}
+
+
+class RecipeQuerySet(models.QuerySet):
+    def safe_for(self, allergy_ids=(), menu_type_ids=(), meal_types=()):
+        """
+        Рецепты без указанных аллергенов, входящие хотя бы в один из типов меню
+        и относящиеся к одному из приёмов пищи. Пустой список — без ограничения.
+        Каждое условие — отдельный подзапрос, поэтому distinct() не нужен.
+        Типы меню — через pk IN (...): выборка начинается с индекса по menutype_id,
+        а не с перебора всех рецептов с коррелированным EXISTS.
+        """
+        recipes = self
+        if allergy_ids:
+            recipes = recipes.exclude(
+                Exists(
+                    Recipe.allergens.through.objects.filter(
+                        recipe_id=OuterRef("pk"),
+                        foodtag_id__in=allergy_ids,
+                    )
+                )
+            )
+        if menu_type_ids:
+            recipes = recipes.filter(
+                pk__in=Recipe.menu_types.through.objects.filter(
+                    menutype_id__in=menu_type_ids,
+                ).values("recipe_id")
+            )
+        if meal_types:
+            recipes = recipes.filter(meal_type__in=meal_types)
+        return recipes
+
+
 class Recipe(models.Model):
     MEAL_TYPES = [
         ("breakfast", "Завтрак"),
@@ -127,6 +176,13 @@ class Recipe(models.Model):
 
     title = models.CharField(max_length=255, unique=True, verbose_name="Название блюда")
     image = models.ImageField(verbose_name="Изображение", upload_to="recipes/")
+    image_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Хеш изображения",
+    )
     description = models.TextField(blank=True, verbose_name="Описание")
     sequence = models.TextField(blank=True, verbose_name="Пошаговая инструкция")
     meal_type = models.CharField(
@@ -172,44 +228,43 @@ class Recipe(models.Model):
         blank=True
     )
 
+    # денормализованные аллергены ингредиентов, см. rollups.recompute_recipe_allergens
+    allergens = models.ManyToManyField(
+        FoodTag,
+        verbose_name="Аллергены",
+        related_name="recipes",
+        blank=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    def get_totals(self):
+        return self.ingredients.aggregate(
+            **{
+                name: Coalesce(Sum(expression), Value(Decimal("0")))
+                for name, expression in RECIPE_TOTALS.items()
+            }
+        )
+
     def get_price(self):
-        price = 0
-        for ingredient in self.ingredients.all():
-            if ingredient.ingredient.price and ingredient.mass:
-                price += ingredient.ingredient.price * ingredient.mass / 100
-        return price
+        return self.get_totals()["price"]
 
     def get_mass(self):
-        mass = 0
-        for ingredient in self.ingredients.all():
-            if ingredient.mass:
-                mass += ingredient.mass
-        return mass
+        return self.get_totals()["mass"]
 
     def get_calories(self):
-        calories = 0
-        for ingredient in self.ingredients.all():
-            if ingredient.ingredient.caloricity and ingredient.mass:
-                calories += ingredient.mass * ingredient.ingredient.caloricity / 100
-        return calories
+        return self.get_totals()["calories"]
 
     def get_allergens(self):
-        allergens = set()
-        for ingredient in self.ingredients.all():
-            allergens.update(ingredient.ingredient.allergens.all())
-        return list(allergens)
+        return list(self.allergens.all())
 
     def has_user_allergies(self, user_allergies):
-        recipe_allergens = self.get_allergens()
         user_allergy_ids = [allergy.id for allergy in user_allergies]
-        recipe_allergen_ids = [allergen.id for allergen in recipe_allergens]
-        
-        return bool(set(user_allergy_ids) & set(recipe_allergen_ids))
+        return self.allergens.filter(id__in=user_allergy_ids).exists()
 
     def is_safe_for_user(self, user_page):
-        if not user_page.allergies.exists():
-            return True
-        return not self.has_user_allergies(user_page.allergies.all())
+        return not self.allergens.filter(userpages=user_page).exists()
 
     def __str__(self):
         return f'{self.title}{" - Премиум" if self.premium else ""}'
@@ -217,6 +272,10 @@ class Recipe(models.Model):
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            # приёмы пищи в safe_for и фильтры списка в админке
+            models.Index(fields=["meal_type", "premium"], name="recipe_meal_premium_idx"),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -248,6 +307,13 @@ class UserPage(models.Model):
     image = models.ImageField(
         upload_to="avatars/", verbose_name="Изображение", blank=True, null=True
     )
+    image_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Хеш изображения",
+    )
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -282,19 +348,17 @@ class UserPage(models.Model):
     def has_active_subscription(self):
         return self.subscription.exists()
 
+    def get_allergy_ids(self):
+        return [allergy.pk for allergy in self.allergies.all()]
+
+    def get_menu_type_ids(self):
+        return [menu_type.pk for menu_type in self.menu_types.all()]
+
     def get_safe_recipes(self):
-        if self.menu_types.exists():
-            base_recipes = Recipe.objects.filter(menu_types__in=self.menu_types.all()).distinct()
-        else:
-            base_recipes = Recipe.objects.all()
-        if not self.allergies.exists():
-            return base_recipes
-        safe_recipes = base_recipes
-        for allergy in self.allergies.all():
-            safe_recipes = safe_recipes.exclude(
-                ingredients__ingredient__allergens=allergy
-            )
-        return safe_recipes.distinct()
+        return Recipe.objects.safe_for(
+            allergy_ids=self.get_allergy_ids(),
+            menu_type_ids=self.get_menu_type_ids(),
+        )
 
     def __str__(self):
         return self.username
@@ -304,26 +368,9 @@ class UserPage(models.Model):
         verbose_name_plural = "Страницы клиентов"
         ordering = ["username"]
 
-def get_safe_recipes(self):
-    
-    conditions = Q()
-    
-    if self.menu_types.exists():
-        conditions &= Q(menu_types__in=self.menu_types.all())
-    
-    if self.allergies.exists():
-        for allergy in self.allergies.all():
-            conditions &= ~Q(ingredients__ingredient__allergens=allergy)
-    
-    return Recipe.objects.filter(conditions).distinct()
-
-def __str__(self):
-    return self.username
 
-class Meta:
-    verbose_name = "Страница клиента"
-    verbose_name_plural = "Страницы клиентов"
-    ordering = ["username"]
+def normalize_promocode(code):
+    return (code or "").strip().upper()
 
 
 class PromoCode(models.Model):
@@ -332,6 +379,13 @@ class PromoCode(models.Model):
         unique=True,
         verbose_name="Код промокода"
     )
+    # код без пробелов в верхнем регистре: поиск по индексу вместо code__iexact
+    lookup_key = models.CharField(
+        max_length=50,
+        unique=True,
+        editable=False,
+        verbose_name="Ключ поиска"
+    )
     discount_percent = models.PositiveIntegerField(
         default=0,
         verbose_name="Скидка (%)"
@@ -350,15 +404,70 @@ class PromoCode(models.Model):
         blank=True,
         verbose_name="Действует до"
     )
+    max_uses = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Лимит использований",
+        help_text="Пусто — без ограничений"
+    )
+    uses = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Использован, раз"
+    )
 
     def __str__(self):
         return f"{self.code} (-{self.discount_percent}%)"
 
+    def is_exhausted(self):
+        return self.max_uses is not None and self.uses >= self.max_uses
+
+    def save(self, *args, **kwargs):
+        self.lookup_key = normalize_promocode(self.code)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Промокод"
         verbose_name_plural = "Промокоды"
 
 
+class Tariff(models.Model):
+    name = models.CharField(max_length=100, verbose_name="Название")
+    is_active = models.BooleanField(default=True, verbose_name="Активен")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+
+    def __str__(self):
+        return f"{self.name} (версия {self.pk})"
+
+    class Meta:
+        verbose_name = "Тариф"
+        verbose_name_plural = "Тарифы"
+        ordering = ["-pk"]
+
+
+class TariffPrice(models.Model):
+    tariff = models.ForeignKey(
+        Tariff,
+        on_delete=models.CASCADE,
+        related_name="prices",
+        verbose_name="Тариф",
+    )
+    months = models.PositiveIntegerField(verbose_name="Количество месяцев")
+    breakfast = models.PositiveIntegerField(verbose_name="Завтраки, руб.")
+    lunch = models.PositiveIntegerField(verbose_name="Обеды, руб.")
+    dinner = models.PositiveIntegerField(verbose_name="Ужины, руб.")
+    dessert = models.PositiveIntegerField(verbose_name="Десерты, руб.")
+
+    def __str__(self):
+        return f"{self.tariff}: {self.months} мес."
+
+    class Meta:
+        verbose_name = "Цена тарифа"
+        verbose_name_plural = "Цены тарифа"
+        ordering = ["months"]
+        unique_together = [("tariff", "months")]
+
+
 class Subscription(models.Model): 
     base_price = models.DecimalField(
         verbose_name="Базовая стоимость подписки, руб",
@@ -420,6 +529,15 @@ class Subscription(models.Model):
         related_name="subscriptions"
     )
 
+    # одноразовый ключ формы заказа: повторная отправка не создаёт вторую подписку
+    checkout_token = models.UUIDField(
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        verbose_name="Ключ оформления"
+    )
+
 
     class Meta:
         verbose_name = "Подписка"
@@ -474,22 +592,9 @@ class DailyMenu(models.Model):
     )
 
     def get_safe_menu_for_user(self, user_page):
-        safe_menu = {
-            'breakfast': self.breakfast,
-            'lunch': self.lunch,
-            'dinner': self.dinner,
-            'dessert': self.dessert,
-        }
-        
-        for meal_type, recipe in safe_menu.items():
-            if recipe and not recipe.is_safe_for_user(user_page):
-                replacement = user_page.get_safe_recipes().filter(
-                    meal_type=recipe.meal_type,
-                    menu_types__in=user_page.menu_types.all()
-                ).first()
-                safe_menu[meal_type] = replacement
-        
-        return safe_menu
+        from .menus import resolve_safe_menus
+
+        return resolve_safe_menus([self], [user_page])[(user_page.pk, self.pk)]
 
     def __str__(self):
         return f"Меню на {self.date}"
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+
+from .models import Tariff
+from .versions import bump_version, get_version
+
+
+QUOTE_MATRIX_KEY = "foodplan:quote-matrix"
+TARIFF_VERSION_KEY = "foodplan:tariff-version"
+MEALS = ("breakfast", "lunch", "dinner", "dessert")
+PERSONS = range(1, 6)
+
+# цены на случай, если в базе нет ни одного активного тарифа
+DEFAULT_PRICES = {
+    1: {'breakfast': 100, 'lunch': 300, 'dinner': 200, 'dessert': 100},
+    3: {'breakfast': 200, 'lunch': 600, 'dinner': 400, 'dessert': 200},
+    6: {'breakfast': 300, 'lunch': 900, 'dinner': 600, 'dessert': 300},
+    12: {'breakfast': 400, 'lunch': 1200, 'dinner': 800, 'dessert': 400},
+}
+
+
+def meal_mask(breakfast, lunch, dinner, dessert):
+    """Номер комбинации приёмов пищи 0..15: бит i — MEALS[i]."""
+    return sum(1 << bit for bit, selected in enumerate((breakfast, lunch, dinner, dessert)) if selected)
+
+
+def build_quote_matrix(version, prices):
+    """
+    Полная сетка цен: {"version", "default_months",
+    "quotes": {месяцы: {персоны: [цена для каждой из 16 комбинаций]}}}.
+    """
+    quotes = {}
+    for months, meal_prices in prices.items():
+        per_person = [
+            sum(meal_prices[meal] for bit, meal in enumerate(MEALS) if mask & (1 << bit))
+            for mask in range(1 << len(MEALS))
+        ]
+        quotes[months] = {
+            persons: [price * persons for price in per_person] for persons in PERSONS
+        }
+    return {
+        "version": version,
+        "default_months": min(prices),
+        "quotes": quotes,
+    }
+
+
+def load_quote_matrix():
+    tariff = Tariff.objects.filter(is_active=True).prefetch_related("prices").first()
+    prices = {}
+    if tariff is not None:
+        prices = {
+            price.months: {meal: getattr(price, meal) for meal in MEALS}
+            for price in tariff.prices.all()
+        }
+    if not prices:
+        return build_quote_matrix(None, DEFAULT_PRICES)
+    return build_quote_matrix(tariff.pk, prices)
+
+
+def get_quote_matrix():
+    """
+    Сетка цен из кэша процесса. Ключ содержит версию тарифов из общего кэша,
+    поэтому правка тарифа в любом процессе сбрасывает сетку во всех.
+    """
+    key = f"{QUOTE_MATRIX_KEY}:{get_version(TARIFF_VERSION_KEY)}"
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = load_quote_matrix()
+        # прежние версии вытесняет сам LocMemCache
+        cache.set(key, matrix, timeout=None)
+    return matrix
+
+
+def invalidate_quote_matrix():
+    bump_version(TARIFF_VERSION_KEY)
+
+
+def clamp_discount(percent):
+    return max(0, min(int(percent), 100))
+
+
+def apply_discount(price, percent):
+    """
+    Цена в рублях со скидкой percent, ограниченной 0..100 %; половина рубля
+    округляется вверх. Страница заказа (orders/order.html) считает так же.
+    """
+    return (price * (100 - clamp_discount(percent)) + 50) // 100
+
+
+def quote(months, persons, breakfast, lunch, dinner, dessert):
+    matrix = get_quote_matrix()
+    quotes = matrix["quotes"]
+    by_persons = quotes.get(months) or quotes[matrix["default_months"]]
+    mask = meal_mask(breakfast, lunch, dinner, dessert)
+    if persons in by_persons:
+        return by_persons[persons][mask]
+    return by_persons[1][mask] * persons
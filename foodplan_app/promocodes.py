@@ -0,0 +1,190 @@
+import hashlib
+import secrets
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .bulk import insert_rows
+from .models import PromoCode, normalize_promocode
+from .versions import bump_version, get_version
+
+
+PROMOCODE_CACHE_PREFIX = "foodplan:promocode:"
+PROMOCODE_VERSION_KEY = "foodplan:promocode-version"
+PROMOCODE_CACHE_TIMEOUT = 60 * 60
+# отсутствующий код кэшируется ненадолго: новый код к тому же сбрасывает запись
+MISSING_PROMOCODE_TIMEOUT = 5 * 60
+MISSING = "missing"
+
+# без похожих друг на друга символов: 0/O, 1/I/L
+CODE_ALPHABET = "23456789ABCDEFGHJKMNPQRSTUVWXYZ"
+CODE_LENGTH = 8
+GENERATE_BATCH_SIZE = 5000
+# ограничение SQLite на число параметров в одном запросе
+LOOKUP_CHUNK_SIZE = 900
+
+
+def promocode_cache_key(lookup_key):
+    """
+    Ключ в кэше процесса. В нём версия промокодов из общего кэша: правка,
+    новый код или использование в любом процессе сбрасывает записи во всех.
+    """
+    digest = hashlib.sha1(lookup_key.encode("utf-8")).hexdigest()
+    return f"{PROMOCODE_CACHE_PREFIX}{get_version(PROMOCODE_VERSION_KEY)}:{digest}"
+
+
+def _seconds_until(day):
+    moment = timezone.make_aware(datetime.combine(day, time.min))
+    return (moment - timezone.now()).total_seconds()
+
+
+def promocode_cache_timeout(promo):
+    """
+    Время жизни записи: не дольше PROMOCODE_CACHE_TIMEOUT и не позже
+    ближайшей границы срока действия (начала valid_from или конца valid_to).
+    """
+    if promo is None:
+        return MISSING_PROMOCODE_TIMEOUT
+    timeout = PROMOCODE_CACHE_TIMEOUT
+    today = timezone.localdate()
+    if promo.valid_from and today < promo.valid_from:
+        timeout = min(timeout, _seconds_until(promo.valid_from))
+    if promo.valid_to and today <= promo.valid_to:
+        timeout = min(timeout, _seconds_until(promo.valid_to + timedelta(days=1)))
+    return max(1, int(timeout))
+
+
+def get_promocode(code):
+    """
+    Активный PromoCode по коду без учёта регистра и пробелов или None.
+    Ответ, в том числе отрицательный, кэшируется; в обычном случае
+    запроса к базе нет. Срок действия проверяет вызывающий код.
+    """
+    lookup_key = normalize_promocode(code)
+    if not lookup_key:
+        return None
+    cache_key = promocode_cache_key(lookup_key)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return None if cached == MISSING else cached
+
+    promo = PromoCode.objects.filter(lookup_key=lookup_key, is_active=True).first()
+    cache.set(cache_key, promo or MISSING, promocode_cache_timeout(promo))
+    return promo
+
+
+def invalidate_promocode():
+    """
+    Сбрасывает кэш промокодов во всех процессах. Версия общая для всех
+    кодов: отрицательный ответ по ещё не созданному коду тоже устаревает.
+    """
+    bump_version(PROMOCODE_VERSION_KEY)
+
+
+def redeem_promocode(promo):
+    """
+    Засчитывает одно использование промокода условным UPDATE без блокировок:
+    счётчик растёт, только пока код активен и лимит не исчерпан.
+    Возвращает False, если использовать код уже нельзя.
+    """
+    redeemed = PromoCode.objects.filter(
+        Q(max_uses__isnull=True) | Q(uses__lt=F("max_uses")),
+        pk=promo.pk,
+        is_active=True,
+    ).update(uses=F("uses") + 1)
+    # UPDATE не вызывает post_save, а в кэше лежит объект с прежним счётчиком.
+    # Сбрасываем сразу: on_commit пропал бы при откате внешней транзакции
+    invalidate_promocode()
+    # запрос, прочитавший код до фиксации, мог снова положить его в кэш
+    transaction.on_commit(invalidate_promocode)
+    return bool(redeemed)
+
+
+def _existing_lookup_keys(lookup_keys):
+    lookup_keys = list(lookup_keys)
+    existing = set()
+    for start in range(0, len(lookup_keys), LOOKUP_CHUNK_SIZE):
+        chunk = lookup_keys[start:start + LOOKUP_CHUNK_SIZE]
+        existing.update(
+            PromoCode.objects.filter(lookup_key__in=chunk).values_list("lookup_key", flat=True)
+        )
+    return existing
+
+
+def _random_code(length):
+    # одно криптостойкое число с запасом бит вместо вызова генератора на каждый символ
+    number = secrets.randbits(5 * length + 32)
+    symbols = []
+    for _ in range(length):
+        number, index = divmod(number, len(CODE_ALPHABET))
+        symbols.append(CODE_ALPHABET[index])
+    return "".join(symbols)
+
+
+def _random_codes(count, prefix, length):
+    codes = set()
+    while len(codes) < count:
+        codes.add(prefix + _random_code(length))
+    return codes
+
+
+def generate_promocodes(
+    count,
+    discount_percent,
+    prefix="",
+    length=CODE_LENGTH,
+    valid_from=None,
+    valid_to=None,
+    max_uses=None,
+    batch_size=GENERATE_BATCH_SIZE,
+):
+    """
+    Создаёт count уникальных случайных промокодов пакетами через executemany.
+    Коды, уже занятые в базе, отбрасываются заранее; если пакет всё равно
+    упёрся в уникальный индекс (параллельная генерация), он создаётся заново.
+    Возвращает список созданных кодов.
+    """
+    prefix = normalize_promocode(prefix)
+    if len(prefix) + length > PromoCode._meta.get_field("code").max_length:
+        raise ValueError("Слишком длинный промокод")
+    # при плотно занятом пространстве кодов подбор шёл бы бесконечно
+    if len(CODE_ALPHABET) ** length < count * 10:
+        raise ValueError("Слишком короткий код для такого количества промокодов")
+    # общие для всей партии значения приводятся к типам базы один раз
+    connection = connections[router.db_for_write(PromoCode)]
+    shared = {
+        "discount_percent": discount_percent,
+        "is_active": True,
+        "valid_from": valid_from,
+        "valid_to": valid_to,
+        "max_uses": max_uses,
+        "uses": 0,
+    }
+    fields = ["code", "lookup_key", *shared]
+    shared_values = tuple(
+        PromoCode._meta.get_field(name).get_db_prep_save(value, connection)
+        for name, value in shared.items()
+    )
+
+    created = []
+    while len(created) < count:
+        size = min(batch_size, count - len(created))
+        codes = _random_codes(size, prefix, length)
+        codes -= _existing_lookup_keys(codes)
+        try:
+            with transaction.atomic(using=connection.alias):
+                insert_rows(
+                    PromoCode,
+                    fields,
+                    ((code, code, *shared_values) for code in codes),
+                    batch_size=batch_size,
+                )
+        except IntegrityError:
+            continue
+        created.extend(codes)
+    # вставка мимо ORM не вызывает сигналы: сбрасываем возможные отрицательные ответы
+    invalidate_promocode()
+    return created
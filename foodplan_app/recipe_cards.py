@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+
+from .catalog import get_catalog_version
+from .models import Recipe, RecipeIngredient
+
+
+RECIPE_CARD_PREFIX = "foodplan:recipe-card"
+RECIPE_CARD_TIMEOUT = 24 * 60 * 60
+CARD_TEMPLATES = ("recipes/card3.html", "recipes/card1.html", "recipes/card2.html")
+
+
+def recipe_card_key(recipe_id, version):
+    return f"{RECIPE_CARD_PREFIX}:{version}:{recipe_id}"
+
+
+def render_recipe_card(recipe_id):
+    recipe = (
+        Recipe.objects.prefetch_related(
+            Prefetch("ingredients", queryset=RecipeIngredient.objects.select_related("ingredient"))
+        )
+        .filter(pk=recipe_id)
+        .first()
+    )
+    if recipe is None:
+        return None
+    return {
+        "title": recipe.title,
+        "html": render_to_string(CARD_TEMPLATES[recipe.pk % 3], {"recipe": recipe}),
+    }
+
+
+def get_recipe_card(recipe_id, version=None):
+    """
+    Отрисованная карточка рецепта: {"title", "html"} или None,
+    если рецепта нет. Хранится в кэше по id и версии каталога, поэтому
+    любое изменение рецепта, его ингредиентов или изображения (они
+    поднимают версию) даёт новую запись, а старая истекает сама.
+    """
+    if version is None:
+        version = get_catalog_version()
+    key = recipe_card_key(recipe_id, version)
+    card = cache.get(key)
+    if card is None:
+        card = render_recipe_card(recipe_id)
+        if card is not None:
+            cache.set(key, card, RECIPE_CARD_TIMEOUT)
+    return card
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import connection
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+
+# размер: ширина в пикселях, от меньшего к большему
+RENDITION_WIDTHS = {"thumb": 200, "card": 480, "full": 1200}
+# формат: (формат Pillow, расширение, параметры сохранения)
+RENDITION_FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 75, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 80, "optimize": True, "progressive": True}),
+}
+RENDITIONS_DIR = "renditions"
+RENDITIONS_STORAGE = "renditions"
+IMAGE_HASH_LENGTH = 16
+# ошибки чтения файла как изображения: битый или неизвестный формат (OSError),
+# слишком много пикселей, неверные данные EXIF или палитры
+RENDER_ERRORS = (OSError, Image.DecompressionBombError, ValueError)
+
+# копии загрузок из админки строятся в одном фоновом потоке процесса:
+# Pillow не задерживает ответ, а запись хешей в SQLite идёт по одной
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="renditions")
+
+
+def image_digest(data):
+    return hashlib.sha256(data).hexdigest()[:IMAGE_HASH_LENGTH]
+
+
+def rendition_name(digest, size, file_format):
+    extension = RENDITION_FORMATS[file_format][1]
+    return f"{RENDITIONS_DIR}/{digest[:2]}/{digest}-{size}.{extension}"
+
+
+def rendition_names(digest):
+    return [
+        rendition_name(digest, size, file_format)
+        for size in RENDITION_WIDTHS
+        for file_format in RENDITION_FORMATS
+    ]
+
+
+def has_renditions(digest, storage=None):
+    storage = storage or storages[RENDITIONS_STORAGE]
+    return all(storage.exists(name) for name in rendition_names(digest))
+
+
+def render_renditions(data):
+    """
+    Уменьшенные копии изображения во всех размерах и форматах:
+    {(размер, формат): байты}. Не обращается к Django, поэтому
+    выполняется и в отдельных процессах generate_renditions.
+    Меньшие копии не увеличиваются сверх размера оригинала.
+    """
+    image = Image.open(BytesIO(data))
+    # JPEG сразу декодируется в уменьшенном масштабе, не меньше самой крупной копии
+    largest = max(RENDITION_WIDTHS.values())
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    renditions = {}
+    # каждая копия уменьшается из предыдущей, более крупной
+    for size, width in sorted(RENDITION_WIDTHS.items(), key=lambda item: -item[1]):
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        for file_format, (pil_format, _, options) in RENDITION_FORMATS.items():
+            frame = image
+            if has_alpha and pil_format == "JPEG":
+                frame = Image.new("RGB", image.size, "white")
+                frame.paste(image, mask=image.getchannel("A"))
+            buffer = BytesIO()
+            frame.save(buffer, pil_format, **options)
+            renditions[size, file_format] = buffer.getvalue()
+    return renditions
+
+
+def save_renditions(digest, renditions, storage=None):
+    storage = storage or storages[RENDITIONS_STORAGE]
+    for (size, file_format), data in renditions.items():
+        name = rendition_name(digest, size, file_format)
+        if not storage.exists(name):
+            storage.save(name, ContentFile(data))
+
+
+def ensure_renditions(field_file):
+    """
+    Хеш содержимого изображения; недостающие копии создаются.
+    None — если файла нет или его не удалось прочитать как изображение.
+    """
+    try:
+        with field_file.open("rb") as source:
+            data = source.read()
+    except OSError:
+        return None
+    digest = image_digest(data)
+    if not has_renditions(digest):
+        try:
+            renditions = render_renditions(data)
+        except RENDER_ERRORS:
+            return None
+        save_renditions(digest, renditions)
+    return digest
+
+
+def refresh_image_renditions(model, pk):
+    """
+    Пересчитывает копии изображения записи и запоминает хеш.
+    Возвращает True, если хеш изменился.
+    """
+    obj = model.objects.filter(pk=pk).only("image", "image_hash").first()
+    if obj is None:
+        return False
+    digest = (ensure_renditions(obj.image) if obj.image else None) or ""
+    if digest == obj.image_hash:
+        return False
+    model.objects.filter(pk=pk).update(image_hash=digest)
+    return True
+
+
+def _run_in_background(func):
+    try:
+        func()
+    except Exception:
+        logger.exception("Не удалось построить копии изображения")
+    finally:
+        # у фонового потока своё соединение с базой
+        connection.close()
+
+
+def build_in_background(func):
+    """
+    Выполняет func в фоновом потоке, не задерживая запрос.
+    Пока копий нет, страницы показывают исходное изображение.
+    """
+    return _background.submit(_run_in_background, func)
+
+
+def rendition_url(digest, size, file_format="jpeg"):
+    return storages[RENDITIONS_STORAGE].url(rendition_name(digest, size, file_format))
+
+
+def image_url(obj, size="card", file_format="jpeg"):
+    """Адрес копии изображения, а пока копий нет — самого изображения."""
+    if not obj.image:
+        return ""
+    if obj.image_hash:
+        return rendition_url(obj.image_hash, size, file_format)
+    return obj.image.url
+
+
+def rendition_srcset(digest, size, file_format):
+    """srcset из копий не крупнее size."""
+    limit = RENDITION_WIDTHS[size]
+    return ", ".join(
+        f"{rendition_url(digest, name, file_format)} {width}w"
+        for name, width in RENDITION_WIDTHS.items()
+        if width <= limit
+    )
@@ -0,0 +1,87 @@
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+from .models import RECIPE_TOTALS, Recipe, RecipeIngredient
+
+
+ROLLUP_FIELD = DecimalField(max_digits=10, decimal_places=2)
+BATCH_SIZE = 1000
+
+
+def _total_subquery(expression):
+    totals = (
+        RecipeIngredient.objects.filter(recipe=OuterRef("pk"))
+        .order_by()
+        .values("recipe")
+        .annotate(total=Sum(expression, output_field=ROLLUP_FIELD))
+        .values("total")
+    )
+    return Round(
+        Coalesce(
+            Subquery(totals, output_field=ROLLUP_FIELD),
+            Value(Decimal("0")),
+            output_field=ROLLUP_FIELD,
+        ),
+        precision=ROLLUP_FIELD.decimal_places,
+    )
+
+
+def recompute_recipe_rollups(recipe_ids=None):
+    """
+    Пересчитывает Recipe.price / mass / calories одним UPDATE
+    с агрегирующими подзапросами по RecipeIngredient.
+    recipe_ids — список или queryset id рецептов; None — весь каталог.
+    Возвращает количество обновлённых рецептов.
+    """
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    return recipes.update(
+        **{
+            name: _total_subquery(expression)
+            for name, expression in RECIPE_TOTALS.items()
+        }
+    )
+
+
+def recipes_with_ingredient(ingredient):
+    return RecipeIngredient.objects.filter(ingredient=ingredient).values("recipe_id")
+
+
+def recompute_recipe_allergens(recipe_ids=None):
+    """
+    Пересобирает таблицу Recipe.allergens из аллергенов ингредиентов.
+    recipe_ids — список или queryset id рецептов; None — весь каталог.
+    Возвращает количество записанных пар (рецепт, аллерген).
+    """
+    through = Recipe.allergens.through
+    current = through.objects.all()
+    pairs = RecipeIngredient.objects.filter(ingredient__allergens__isnull=False)
+    if recipe_ids is not None:
+        current = current.filter(recipe_id__in=recipe_ids)
+        pairs = pairs.filter(recipe_id__in=recipe_ids)
+    pairs = (
+        pairs.order_by()
+        .values_list("recipe_id", "ingredient__allergens")
+        .distinct()
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+
+    created = 0
+    with transaction.atomic():
+        current.delete()
+        while batch := list(islice(pairs, BATCH_SIZE)):
+            through.objects.bulk_create(
+                through(recipe_id=recipe_id, foodtag_id=foodtag_id)
+                for recipe_id, foodtag_id in batch
+            )
+            created += len(batch)
+    return created
+
+
+def recipes_with_allergen(foodtag):
+    return Recipe.allergens.through.objects.filter(foodtag=foodtag).values("recipe_id")
@@ -0,0 +1,49 @@
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS
+
+
+READ_ONLY_DB = "replica"
+
+_read_only = ContextVar("foodplan_read_only", default=False)
+
+
+def read_only_view(view):
+    """
+    Помечает представление, которое только читает данные: при включённом
+    ReadOnlyRouter его запросы на чтение идут через соединение replica.
+    Запись из такого представления по-прежнему уходит в default.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_only.reset(token)
+
+    return wrapper
+
+
+class ReadOnlyRouter:
+    """
+    replica — второе соединение к тому же файлу SQLite с PRAGMA query_only.
+    В режиме WAL читатели не ждут писателя, поэтому страницы из
+    read_only_view не стоят в очереди за оплатами и сохранениями.
+    """
+
+    def db_for_read(self, model, **hints):
+        return READ_ONLY_DB if _read_only.get() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # объекты, прочитанные через replica, сохраняются в default
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # обе базы — один и тот же файл
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
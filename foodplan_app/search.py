@@ -0,0 +1,111 @@
+import functools
+import sqlite3
+from contextlib import closing
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Ingredient, Recipe
+
+
+# модель: (поле названия, таблица полнотекстового индекса)
+SEARCH_INDEXES = {
+    Ingredient: ("name", "foodplan_app_ingredient_search"),
+    Recipe: ("title", "foodplan_app_recipe_search"),
+}
+# триграммный индекс ищет подстроки не короче трёх символов
+TRIGRAM_LENGTH = 3
+# верхняя граница диапазона для поиска по началу строки
+MAX_CHAR = "\U0010ffff"
+
+
+@functools.cache
+def trigram_search_supported():
+    """
+    Есть ли в SQLite модуль FTS5 с токенизатором trigram (3.34+). Проверяется
+    на базе в памяти той же библиотеки, через которую работает Django.
+    """
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    try:
+        with closing(sqlite3.connect(":memory:")) as db:
+            db.execute("CREATE VIRTUAL TABLE probe USING fts5(name, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def search_index_sql(source, column, table):
+    """Индекс FTS5 по столбцу таблицы source, триггеры синхронизации и заполнение."""
+    return [
+        f"CREATE VIRTUAL TABLE {table} USING fts5("
+        f"{column}, content='{source}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {table}_insert AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {table}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER {table}_delete AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {table}({table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER {table}_update AFTER UPDATE OF {column} ON {source} BEGIN "
+        f"INSERT INTO {table}({table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {table}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+
+
+def drop_search_index_sql(table):
+    return [
+        *(f"DROP TRIGGER IF EXISTS {table}_{event}" for event in ("insert", "delete", "update")),
+        f"DROP TABLE IF EXISTS {table}",
+    ]
+
+
+def repair_search_indexes(using="default"):
+    """
+    Индексы поиска создаёт миграция 0014_search_indexes. Когда более поздняя
+    миграция меняет схему таблицы рецептов или ингредиентов, SQLite
+    пересоздаёт её, и триггеры индекса теряются; тогда индекс строится
+    заново. Вызывается после каждой миграции.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {name for name, in cursor.fetchall()}
+        for model, (field, table) in SEARCH_INDEXES.items():
+            if table not in existing or f"{table}_update" in existing:
+                continue
+            source = model._meta.db_table
+            column = model._meta.get_field(field).column
+            for sql in drop_search_index_sql(table) + search_index_sql(source, column, table):
+                cursor.execute(sql)
+
+
+def _prefix_q(field, word):
+    # диапазон по индексу вместо LIKE: регистр первой буквы перебирается явно
+    q = Q()
+    for variant in {word, word.lower(), word.capitalize()}:
+        q |= Q(**{f"{field}__gte": variant, f"{field}__lt": variant + MAX_CHAR})
+    return q
+
+
+def search(queryset, term):
+    """
+    Рецепты или ингредиенты, в названии которых есть каждое слово запроса.
+    Слова от трёх символов ищутся по триграммному индексу в любом месте
+    названия, более короткие — по индексу названия с начала строки.
+    Без FTS5 с trigram (другая СУБД, старый SQLite) — обычный icontains.
+    """
+    field, table = SEARCH_INDEXES[queryset.model]
+    indexed = connections[queryset.db].vendor == "sqlite" and trigram_search_supported()
+    for word in term.split():
+        if len(word) < TRIGRAM_LENGTH:
+            queryset = queryset.filter(_prefix_q(field, word))
+        elif indexed:
+            phrase = '"{}"'.format(word.replace('"', '""'))
+            queryset = queryset.filter(
+                pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [phrase])
+            )
+        else:
+            queryset = queryset.filter(**{f"{field}__icontains": word})
+    return queryset
@@ -0,0 +1,64 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, IntegerField, Sum, Value, When
+
+from .menus import MEALS, resolve_safe_menus
+from .models import DailyMenu, RecipeIngredient
+
+
+TOTAL_FIELD = DecimalField(max_digits=12, decimal_places=2)
+CENTS = Decimal("0.01")
+
+
+def count_week_recipes(subscription):
+    """
+    Сколько раз каждый рецепт встречается в меню подписчика за неделю
+    с учётом выбранных приёмов пищи и замен по аллергиям.
+    """
+    user_page = subscription.user
+    meals = [meal for meal in MEALS if getattr(subscription, meal)]
+    plans = resolve_safe_menus(DailyMenu.objects.filter(users=user_page), [user_page])
+    return Counter(
+        plan[meal].pk
+        for plan in plans.values()
+        for meal in meals
+        if plan[meal] is not None
+    )
+
+
+def build_shopping_list(subscription):
+    """
+    Список покупок на неделю: масса и стоимость каждого ингредиента по всем
+    блюдам меню, умноженные на количество персон. Суммирование выполняется
+    одним запросом с GROUP BY по ингредиенту.
+    Возвращает список словарей {"name", "total_mass", "total_price"} по алфавиту.
+    """
+    recipe_counts = count_week_recipes(subscription)
+    if not recipe_counts:
+        return []
+
+    servings = Case(
+        *[When(recipe_id=pk, then=Value(count)) for pk, count in recipe_counts.items()],
+        output_field=IntegerField(),
+    )
+    persons = Value(subscription.persons)
+    mass = F("mass") * servings * persons
+    items = list(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_counts)
+        .values("ingredient_id")
+        .annotate(
+            name=F("ingredient__name"),
+            total_mass=Sum(mass, output_field=TOTAL_FIELD),
+            total_price=Sum(
+                mass * F("ingredient__price") * CENTS,
+                output_field=TOTAL_FIELD,
+            ),
+        )
+        .values("name", "total_mass", "total_price")
+        .order_by("name")
+    )
+    for item in items:
+        item["total_mass"] = item["total_mass"].quantize(CENTS)
+        item["total_price"] = item["total_price"].quantize(CENTS)
+    return items
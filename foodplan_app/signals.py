@@ -0,0 +1,140 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .models import (
+    FoodTag,
+    Ingredient,
+    MenuType,
+    PromoCode,
+    Recipe,
+    RecipeIngredient,
+    Tariff,
+    TariffPrice,
+    UserPage,
+)
+from .pricing import invalidate_quote_matrix
+from .promocodes import invalidate_promocode
+from .renditions import build_in_background, refresh_image_renditions
+from .search import repair_search_indexes
+from .rollups import (
+    recipes_with_allergen,
+    recipes_with_ingredient,
+    recompute_recipe_allergens,
+    recompute_recipe_rollups,
+)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient_recipe(sender, instance, raw=False, **kwargs):
+    # при переносе ингредиента в другой рецепт пересчитываются оба
+    instance._previous_recipe_id = None
+    if instance.pk and not raw:
+        instance._previous_recipe_id = (
+            RecipeIngredient.objects.filter(pk=instance.pk).values_list("recipe_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def update_recipe_rollups(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    recipe_ids = {instance.recipe_id, getattr(instance, "_previous_recipe_id", None)} - {None}
+    recompute_recipe_rollups(list(recipe_ids))
+    recompute_recipe_allergens(list(recipe_ids))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_rollups(sender, instance, created, raw=False, **kwargs):
+    # у нового ингредиента ещё нет рецептов
+    if raw or created:
+        return
+    recompute_recipe_rollups(recipes_with_ingredient(instance))
+
+
+@receiver(m2m_changed, sender=Ingredient.allergens.through)
+def update_ingredient_recipes_allergens(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        recipe_ids = recipes_with_ingredient(instance)
+    elif pk_set:
+        recipe_ids = RecipeIngredient.objects.filter(
+            ingredient_id__in=pk_set
+        ).values("recipe_id")
+    else:
+        # FoodTag.ingredients.clear(): затронуты рецепты, где аллерген уже учтён
+        recipe_ids = list(recipes_with_allergen(instance).values_list("recipe_id", flat=True))
+    recompute_recipe_allergens(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=MenuType)
+@receiver(post_delete, sender=MenuType)
+@receiver(post_delete, sender=FoodTag)
+@receiver(m2m_changed, sender=Recipe.menu_types.through)
+@receiver(m2m_changed, sender=Ingredient.allergens.through)
+def invalidate_catalog(sender, action=None, **kwargs):
+    if action is not None and not action.startswith("post_"):
+        return
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Tariff)
+@receiver(post_delete, sender=Tariff)
+@receiver(post_save, sender=TariffPrice)
+@receiver(post_delete, sender=TariffPrice)
+def invalidate_tariffs(sender, **kwargs):
+    transaction.on_commit(invalidate_quote_matrix)
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def invalidate_promocode_cache(sender, instance, **kwargs):
+    # версия общая, поэтому запись по прежнему коду при переименовании тоже сбрасывается
+    transaction.on_commit(invalidate_promocode)
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=MenuType)
+@receiver(pre_save, sender=UserPage)
+def remember_image(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_image = None
+    if instance.pk and not raw and (update_fields is None or "image" in update_fields):
+        instance._previous_image = (
+            sender.objects.filter(pk=instance.pk).values_list("image", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=MenuType)
+@receiver(post_save, sender=UserPage)
+def update_image_renditions(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and "image" not in update_fields):
+        return
+    image = instance.image.name or ""
+    if image == (getattr(instance, "_previous_image", None) or "") and (
+        instance.image_hash or not image
+    ):
+        return
+    def refresh():
+        # карточки рецептов в кэше ссылаются на копии прежнего изображения
+        if refresh_image_renditions(sender, instance.pk) and sender is not UserPage:
+            bump_catalog_version()
+
+    # копии строятся после коммита и вне запроса, чтобы не держать
+    # на время Pillow ни транзакцию, ни ответ
+    transaction.on_commit(lambda: build_in_background(refresh))
+
+
+@receiver(post_migrate)
+def ensure_search_indexes(sender, app_config, using, **kwargs):
+    if app_config.label == "foodplan_app":
+        repair_search_indexes(using)
@@ -0,0 +1,46 @@
+"""
+Бэкенд SQLite с настройками для нескольких одновременных процессов.
+Добавляет к django.db.backends.sqlite3 два параметра OPTIONS, которые
+появились в самом Django только в 5.1 и повторяют его поведение:
+
+* init_command — команды через «;», выполняемые при каждом подключении
+  (PRAGMA journal_mode, synchronous, busy_timeout и т. п.);
+* transaction_mode — режим BEGIN для atomic(): с IMMEDIATE транзакция сразу
+  берёт блокировку записи и ждёт её по busy_timeout, а не падает с
+  «database is locked», когда чтение внутри транзакции сменяется записью.
+
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+TRANSACTION_MODES = ("DEFERRED", "EXCLUSIVE", "IMMEDIATE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("init_command", None)
+        params.pop("transaction_mode", None)
+        return params
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode должен быть одним из {', '.join(TRANSACTION_MODES)}"
+            )
+        return mode and mode.upper()
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        init_command = self.settings_dict["OPTIONS"].get("init_command") or ""
+        for statement in init_command.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.transaction_mode
+        self.cursor().execute(f"BEGIN {mode}" if mode else "BEGIN")
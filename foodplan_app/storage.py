@@ -0,0 +1,50 @@
+import hashlib
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+CONTENT_HASH_LENGTH = 32
+# имена из хеша содержимого: загрузки и их уменьшенные копии (renditions)
+CONTENT_NAME_RE = re.compile(r"(^|/)[0-9a-f]{16,}(-[a-z]+)?\.[0-9a-z]+$")
+# год — столько браузеры и прокси хранят неизменяемые файлы
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_NAME_RE.search(name))
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()[:CONTENT_HASH_LENGTH]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище загрузок, в котором файл называется по хешу содержимого:
+    recipes/салат.jpeg сохраняется как recipes/<sha256>.jpeg.
+    Одинаковые загрузки занимают один файл, а содержимое по адресу
+    никогда не меняется, поэтому его можно кэшировать навсегда.
+    Файл может быть общим у нескольких записей, поэтому удалять его
+    через FieldFile.delete нельзя — лишние файлы убирает dedupe_media.
+    """
+
+    def content_name(self, name, content):
+        directory, basename = posixpath.split(name)
+        extension = posixpath.splitext(basename)[1].lower()
+        return posixpath.join(directory, content_hash(content) + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
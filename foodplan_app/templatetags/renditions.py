@@ -0,0 +1,34 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from ..renditions import image_url, rendition_srcset
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(obj, size="card", sizes="100vw", **attrs):
+    """
+    <picture> с копиями изображения в WebP и JPEG не крупнее size:
+    браузер сам выбирает копию по sizes и плотности экрана.
+    Пока копий нет, выводится исходное изображение.
+
+        {% responsive_image recipe "card" sizes="33vw" alt=recipe.title class="w-100" %}
+    """
+    attrs = {"loading": "lazy", "decoding": "async", **attrs}
+    if not obj.image_hash:
+        return format_html("<img src=\"{}\"{}>", image_url(obj, size), flatatt(attrs))
+    return format_html(
+        "<picture>"
+        "<source type=\"image/webp\" srcset=\"{}\" sizes=\"{}\">"
+        "<img src=\"{}\" srcset=\"{}\" sizes=\"{}\"{}>"
+        "</picture>",
+        rendition_srcset(obj.image_hash, size, "webp"),
+        sizes,
+        image_url(obj, size),
+        rendition_srcset(obj.image_hash, size, "jpeg"),
+        sizes,
+        flatatt(attrs),
+    )
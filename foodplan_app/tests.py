@@ -0,0 +1,1422 @@
+import datetime
+import gzip
+import json
+import re
+import tempfile
+import threading
+import uuid
+from collections import Counter
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from time import perf_counter
+from unittest import addModuleCleanup, mock
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from .models import (
+    DailyMenu,
+    FoodTag,
+    Ingredient,
+    MenuType,
+    PriceRange,
+    PromoCode,
+    Recipe,
+    RecipeIngredient,
+    Subscription,
+    Tariff,
+    TariffPrice,
+    User,
+    UserPage,
+)
+from .admin import EstimatedCountPaginator
+from .bulk import insert_rows
+from .catalog_io import iter_catalog_export
+from .catalog import SafeRecipeCache, bump_catalog_version, get_catalog_index
+from .menus import generate_weekly_menus, resolve_safe_menus
+from .pricing import invalidate_quote_matrix, quote
+from .promocodes import (
+    MISSING_PROMOCODE_TIMEOUT,
+    PROMOCODE_CACHE_TIMEOUT,
+    generate_promocodes,
+    get_promocode,
+    invalidate_promocode,
+    promocode_cache_timeout,
+    redeem_promocode,
+)
+from .shopping import build_shopping_list
+from .routers import READ_ONLY_DB, ReadOnlyRouter, read_only_view
+from .rollups import recompute_recipe_allergens, recompute_recipe_rollups
+from .versions import SHARED_CACHE_ALIAS
+from .views import apply_promocode_if_any
+
+
+def setUpModule():
+    # версии каталога, тарифов и промокодов живут в общем файловом кэше;
+    # тесты не должны сбивать версии запущенного рядом сервера
+    shared_cache = tempfile.TemporaryDirectory()
+    caches = {
+        **settings.CACHES,
+        SHARED_CACHE_ALIAS: {**settings.CACHES[SHARED_CACHE_ALIAS], "LOCATION": shared_cache.name},
+    }
+    shared_cache_settings = override_settings(CACHES=caches)
+    shared_cache_settings.enable()
+    addModuleCleanup(shared_cache.cleanup)
+    addModuleCleanup(shared_cache_settings.disable)
+
+
+class EmailBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("planner", "planner@example.com", "password")
+
+    def test_login_by_email_reads_user_once(self):
+        with self.assertNumQueries(1):
+            user = authenticate(email="planner@example.com", password="password")
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.backend, "foodplan_app.backends.EmailBackend")
+
+    def test_wrong_password(self):
+        self.assertIsNone(authenticate(email="planner@example.com", password="wrong"))
+
+    def test_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(authenticate(email="planner@example.com", password="password"))
+
+    def test_unknown_email_still_hashes_password(self):
+        with mock.patch.object(User, "set_password", autospec=True) as set_password:
+            with self.assertNumQueries(1):
+                user = authenticate(email="nobody@example.com", password="password")
+
+        self.assertIsNone(user)
+        set_password.assert_called_once_with(mock.ANY, "password")
+
+
+class GeneratePromoCodesTests(TestCase):
+    def test_creates_requested_number_of_unique_codes(self):
+        PromoCode.objects.create(code="SPRING-TAKEN", discount_percent=5)
+
+        codes = generate_promocodes(2500, 15, prefix="spring-", max_uses=3, batch_size=1000)
+
+        self.assertEqual(len(codes), 2500)
+        self.assertEqual(len(set(codes)), 2500)
+        self.assertEqual(PromoCode.objects.filter(code__startswith="SPRING-").count(), 2501)
+        promo = get_promocode(codes[0].lower())
+        self.assertEqual(promo.lookup_key, codes[0])
+        self.assertEqual((promo.discount_percent, promo.max_uses, promo.uses), (15, 3, 0))
+
+    def test_rejects_too_short_codes(self):
+        with self.assertRaises(ValueError):
+            generate_promocodes(1000, 10, length=1)
+
+
+class PromoCodeCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_unknown_code_is_cached_until_a_code_is_created(self):
+        self.assertIsNone(get_promocode("autumn"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_promocode("AUTUMN "))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PromoCode.objects.create(code="AUTUMN", discount_percent=10)
+
+        self.assertEqual(get_promocode("autumn").discount_percent, 10)
+        with self.assertNumQueries(0):
+            get_promocode("autumn")
+
+    def test_change_in_another_process_resets_cached_code(self):
+        promo = PromoCode.objects.create(code="WINTER", discount_percent=30)
+        self.assertEqual(get_promocode("winter").discount_percent, 30)
+
+        # другой процесс правит код и меняет версию в общем кэше;
+        # объект в LocMemCache этого процесса остаётся прежним
+        PromoCode.objects.filter(pk=promo.pk).update(discount_percent=5)
+        invalidate_promocode()
+
+        self.assertEqual(get_promocode("winter").discount_percent, 5)
+        PromoCode.objects.filter(pk=promo.pk).update(is_active=False)
+        invalidate_promocode()
+        self.assertIsNone(get_promocode("winter"))
+
+    def test_cache_timeout_ends_at_validity_boundary(self):
+        day = datetime.date(2026, 3, 10)
+        evening = timezone.make_aware(datetime.datetime(2026, 3, 10, 23, 30))
+        timeouts = {
+            "без срока": PromoCode(),
+            "последний день": PromoCode(valid_to=day),
+            "с завтрашнего дня": PromoCode(valid_from=day + datetime.timedelta(days=1)),
+            "с послезавтра": PromoCode(valid_from=day + datetime.timedelta(days=2)),
+            "истёк": PromoCode(valid_to=day - datetime.timedelta(days=1)),
+        }
+        with mock.patch("django.utils.timezone.now", return_value=evening):
+            timeouts = {name: promocode_cache_timeout(promo) for name, promo in timeouts.items()}
+            missing = promocode_cache_timeout(None)
+
+        self.assertEqual(timeouts, {
+            "без срока": PROMOCODE_CACHE_TIMEOUT,
+            "последний день": 30 * 60,
+            "с завтрашнего дня": 30 * 60,
+            "с послезавтра": PROMOCODE_CACHE_TIMEOUT,
+            "истёк": PROMOCODE_CACHE_TIMEOUT,
+        })
+        self.assertEqual(missing, MISSING_PROMOCODE_TIMEOUT)
+
+
+class RedeemPromoCodeTests(TransactionTestCase):
+    THREADS = 16
+
+    def redeem_concurrently(self, promo):
+        results = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append(redeem_promocode(promo))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_limit_is_not_exceeded_under_concurrency(self):
+        promo = PromoCode.objects.create(code="LIMITED", discount_percent=10, max_uses=5)
+
+        results = self.redeem_concurrently(promo)
+
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(results.count(True), 5)
+        promo.refresh_from_db()
+        self.assertEqual(promo.uses, 5)
+        self.assertTrue(promo.is_exhausted())
+
+    def test_unlimited_code_counts_every_use(self):
+        promo = PromoCode.objects.create(code="UNLIMITED", discount_percent=10)
+
+        results = self.redeem_concurrently(promo)
+
+        self.assertTrue(all(results))
+        promo.refresh_from_db()
+        self.assertEqual(promo.uses, self.THREADS)
+
+    def test_inactive_code_is_not_redeemed(self):
+        promo = PromoCode.objects.create(code="OFF", discount_percent=10, is_active=False)
+
+        self.assertFalse(redeem_promocode(promo))
+        promo.refresh_from_db()
+        self.assertEqual(promo.uses, 0)
+
+    def test_exhausted_code_is_not_applied_from_cache(self):
+        PromoCode.objects.create(code="SINGLE", discount_percent=10, max_uses=1)
+        cache.clear()
+        self.assertTrue(apply_promocode_if_any(1000, "single")[2])
+
+        self.assertTrue(redeem_promocode(get_promocode("single")))
+
+        self.assertEqual(apply_promocode_if_any(1000, "single"), (1000, None, False))
+
+
+class OrderCheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "password")
+        self.client.force_login(self.user)
+        self.menu_types = [MenuType.objects.create(title=title) for title in ("Классическое", "Веган")]
+        self.allergy = FoodTag.objects.create(name="Орехи")
+        cache.clear()
+
+    def pay(self, token=None, **data):
+        payload = {
+            "action": "pay",
+            "checkout_token": str(token or uuid.uuid4()),
+            "foodtype": [self.menu_types[0].pk],
+            "allergies": [self.allergy.pk],
+            "months": "3",
+            "persons": "2",
+            "breakfast": "1",
+            "lunch": "1",
+        }
+        payload.update(data)
+        return self.client.post(reverse("order"), payload)
+
+    def test_checkout_query_budget(self):
+        PromoCode.objects.create(code="FOOD10", discount_percent=10)
+        self.pay(promocode="food10")
+
+        # сессия и пользователь (2), типы меню и аллергены (2), промокод — кэш
+        # сброшен прошлой оплатой, профиль с выбором (3), подписка, промокод,
+        # удаление прежней подписки (3), типы меню подписки, сохранение
+        # сообщения в сессии; точки сохранения — от TestCase (4)
+        with self.assertNumQueries(19):
+            response = self.pay(promocode="food10")
+
+        self.assertRedirects(response, reverse("lk"), fetch_redirect_response=False)
+        subscription = Subscription.objects.get(user__user=self.user)
+        self.assertEqual(subscription.promocode.code, "FOOD10")
+        self.assertEqual(list(subscription.menu_types.all()), self.menu_types[:1])
+
+    def test_double_submit_creates_one_subscription(self):
+        promo = PromoCode.objects.create(code="ONCE", discount_percent=10, max_uses=5)
+        token = uuid.uuid4()
+
+        first = self.pay(token, promocode="once")
+        second = self.pay(token, promocode="once")
+
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(second.status_code, 302)
+        self.assertEqual(Subscription.objects.filter(user__user=self.user).count(), 1)
+        promo.refresh_from_db()
+        self.assertEqual(promo.uses, 1)
+
+    def test_exhausted_promocode_rolls_back_checkout(self):
+        self.pay(foodtype=[self.menu_types[1].pk])
+        promo = PromoCode.objects.create(code="LAST", discount_percent=10, max_uses=1)
+        self.pay(action="apply", promocode="last")
+        # "Применить" показал скидку, но последний раз код успели использовать раньше
+        PromoCode.objects.filter(pk=promo.pk).update(uses=1)
+
+        response = self.pay(promocode="last")
+
+        self.assertEqual(response.status_code, 200)
+        subscription = Subscription.objects.get(user__user=self.user)
+        self.assertIsNone(subscription.promocode)
+        self.assertEqual(list(subscription.menu_types.all()), self.menu_types[1:])
+        # форма заказа больше не предлагает исчерпанный код
+        self.assertEqual(apply_promocode_if_any(1000, "last"), (1000, None, False))
+
+
+@override_settings(DATABASE_ROUTERS=["foodplan_app.routers.ReadOnlyRouter"])
+class ReadOnlyRouterTests(TestCase):
+    """
+    Маршрутизация профиля FOODPLAN_SQLITE_PRODUCTION. Соединения replica
+    в тестах нет, поэтому выбор роутера записывается, а запрос идёт в default.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("reader", "reader@example.com", "password")
+        self.client.force_login(self.user)
+        self.menu_type = MenuType.objects.create(title="Классическое")
+        self.recipe = Recipe.objects.create(title="Плов", meal_type="lunch")
+        self.reads = []
+        route = ReadOnlyRouter.db_for_read
+
+        def record(router, model, **hints):
+            self.reads.append((model, route(router, model, **hints)))
+            return DEFAULT_DB_ALIAS
+
+        patcher = mock.patch.object(ReadOnlyRouter, "db_for_read", autospec=True, side_effect=record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def read_aliases(self, model):
+        return {alias for read_model, alias in self.reads if read_model is model}
+
+    def test_read_only_view_reads_from_replica(self):
+        response = self.client.get(reverse("recipe_detail", args=[self.recipe.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read_aliases(Recipe), {READ_ONLY_DB})
+
+    def test_writes_from_read_only_view_go_to_default(self):
+        @read_only_view
+        def view(request):
+            return FoodTag.objects.create(name="Орехи")._state.db
+
+        self.assertEqual(view(None), DEFAULT_DB_ALIAS)
+        self.assertEqual(ReadOnlyRouter().db_for_write(FoodTag), DEFAULT_DB_ALIAS)
+        self.assertFalse(ReadOnlyRouter().allow_migrate(READ_ONLY_DB, "foodplan_app"))
+
+    def test_checkout_reads_and_writes_default(self):
+        response = self.client.post(reverse("order"), {
+            "action": "pay",
+            "checkout_token": str(uuid.uuid4()),
+            "foodtype": [self.menu_type.pk],
+            "months": "3",
+            "persons": "1",
+            "breakfast": "1",
+        })
+
+        self.assertRedirects(response, reverse("lk"), fetch_redirect_response=False)
+        self.assertTrue(self.reads)
+        self.assertEqual({alias for _, alias in self.reads}, {DEFAULT_DB_ALIAS})
+        self.assertTrue(Subscription.objects.filter(user__user=self.user).exists())
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        FoodTag.objects.bulk_create(FoodTag(name=f"Аллерген {number}") for number in range(10))
+        FoodTag.objects.filter(name__in=["Аллерген 8", "Аллерген 9"]).delete()
+
+    def paginator(self, limit=5, **filters):
+        paginator = EstimatedCountPaginator(FoodTag.objects.filter(**filters).order_by("pk"), 100)
+        paginator.exact_count_limit = limit
+        return paginator
+
+    def count(self, paginator):
+        with CaptureQueriesContext(connection) as queries:
+            count = paginator.count
+        return count, any("COUNT(" in query["sql"] for query in queries)
+
+    def test_large_table_uses_analyze_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE foodplan_app_foodtag")
+        FoodTag.objects.create(name="Аллерген 10")
+
+        # оценка берётся из статистики, хотя строк уже на одну больше
+        self.assertEqual(self.count(self.paginator()), (8, False))
+        self.assertEqual(self.count(self.paginator(limit=8)), (9, True))
+        # отфильтрованный список всегда считается точно
+        self.assertEqual(self.count(self.paginator(limit=0, pk__gt=0)), (9, True))
+
+    def test_counts_exactly_without_statistics(self):
+        # наибольший id — 10, а строк после удаления 8
+        self.assertEqual(self.count(self.paginator(limit=0)), (8, True))
+
+
+class RecipeAllergenTests(TestCase):
+    """
+    Recipe.allergens — единственное, по чему проверяется безопасность
+    рецептов, поэтому каждое изменение состава должно его пересчитывать.
+    """
+
+    def setUp(self):
+        self.nuts = FoodTag.objects.create(name="Орехи")
+        self.milk = FoodTag.objects.create(name="Молоко")
+        self.walnut = Ingredient.objects.create(name="Грецкий орех", price=120, caloricity=654)
+        self.cake = Recipe.objects.create(title="Торт", meal_type="dessert")
+        self.pie = Recipe.objects.create(title="Пирог", meal_type="dessert")
+        user = User.objects.create_user("allergic", "allergic@example.com", "password")
+        self.page = UserPage.objects.create(user=user, username="allergic")
+        self.page.allergies.set([self.nuts, self.milk])
+
+    def add_line(self, recipe, ingredient):
+        return RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, mass=100)
+
+    def assertSafe(self, recipe, safe=True):
+        self.assertEqual(recipe.is_safe_for_user(self.page), safe)
+        self.assertEqual(self.page.get_safe_recipes().filter(pk=recipe.pk).exists(), safe)
+
+    def assertUnsafe(self, recipe):
+        self.assertSafe(recipe, safe=False)
+
+    def test_ingredient_allergens_forward(self):
+        self.add_line(self.cake, self.walnut)
+        self.assertSafe(self.cake)
+
+        self.walnut.allergens.add(self.nuts)
+        self.assertUnsafe(self.cake)
+        self.walnut.allergens.remove(self.nuts)
+        self.assertSafe(self.cake)
+        self.walnut.allergens.add(self.nuts, self.milk)
+        self.assertUnsafe(self.cake)
+        self.walnut.allergens.clear()
+        self.assertSafe(self.cake)
+
+    def test_ingredient_allergens_reverse(self):
+        self.add_line(self.cake, self.walnut)
+
+        self.nuts.ingredients.add(self.walnut)
+        self.assertUnsafe(self.cake)
+        self.nuts.ingredients.remove(self.walnut)
+        self.assertSafe(self.cake)
+        self.nuts.ingredients.add(self.walnut)
+        self.nuts.ingredients.clear()
+        self.assertSafe(self.cake)
+
+    def test_recipe_ingredient_create_move_delete(self):
+        self.walnut.allergens.add(self.nuts)
+
+        line = self.add_line(self.cake, self.walnut)
+        self.assertUnsafe(self.cake)
+        self.assertSafe(self.pie)
+
+        line.recipe = self.pie
+        line.save()
+        self.assertSafe(self.cake)
+        self.assertUnsafe(self.pie)
+
+        line.delete()
+        self.assertSafe(self.pie)
+
+    def test_ingredient_delete(self):
+        self.walnut.allergens.add(self.nuts)
+        self.add_line(self.cake, self.walnut)
+        self.assertUnsafe(self.cake)
+
+        self.walnut.delete()
+
+        self.assertSafe(self.cake)
+
+    def test_foodtag_delete(self):
+        self.walnut.allergens.add(self.nuts)
+        self.add_line(self.cake, self.walnut)
+        self.assertUnsafe(self.cake)
+
+        self.nuts.delete()
+
+        self.assertSafe(self.cake)
+        self.assertFalse(self.cake.allergens.exists())
+
+
+class RecipeDetailCachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rice = Ingredient.objects.create(name="Рис", price=10, caloricity=344)
+        self.recipe = Recipe.objects.create(title="Плов", image="recipes/pilaf.jpg", meal_type="lunch")
+        RecipeIngredient.objects.create(recipe=self.recipe, ingredient=self.rice, mass=200)
+        bump_catalog_version()
+        self.url = reverse("recipe_detail", args=[self.recipe.pk])
+
+    def test_unchanged_card_returns_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response.headers)
+        etag = response.headers["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_ingredient_edit_changes_etag(self):
+        etag = self.client.get(self.url).headers["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rice.price = 25
+            self.rice.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = Path(media.name)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write_image(self, name, size=(20, 20)):
+        buffer = BytesIO()
+        Image.new("RGB", size, "orange").save(buffer, "PNG")
+        path = self.media_root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(buffer.getvalue())
+        return name
+
+    def generate(self):
+        out, err = StringIO(), StringIO()
+        call_command("generate_renditions", "--workers", "1", "--only", "recipes", stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_image_change_renders_outside_request(self):
+        recipe = Recipe.objects.create(title="Плов", meal_type="lunch")
+        recipe.image = self.write_image("recipes/pilaf.png")
+
+        with mock.patch("foodplan_app.signals.build_in_background") as build, \
+                mock.patch("foodplan_app.renditions.render_renditions") as render:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.save()
+
+        build.assert_called_once()
+        render.assert_not_called()
+
+    def test_command_reports_unreadable_images(self):
+        Recipe.objects.create(title="Плов", meal_type="lunch", image=self.write_image("recipes/bomb.png"))
+        broken = Recipe.objects.create(title="Суп", meal_type="lunch", image="recipes/broken.png")
+        (self.media_root / "recipes/broken.png").write_bytes(b"not an image")
+
+        # воркеры наследуют предел при fork
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 100):
+            out, err = self.generate()
+
+        self.assertIn("recipes/bomb.png", err)
+        self.assertIn("recipes/broken.png", err)
+        self.assertIn("ошибок: 2", out)
+        self.assertFalse(Recipe.objects.exclude(image_hash="").exists())
+        broken.refresh_from_db()
+        self.assertEqual(broken.image_hash, "")
+
+
+class CatalogRoundTripTests(TestCase):
+    """
+    Выгрузка, загруженная в пустой каталог, выгружается байт в байт так же:
+    import_catalog ничего не теряет из того, что пишет export_catalog.
+    """
+
+    CATALOG = {
+        "food_tags": [{"id": 7, "name": "Орехи"}, {"id": 8, "name": "Молоко"}],
+        "menu_types": [{"id": 3, "title": "Классическое", "image": "menu_types/classic.jpg"}],
+        "price_ranges": [{"id": 1, "name": "Эконом", "min_price": 0, "max_price": 499.5}],
+        "ingredients": [
+            {"id": 11, "name": "Грецкий орех", "price": 120, "caloricity": 654, "allergens": [7]},
+            {"id": 12, "name": "Молоко", "price": 8.5, "caloricity": 64, "allergens": [8]},
+            {"id": 13, "name": "Овсяные хлопья", "price": 12, "caloricity": 352},
+        ],
+        "recipes": [
+            {
+                "id": 21, "title": "Овсянка с орехами", "image": "recipes/oatmeal.jpg",
+                "description": "Сварить хлопья на молоке, посыпать орехами.", "sequence": "1. Сварить",
+                "meal_type": "breakfast", "premium": True, "on_index": True, "menu_types": [3],
+            },
+            {"id": 22, "title": "Молочный коктейль", "meal_type": "dessert"},
+        ],
+        "recipe_ingredients": [
+            {"id": 1, "recipe_id": 21, "ingredient_id": 13, "mass": 60},
+            {"id": 2, "recipe_id": 21, "ingredient_id": 12, "mass": 200.5},
+            {"id": 3, "recipe": "Овсянка с орехами", "ingredient": "Грецкий орех", "mass": 15},
+            {"id": 4, "recipe_id": 22, "ingredient_id": 12, "mass": 250},
+        ],
+    }
+    MODELS = [RecipeIngredient, Recipe, Ingredient, PriceRange, MenuType, FoodTag]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.empty_catalog()
+
+    def empty_catalog(self):
+        for model in self.MODELS:
+            model.objects.all().delete()
+        # id заново с единицы, как в новой базе
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM sqlite_sequence WHERE name IN (%s)" % ", ".join(["%s"] * len(self.MODELS)),
+                [model._meta.db_table for model in self.MODELS],
+            )
+
+    def import_file(self, name):
+        # PRAGMA synchronous нельзя менять внутри транзакции теста
+        call_command("import_catalog", str(self.directory / name), "--no-pragmas", stdout=StringIO())
+
+    def export_file(self, name):
+        call_command("export_catalog", str(self.directory / name), stdout=StringIO())
+        return (self.directory / name).read_bytes()
+
+    def round_trip(self, name):
+        (self.directory / "fixture.json").write_text(json.dumps(self.CATALOG), encoding="utf-8")
+        self.import_file("fixture.json")
+        first = self.export_file(name)
+        self.empty_catalog()
+        self.import_file(name)
+        self.assertEqual(self.export_file(f"again-{name}"), first)
+        return first
+
+    def test_json(self):
+        catalog = json.loads(self.round_trip("catalog.json"))
+
+        self.assertEqual([len(catalog[section]) for section in self.CATALOG], [2, 1, 1, 3, 2, 4])
+        oatmeal = catalog["recipes"][0]
+        self.assertEqual(
+            (oatmeal["premium"], oatmeal["menu_types"], oatmeal["mass"]), (True, [1], 275.5)
+        )
+        self.assertEqual(catalog["ingredients"][0]["allergens"], [1])
+
+    def test_ndjson(self):
+        lines = self.round_trip("catalog.ndjson").decode("utf-8").splitlines()
+
+        self.assertEqual(len(lines), 13)
+        self.assertEqual(json.loads(lines[0]), {"section": "food_tags", "id": 1, "name": "Орехи"})
+
+    def test_gzip(self):
+        for name, plain in (("catalog.json.gz", "catalog.json"), ("catalog.ndjson.gz", "catalog.ndjson")):
+            with self.subTest(file=name):
+                compressed = self.round_trip(name)
+                self.assertEqual(gzip.decompress(compressed), self.export_file(plain))
+
+
+class FakeDataTests(TestCase):
+    """С одним и тем же --seed на пустой базе generate_fake_data повторяет данные."""
+
+    # модели, которые заполняет генератор; аллергены и типы меню он
+    # находит по названию, поэтому они остаются между прогонами
+    GENERATED = [
+        DailyMenu, Subscription, UserPage, User, PromoCode, RecipeIngredient, Recipe, Ingredient,
+    ]
+
+    def empty_database(self):
+        for model in self.GENERATED:
+            model.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM sqlite_sequence WHERE name IN (%s)" % ", ".join(["%s"] * len(self.GENERATED)),
+                [model._meta.db_table for model in self.GENERATED],
+            )
+
+    def generate(self):
+        self.empty_database()
+        call_command(
+            "generate_fake_data", "--scale", "0.01", "--seed", "7", "--no-pragmas", stdout=StringIO(),
+        )
+        return {
+            "catalog": b"".join(iter_catalog_export("ndjson")),
+            "promocodes": list(PromoCode.objects.order_by("pk").values_list(
+                "code", "discount_percent", "is_active", "max_uses", "uses", "valid_from", "valid_to",
+            )),
+            "users": list(UserPage.objects.order_by("pk").values_list(
+                "user__username", "username", "is_subscribed",
+            )),
+            "profiles": [
+                sorted(relation.through.objects.values_list(
+                    "userpage_id", f"{relation.rel.model._meta.model_name}_id",
+                ))
+                for relation in (UserPage.allergies, UserPage.menu_types,
+                                 UserPage.liked_recipes, UserPage.disliked_recipes)
+            ],
+            "subscriptions": list(Subscription.objects.order_by("pk").values_list(
+                "user_id", "months", "persons", "price", "promocode_id",
+                "breakfast", "lunch", "dinner", "dessert",
+            )),
+            "menus": list(DailyMenu.objects.order_by("pk").values_list(
+                "date", "breakfast_id", "lunch_id", "dinner_id", "dessert_id",
+            )),
+            "menu_users": sorted(DailyMenu.users.through.objects.values_list("dailymenu_id", "userpage_id")),
+        }
+
+    def test_same_seed_same_data(self):
+        first = self.generate()
+        second = self.generate()
+
+        self.assertEqual(UserPage.objects.count(), 100)
+        self.assertTrue(first["subscriptions"])
+        self.assertTrue(first["menus"])
+        for section in first:
+            with self.subTest(section=section):
+                self.assertEqual(second[section], first[section])
+
+
+class RecipeRollupTests(TestCase):
+    def test_moving_ingredient_recomputes_both_recipes(self):
+        ingredient = Ingredient.objects.create(name="Рис", price=10, caloricity=344)
+        soup, pilaf = (Recipe.objects.create(title=title, meal_type="lunch") for title in ("Суп", "Плов"))
+        line = RecipeIngredient.objects.create(recipe=soup, ingredient=ingredient, mass=200)
+        soup.refresh_from_db()
+        self.assertGreater(soup.mass, 0)
+
+        line.recipe = pilaf
+        line.save()
+
+        soup.refresh_from_db()
+        pilaf.refresh_from_db()
+        self.assertEqual((soup.mass, soup.price, soup.calories), (0, 0, 0))
+        self.assertEqual(pilaf.mass, 200)
+
+
+class WeeklyMenuTests(TestCase):
+    def setUp(self):
+        menu_type = MenuType.objects.create(title="Классическое")
+        self.recipes = [
+            Recipe.objects.create(title=f"Обед {number}", meal_type="lunch") for number in range(10)
+        ]
+        Recipe.menu_types.through.objects.bulk_create(
+            Recipe.menu_types.through(recipe=recipe, menutype=menu_type) for recipe in self.recipes
+        )
+        bump_catalog_version()
+        self.pages = {}
+        for name, meals in (("first", {"lunch": True}), ("second", {"lunch": True}),
+                            ("picky", {"lunch": True}), ("empty", {"breakfast": False})):
+            user = User.objects.create_user(name, f"{name}@example.com", "password")
+            page = self.pages[name] = UserPage.objects.create(user=user, username=name)
+            page.menu_types.add(menu_type)
+            Subscription.objects.create(user=page, **meals)
+        self.pages["picky"].liked_recipes.add(self.recipes[-1])
+        self.pages["picky"].disliked_recipes.add(self.recipes[0])
+
+    def week(self, name):
+        menus = self.pages[name].daily_menu.order_by("pk")
+        return [menu.lunch_id for menu in menus]
+
+    def test_likes_rerank_within_shared_profile(self):
+        stats = generate_weekly_menus()
+
+        self.assertEqual((stats["subscribers"], stats["profiles"]), (3, 1))
+        self.assertEqual(self.week("first"), self.week("second"))
+        self.assertEqual(
+            set(self.pages["first"].daily_menu.values_list("pk", flat=True)),
+            set(self.pages["second"].daily_menu.values_list("pk", flat=True)),
+        )
+        picky = self.week("picky")
+        self.assertEqual(len(picky), 7)
+        self.assertEqual(picky[0], self.recipes[-1].pk)
+        self.assertNotIn(self.recipes[0].pk, picky)
+        self.assertEqual(self.week("empty"), [])
+
+
+class SafeMenusTests(TestCase):
+    """
+    resolve_safe_menus: блюдо с аллергеном пользователя заменяется первым
+    безопасным рецептом того же приёма пищи из его типов меню.
+    """
+
+    def setUp(self):
+        nuts = FoodTag.objects.create(name="Орехи")
+        milk = FoodTag.objects.create(name="Молоко")
+        walnut = Ingredient.objects.create(name="Грецкий орех", price=120, caloricity=654)
+        walnut.allergens.add(nuts)
+        cream = Ingredient.objects.create(name="Сливки", price=90, caloricity=206)
+        cream.allergens.add(milk)
+        classic = MenuType.objects.create(title="Классическое")
+        vegan = MenuType.objects.create(title="Веганское")
+
+        def recipe(title, meal_type, menu_types, ingredients=()):
+            recipe = Recipe.objects.create(title=title, meal_type=meal_type)
+            recipe.menu_types.set(menu_types)
+            for ingredient in ingredients:
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, mass=50)
+            return recipe
+
+        self.nut_porridge = recipe("Каша с орехами", "breakfast", [classic, vegan], [walnut])
+        self.oatmeal = recipe("Овсянка", "breakfast", [classic])
+        self.tofu = recipe("Тофу", "breakfast", [vegan])
+        self.cream_soup = recipe("Сливочный суп", "lunch", [classic], [cream])
+        self.pilaf = recipe("Плов", "lunch", [classic])
+        self.cake = recipe("Торт", "dessert", [classic], [walnut, cream])
+        bump_catalog_version()
+
+        self.rich_menu = DailyMenu.objects.create(
+            date="Понедельник", breakfast=self.nut_porridge, lunch=self.cream_soup, dessert=self.cake,
+        )
+        self.plain_menu = DailyMenu.objects.create(date="Вторник", breakfast=self.oatmeal, lunch=self.pilaf)
+
+        self.pages = {}
+        for name, allergies, menu_types in (
+            ("nuts_classic", [nuts], [classic]),
+            ("nuts_vegan", [nuts], [vegan]),
+            ("milk_vegan", [milk], [vegan]),
+            ("nuts_no_menu", [nuts], []),
+            ("no_allergies", [], [classic]),
+        ):
+            user = User.objects.create_user(name, f"{name}@example.com", "password")
+            page = self.pages[name] = UserPage.objects.create(user=user, username=name)
+            page.allergies.set(allergies)
+            page.menu_types.set(menu_types)
+
+    def plan(self, plans, name, menu):
+        return {meal: recipe for meal, recipe in plans[self.pages[name].pk, menu.pk].items() if recipe}
+
+    def test_replaces_unsafe_meals_per_user(self):
+        plans = resolve_safe_menus([self.rich_menu, self.plain_menu], self.pages.values())
+
+        self.assertEqual(len(plans), 10)
+        self.assertEqual(
+            self.plan(plans, "nuts_classic", self.rich_menu),
+            {"breakfast": self.oatmeal, "lunch": self.cream_soup},
+        )
+        self.assertEqual(self.plan(plans, "nuts_vegan", self.rich_menu), {
+            "breakfast": self.tofu, "lunch": self.cream_soup,
+        })
+        # веганского обеда без молока нет — приём пищи пустеет
+        self.assertEqual(self.plan(plans, "milk_vegan", self.rich_menu), {"breakfast": self.nut_porridge})
+        # без типов меню замену не из чего выбрать
+        self.assertEqual(self.plan(plans, "nuts_no_menu", self.rich_menu), {"lunch": self.cream_soup})
+        self.assertEqual(self.plan(plans, "no_allergies", self.rich_menu), {
+            "breakfast": self.nut_porridge, "lunch": self.cream_soup, "dessert": self.cake,
+        })
+        for name in self.pages:
+            self.assertEqual(
+                self.plan(plans, name, self.plain_menu),
+                {"breakfast": self.oatmeal, "lunch": self.pilaf},
+            )
+
+    def test_query_count_does_not_depend_on_pairs(self):
+        get_catalog_index()
+        menus = [self.rich_menu, self.plain_menu]
+        # меню, аллергии, типы меню пользователей и замены одним in_bulk
+        with self.assertNumQueries(4):
+            resolve_safe_menus(menus[:1], [self.pages["nuts_classic"]])
+        with self.assertNumQueries(4):
+            resolve_safe_menus(menus, list(self.pages.values()))
+
+
+class SafeRecipeCacheTests(TestCase):
+    def setUp(self):
+        self.nuts = FoodTag.objects.create(name="Орехи")
+        self.classic = MenuType.objects.create(title="Классическое")
+        walnut = Ingredient.objects.create(name="Грецкий орех", price=120, caloricity=654)
+        walnut.allergens.add(self.nuts)
+        self.porridge = Recipe.objects.create(title="Овсянка", meal_type="breakfast")
+        self.cake = Recipe.objects.create(title="Торт", meal_type="dessert")
+        RecipeIngredient.objects.create(recipe=self.cake, ingredient=walnut, mass=50)
+        for recipe in (self.porridge, self.cake):
+            recipe.menu_types.add(self.classic)
+        bump_catalog_version()
+        self.cache = SafeRecipeCache(maxsize=2)
+
+    def test_same_profile_shares_entry(self):
+        first = self.cache.recipe_ids([self.classic.pk], [self.nuts.pk], ["dessert", "breakfast"])
+        second = self.cache.recipe_ids([self.classic.pk] * 2, [self.nuts.pk], ["breakfast", "dessert"])
+
+        self.assertEqual(first, (self.porridge.pk,))
+        self.assertIs(second, first)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+        self.assertEqual(stats["catalog_version"], get_catalog_index().version)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.recipe_ids(meal_types=["breakfast"])
+        self.cache.recipe_ids(meal_types=["dessert"])
+        self.cache.recipe_ids(meal_types=["breakfast"])
+        # завтраки только что читались, вытесняются десерты
+        self.cache.recipe_ids(allergy_ids=[self.nuts.pk])
+        self.cache.recipe_ids(meal_types=["breakfast"])
+        self.cache.recipe_ids(meal_types=["dessert"])
+
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 4))
+        self.assertEqual((stats["size"], stats["maxsize"]), (2, 2))
+
+    def test_catalog_version_bump_drops_entries(self):
+        self.cache.recipe_ids(meal_types=["breakfast"])
+        self.cache.recipe_ids(meal_types=["dessert"])
+        toast = Recipe.objects.create(title="Тост", meal_type="breakfast")
+
+        bump_catalog_version()
+        ids = self.cache.recipe_ids(meal_types=["breakfast"])
+
+        self.assertEqual(ids, (self.porridge.pk, toast.pk))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (0, 3, 1))
+        self.assertEqual(stats["catalog_version"], get_catalog_index().version)
+
+        self.cache.clear()
+        self.assertEqual((self.cache.stats()["hits"], self.cache.stats()["misses"]), (0, 0))
+
+
+class SubscriptionRecipesTests(TestCase):
+    def test_recipes_match_profile_and_subscription_menu_types(self):
+        classic, keto = MenuType.objects.create(title="Классическое"), MenuType.objects.create(title="Кето")
+        recipes = {}
+        for title, menu_types in (("Только классика", [classic]), ("Только кето", [keto]),
+                                  ("Классика и кето", [classic, keto])):
+            recipes[title] = Recipe.objects.create(title=title, meal_type="breakfast")
+            recipes[title].menu_types.set(menu_types)
+        bump_catalog_version()
+        user = User.objects.create_user("eater", "eater@example.com", "password")
+        page = UserPage.objects.create(user=user, username="eater")
+        page.menu_types.set([classic])
+        subscription = Subscription.objects.create(user=page)
+        subscription.menu_types.set([classic, keto])
+        self.client.force_login(user)
+
+        response = self.client.get(reverse("subscription_recipes"))
+
+        titles = [recipe.title for recipe in response.context["subscription_recipes"]]
+        self.assertEqual(titles, ["Только классика", "Классика и кето"])
+        sections = {
+            section["menu_type"]: [recipe.title for recipe in section["recipes"]]
+            for section in response.context["menu_sections"]
+        }
+        self.assertEqual(sections, {classic: ["Только классика", "Классика и кето"], keto: ["Классика и кето"]})
+
+
+class ShoppingListTests(TestCase):
+    def setUp(self):
+        rice = Ingredient.objects.create(name="Рис", price=10, caloricity=344)
+        chicken = Ingredient.objects.create(name="Курица", price=50, caloricity=190)
+        egg = Ingredient.objects.create(name="Яйцо", price=20, caloricity=157)
+        pilaf = Recipe.objects.create(title="Плов", meal_type="lunch")
+        salad = Recipe.objects.create(title="Рисовый салат", meal_type="dinner")
+        omelette = Recipe.objects.create(title="Омлет", meal_type="breakfast")
+        for recipe, ingredient, mass in ((pilaf, rice, 200), (pilaf, chicken, 150),
+                                         (salad, rice, 100), (omelette, egg, 120)):
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, mass=mass)
+        bump_catalog_version()
+
+        self.user = User.objects.create_user("cook", "cook@example.com", "password")
+        page = UserPage.objects.create(user=self.user, username="cook")
+        self.subscription = Subscription.objects.create(
+            user=page, persons=2, breakfast=False, lunch=True, dinner=True,
+        )
+        # плов повторяется, а завтраки в подписку не входят
+        for day, lunch, dinner in (("Понедельник", pilaf, salad), ("Вторник", pilaf, None)):
+            menu = DailyMenu.objects.create(date=day, breakfast=omelette, lunch=lunch, dinner=dinner)
+            menu.users.add(page)
+
+    def test_totals_per_ingredient(self):
+        items = build_shopping_list(self.subscription)
+
+        # рис: (200 × 2 + 100) × 2 персоны, курица: 150 × 2 × 2; цена за 100 г
+        self.assertEqual(items, [
+            {"name": "Курица", "total_mass": Decimal("600.00"), "total_price": Decimal("300.00")},
+            {"name": "Рис", "total_mass": Decimal("1000.00"), "total_price": Decimal("100.00")},
+        ])
+
+    def test_csv_export(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("shopping_list_csv"))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(
+            b"".join(response.streaming_content).decode("utf-8"),
+            "\ufeffИнгредиент;Масса, г;Стоимость, руб.\r\n"
+            "Курица;600.00;300.00\r\n"
+            "Рис;1000.00;100.00\r\n",
+        )
+
+
+class TariffPriceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tariff = Tariff.objects.create(name="Весна")
+        self.price = TariffPrice.objects.create(
+            tariff=tariff, months=1, breakfast=100, lunch=300, dinner=200, dessert=100
+        )
+        # в TestCase колбэки on_commit не выполняются
+        invalidate_quote_matrix()
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "password")
+        self.menu_type = MenuType.objects.create(title="Классическое")
+
+    def breakfast_quote(self):
+        return quote(1, 1, True, False, False, False)
+
+    def test_price_changed_by_another_process(self):
+        self.assertEqual(self.breakfast_quote(), 100)
+
+        # другой процесс меняет цену и версию тарифов в общем кэше,
+        # а сетка этого процесса остаётся в LocMemCache
+        TariffPrice.objects.filter(pk=self.price.pk).update(breakfast=999)
+        invalidate_quote_matrix()
+
+        self.assertEqual(self.breakfast_quote(), 999)
+        self.client.force_login(self.user)
+        self.client.post(reverse("order"), {
+            "action": "pay",
+            "checkout_token": str(uuid.uuid4()),
+            "foodtype": [self.menu_type.pk],
+            "months": "1",
+            "persons": "1",
+            "breakfast": "1",
+        })
+        self.assertEqual(Subscription.objects.get(user__user=self.user).price, 999)
+
+    def test_saving_tariff_price_invalidates_quotes(self):
+        self.assertEqual(self.breakfast_quote(), 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.price.breakfast = 150
+            self.price.save()
+
+        self.assertEqual(self.breakfast_quote(), 150)
+
+
+class AdminChangelistQueryTests(TestCase):
+    CHANGELISTS = ["recipe", "ingredient", "userpage", "subscription", "dailymenu"]
+
+    def setUp(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin_user)
+        self.menu_type = MenuType.objects.create(title="Классическое")
+        self.allergens = [FoodTag.objects.create(name=name) for name in ("Орехи", "Рыба")]
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            number = self.rows
+            ingredient = Ingredient.objects.create(name=f"Ингредиент {number}", price=10)
+            ingredient.allergens.set(self.allergens)
+            recipe = Recipe.objects.create(title=f"Рецепт {number}")
+            recipe.menu_types.add(self.menu_type)
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, mass=100)
+
+            user = User.objects.create_user(f"user{number}", f"user{number}@example.com")
+            user_page = UserPage.objects.create(user=user, username=user.username)
+            user_page.allergies.set(self.allergens)
+            user_page.menu_types.add(self.menu_type)
+            subscription = Subscription.objects.create(user=user_page)
+            subscription.menu_types.add(self.menu_type)
+            daily_menu = DailyMenu.objects.create(breakfast=recipe, lunch=recipe, dinner=recipe)
+            daily_menu.menu_types.add(self.menu_type)
+            daily_menu.users.add(user_page)
+
+    def count_queries(self, model_name):
+        url = reverse(f"admin:foodplan_app_{model_name}_changelist")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_run_constant_number_of_queries(self):
+        self.add_rows(2)
+        baseline = {name: self.count_queries(name) for name in self.CHANGELISTS}
+        self.add_rows(8)
+
+        for name in self.CHANGELISTS:
+            with self.subTest(changelist=name):
+                self.assertEqual(self.count_queries(name), baseline[name])
+
+    def test_recipe_change_page_inline_is_prefetched(self):
+        self.add_rows(1)
+        recipe = Recipe.objects.get()
+        for number in range(5):
+            ingredient = Ingredient.objects.create(name=f"Добавка {number}")
+            ingredient.allergens.set(self.allergens)
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, mass=10)
+        url = reverse("admin:foodplan_app_recipe_change", args=[recipe.pk])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        allergen_queries = [
+            query for query in queries
+            if 'FROM "foodplan_app_foodtag" INNER JOIN "foodplan_app_ingredient_allergens"' in query["sql"]
+        ]
+        self.assertEqual(len(allergen_queries), 1)
+
+
+class SeededTestCase(TestCase):
+    """
+    База с каталогом и подписчиками в объёме, при котором заметны полные
+    переборы таблиц и N+1: строки пишутся пакетами, без сигналов.
+    """
+
+    RECIPES = 3000
+    PROMOCODES = 3000
+    USERS = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu_types = [
+            MenuType.objects.create(title=title)
+            for title in ("Классическое", "Низкоуглеводное", "Вегетарианское", "Кето")
+        ]
+        cls.allergens = [FoodTag.objects.create(name=f"Аллерген {number}") for number in range(8)]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ингредиент {number}", price=10 + number % 90, caloricity=number % 400)
+            for number in range(cls.RECIPES)
+        )
+        ingredient_ids = list(Ingredient.objects.values_list("pk", flat=True))
+        insert_rows(
+            Ingredient.allergens.through,
+            ["ingredient_id", "foodtag_id"],
+            ((pk, cls.allergens[pk % 8].pk) for pk in ingredient_ids if pk % 9 == 0),
+        )
+
+        meal_types = [value for value, _ in Recipe.MEAL_TYPES]
+        Recipe.objects.bulk_create(
+            Recipe(
+                title=f"Рецепт {number}",
+                image=f"recipes/seed-{number}.jpg",
+                meal_type=meal_types[number % len(meal_types)],
+                premium=number % 7 == 0,
+                on_index=number % 500 == 0,
+            )
+            for number in range(cls.RECIPES)
+        )
+        recipe_ids = list(Recipe.objects.values_list("pk", flat=True))
+        insert_rows(
+            Recipe.menu_types.through,
+            ["recipe_id", "menutype_id"],
+            ((pk, cls.menu_types[pk % 4].pk) for pk in recipe_ids),
+        )
+        insert_rows(
+            RecipeIngredient,
+            ["recipe", "ingredient", "mass"],
+            ((pk, ingredient_ids[(pk * 7 + shift) % len(ingredient_ids)], 50 + shift * 25)
+             for pk in recipe_ids for shift in range(5)),
+        )
+        recompute_recipe_rollups()
+        recompute_recipe_allergens()
+
+        PromoCode.objects.bulk_create(
+            PromoCode(code=f"CODE{number}", lookup_key=f"CODE{number}", discount_percent=10)
+            for number in range(cls.PROMOCODES)
+        )
+        tariff = Tariff.objects.create(name="Базовый")
+        TariffPrice.objects.bulk_create(
+            TariffPrice(
+                tariff=tariff, months=months,
+                breakfast=100 * step, lunch=300 * step, dinner=200 * step, dessert=100 * step,
+            )
+            for step, months in enumerate((1, 3, 6, 12), start=1)
+        )
+
+        User.objects.bulk_create(
+            User(username=f"user{number}", email=f"user{number}@example.com")
+            for number in range(cls.USERS)
+        )
+        UserPage.objects.bulk_create(
+            UserPage(user=user, username=user.username) for user in User.objects.all()
+        )
+        user_page_ids = list(UserPage.objects.values_list("pk", flat=True))
+        insert_rows(
+            UserPage.allergies.through,
+            ["userpage_id", "foodtag_id"],
+            ((pk, cls.allergens[pk % 8].pk) for pk in user_page_ids),
+        )
+        # оплата копирует типы меню подписки в профиль
+        insert_rows(
+            UserPage.menu_types.through,
+            ["userpage_id", "menutype_id"],
+            ((pk, cls.menu_types[pk % 4].pk) for pk in user_page_ids),
+        )
+        Subscription.objects.bulk_create(Subscription(user_id=pk) for pk in user_page_ids)
+        insert_rows(
+            Subscription.menu_types.through,
+            ["subscription_id", "menutype_id"],
+            ((pk, cls.menu_types[pk % 4].pk) for pk in Subscription.objects.values_list("pk", flat=True)),
+        )
+
+        cls.user = User.objects.create_user("planner", "planner@example.com", "password")
+        cls.user_page = UserPage.objects.create(user=cls.user, username="planner")
+        cls.user_page.allergies.set(cls.allergens[:2])
+        cls.user_page.menu_types.set(cls.menu_types[:1])
+        subscription = Subscription.objects.create(user=cls.user_page, dessert=True, persons=2)
+        subscription.menu_types.set(cls.menu_types[:1])
+        cls.admin_user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        generate_weekly_menus()
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+
+class QueryPlanTests(SeededTestCase):
+    """
+    Горячие запросы на заполненной базе после ANALYZE не должны
+    перебирать таблицы целиком. SCAN без индекса допустим только для
+    справочников из нескольких строк.
+    """
+
+    SMALL_TABLES = {"foodplan_app_foodtag", "foodplan_app_menutype"}
+    FULL_SCAN_RE = re.compile(r"^SCAN (\S+)$")
+
+    def setUp(self):
+        cache.clear()
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[3] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, sql, params=()):
+        plan = self.explain(sql, params)
+        for detail in plan:
+            match = self.FULL_SCAN_RE.match(detail)
+            if match and match.group(1) not in self.SMALL_TABLES:
+                self.fail(f"Полный перебор {match.group(1)}:\n{sql}\n" + "\n".join(plan))
+
+    def assertQuerysetUsesIndexes(self, queryset):
+        self.assertNoFullScan(*queryset.query.sql_with_params())
+
+    def assertCapturedUseIndexes(self, queries):
+        selects = [query["sql"] for query in queries if query["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            with self.subTest(sql=sql):
+                self.assertNoFullScan(sql)
+
+    def test_safe_recipes(self):
+        self.assertQuerysetUsesIndexes(self.user_page.get_safe_recipes())
+        self.assertQuerysetUsesIndexes(
+            Recipe.objects.safe_for(
+                allergy_ids=[self.allergens[0].pk],
+                menu_type_ids=[self.menu_types[1].pk],
+                meal_types=["dessert"],
+            )
+        )
+
+    def test_subscription_recipes_view(self):
+        self.client.force_login(self.user)
+        url = reverse("subscription_recipes")
+        # первый запрос строит снимок каталога — он читает таблицы целиком намеренно
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertCapturedUseIndexes(queries)
+
+    def test_apply_promocode(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, promo, applied = apply_promocode_if_any(1000, "code100")
+
+        self.assertTrue(applied)
+        self.assertEqual(promo.code, "CODE100")
+        self.assertCapturedUseIndexes(queries)
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin_user)
+        recipes = reverse("admin:foodplan_app_recipe_changelist")
+        pages = [
+            (recipes, {"meal_type__exact": "dessert", "premium__exact": "1"}),
+            (recipes, {"q": "Рецепт 12"}),
+            (reverse("admin:foodplan_app_ingredient_changelist"), {"q": "Ингредиент 7"}),
+        ]
+        for url, params in pages:
+            with self.subTest(url=url, params=params):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertCapturedUseIndexes(queries)
+
+
+def query_shape(sql):
+    """SQL без значений: одинаковые запросы с разными id совпадают."""
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    return re.sub(r"\(\?(, \?)+\)", "(...)", sql)
+
+
+class ViewBudgetTests(SeededTestCase):
+    """
+    Бюджет каждого адреса из foodplan/urls.py: не больше N SQL-запросов
+    и не дольше M мс при пустом кэше, то есть с отрисовкой карточек,
+    сборкой снимка каталога и чтением промокодов. Время — лучшее из RUNS
+    прогонов, чтобы не ловить шум машины; запросы — последнего прогона.
+    """
+
+    RUNS = 3
+    # модель в админке: запросов на странице списка; у новой модели бюджета
+    # нет, и тест падает с KeyError, пока его не добавят
+    ADMIN_CHANGELISTS = {
+        "group": 5,
+        "user": 6,
+        "foodtag": 5,
+        "subscription": 7,
+        "userpage": 9,
+        "ingredient": 8,
+        "recipe": 10,
+        "menutype": 5,
+        "dailymenu": 6,
+        "pricerange": 5,
+        "promocode": 5,
+        "tariff": 5,
+    }
+    ADMIN_INDEX_QUERIES = 3
+    ADMIN_MS = 1500
+
+    def budgets(self):
+        """(название, кто вошёл, метод, адрес, данные, запросов, мс)"""
+        recipe = Recipe.objects.order_by("pk").first()
+        pay = {
+            "action": "pay",
+            "foodtype": [self.menu_types[0].pk],
+            "allergies": [self.allergens[0].pk],
+            "months": "3",
+            "persons": "2",
+            "breakfast": "1",
+            "dinner": "1",
+            "promocode": "code7",
+        }
+        # /media/ подключается только при DEBUG, в тестах этого адреса нет
+        return [
+            ("index", None, "get", reverse("index"), None, 0, 200),
+            ("auth", None, "get", reverse("auth"), None, 0, 200),
+            # вход и регистрация упираются в хеширование пароля
+            ("auth: вход", None, "post", reverse("auth"),
+             {"username": "planner@example.com", "password": "password"}, 9, 1500),
+            ("registration", None, "get", reverse("registration"), None, 0, 200),
+            ("registration: новый пользователь", None, "post", reverse("registration"),
+             lambda run: {
+                 "username": f"newcomer{run}",
+                 "email": f"newcomer{run}@example.com",
+                 "password1": "Lemon-harbor-7319",
+                 "password2": "Lemon-harbor-7319",
+             }, 13, 1500),
+            ("order", self.user, "get", reverse("order"), None, 6, 200),
+            ("order: промокод", self.user, "post", reverse("order"), {**pay, "action": "apply"}, 10, 200),
+            ("lk", self.user, "get", reverse("lk"), None, 10, 300),
+            ("recipe_detail", None, "get", reverse("recipe_detail", args=[recipe.pk]), None, 2, 200),
+            ("subscription_recipes", self.user, "get", reverse("subscription_recipes"), None, 10, 1000),
+            ("shopping_list", self.user, "get", reverse("shopping_list"), None, 12, 300),
+            ("shopping_list_csv", self.user, "get", reverse("shopping_list_csv"), None, 12, 300),
+            ("check_promocode", self.user, "get", reverse("check_promocode"),
+             {"promocode": "code7", "months": "3", "persons": "2", "breakfast": "1"}, 5, 200),
+            ("safe_recipe_cache_stats", self.admin_user, "get", reverse("safe_recipe_cache_stats"),
+             None, 2, 200),
+            ("catalog_export", self.admin_user, "get", reverse("catalog_export"), None, 10, 1500),
+            ("logout", self.user, "post", reverse("logout"), None, 4, 200),
+            # оплата последней: она заменяет подписку пользователя
+            ("order: оплата", self.user, "post", reverse("order"),
+             lambda run: {**pay, "checkout_token": str(uuid.uuid4())}, 21, 300),
+        ]
+
+    def request(self, user, method, url, data):
+        self.client.logout()
+        cache.clear()
+        if user is not None:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+                response.close()
+            elapsed = (perf_counter() - started) * 1000
+        self.assertLess(response.status_code, 400, url)
+        return queries.captured_queries, elapsed
+
+    def measure(self, user, method, url, data=None):
+        timings = []
+        for run in range(self.RUNS):
+            queries, elapsed = self.request(user, method, url, data(run) if callable(data) else data)
+            timings.append(elapsed)
+        return queries, min(timings)
+
+    def assertWithinBudget(self, name, queries, elapsed, max_queries, max_ms):
+        if len(queries) > max_queries:
+            shapes = Counter(query_shape(query["sql"]) for query in queries)
+            repeated = [f"  {count} × {shape}" for shape, count in shapes.most_common() if count > 1]
+            self.fail("\n".join([
+                f"{name}: {len(queries)} запросов при бюджете {max_queries} "
+                f"(+{len(queries) - max_queries})",
+                "Повторяются:" if repeated else "Повторов нет",
+                *repeated,
+                "Все запросы:",
+                *(f"  {number}. {query['sql']}" for number, query in enumerate(queries, start=1)),
+            ]))
+        self.assertLessEqual(elapsed, max_ms, f"{name}: {elapsed:.0f} мс при бюджете {max_ms} мс")
+
+    def test_every_url_has_budget(self):
+        # у нового адреса бюджета нет, и тест падает, пока его не добавят;
+        # страницы админки проверяет test_admin_within_budget
+        named = {
+            pattern.name
+            for pattern in get_resolver().url_patterns
+            if isinstance(pattern, URLPattern) and pattern.name
+        }
+        measured = {resolve(url.split("?")[0]).url_name for _, _, _, url, *_ in self.budgets()}
+        self.assertEqual(named - measured, set())
+
+    def test_views_within_budget(self):
+        for name, user, method, url, data, max_queries, max_ms in self.budgets():
+            with self.subTest(view=name):
+                queries, elapsed = self.measure(user, method, url, data)
+                self.assertWithinBudget(name, queries, elapsed, max_queries, max_ms)
+
+    def test_admin_within_budget(self):
+        pages = [("admin:index", self.ADMIN_INDEX_QUERIES)] + [
+            (f"admin:{model._meta.app_label}_{model._meta.model_name}_changelist",
+             self.ADMIN_CHANGELISTS[model._meta.model_name])
+            for model in admin.site._registry
+        ]
+        for name, max_queries in pages:
+            with self.subTest(page=name):
+                queries, elapsed = self.measure(self.admin_user, "get", reverse(name))
+                self.assertWithinBudget(name, queries, elapsed, max_queries, self.ADMIN_MS)
@@ -0,0 +1,32 @@
+"""
+Версии данных, общие для всех процессов приложения. Сами данные
+кэшируются в памяти процесса под ключом с версией; правка в одном
+процессе меняет версию в общем кэше, и остальные перестают видеть
+прежние записи.
+"""
+import time
+
+from django.core.cache import caches
+
+
+# общий для процессов кэш (settings.CACHES)
+SHARED_CACHE_ALIAS = "shared"
+
+
+def _new_version():
+    # время в нс, а не счётчик: incr файлового кэша не атомарен, и две
+    # одновременные правки дали бы одно и то же значение
+    return time.time_ns()
+
+
+def get_version(key):
+    cache = caches[SHARED_CACHE_ALIAS]
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    caches[SHARED_CACHE_ALIAS].set(key, _new_version(), timeout=None)
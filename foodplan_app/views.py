@@ -1,18 +1,38 @@
-from django.http import JsonResponse
+import csv
+import uuid
+
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .models import MenuType, FoodTag, UserPage, Subscription, User, Recipe
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Prefetch
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.static import serve
+from .models import MenuType, FoodTag, UserPage, User, Recipe
 from .forms import EmailAuthenticationForm, CustomUserCreationForm
+from .catalog import get_catalog_version, safe_recipe_cache
+from .catalog_io import iter_catalog_export
+from .shopping import build_shopping_list
+from .pricing import apply_discount, clamp_discount, get_quote_matrix, quote
+from .promocodes import get_promocode
+from .recipe_cards import get_recipe_card
+from .routers import read_only_view
+from .checkout import PromoCodeExhausted, checkout, parse_checkout_token
+from .storage import IMMUTABLE_MAX_AGE, is_content_addressed
 
 from django.utils import timezone
 
+# поля рецепта, которые выводятся в карточках списка блюд
+RECIPE_CARD_FIELDS = ('id', 'title', 'image', 'image_hash', 'meal_type', 'calories', 'price')
+
 try:
     from .models import PromoCode  # если модели нет — всё продолжит работать без скидки
 except Exception:
     PromoCode = None
-from django.db.models.fields.related import ForeignKey
 
 
 def index(request):
@@ -56,7 +76,7 @@ def registration_view(request):
         if form.is_valid():
             user = form.save()
             UserPage.objects.create(user=user, username=user.username)
-            login(request, user)
+            login(request, user, backend='foodplan_app.backends.EmailBackend')
             messages.success(request, f'Аккаунт создан для {user.username}!')
             return redirect('lk')
         else:
@@ -69,17 +89,30 @@ def registration_view(request):
     return render(request, 'registration/registration.html', {'form': form})
 
 
+def render_order_page(request, menu_types, allergies, price=None, checkout_token=None):
+    return render(request, 'orders/order.html', {
+        'menu_types': menu_types,
+        'allergies': allergies,
+        'price': price,
+        'quote_matrix': get_quote_matrix(),
+        'checkout_token': checkout_token or uuid.uuid4(),
+    })
+
+
 @login_required
 def order_view(request):
-    menu_types = MenuType.objects.all()
-    allergies = FoodTag.objects.all()
+    menu_types = list(MenuType.objects.all())
+    allergies = list(FoodTag.objects.all())
 
     if request.method == 'POST':
         action = request.POST.get('action')
+        checkout_token = parse_checkout_token(request.POST.get('checkout_token'))
 
-        # можно выбрать несколько типов меню
-        menu_type_ids = request.POST.getlist('foodtype')
-        selected_menu_types = MenuType.objects.filter(id__in=menu_type_ids)
+        # можно выбрать несколько типов меню; выбор сверяется с уже загруженными списками
+        menu_type_ids = set(request.POST.getlist('foodtype'))
+        selected_menu_types = [m for m in menu_types if str(m.pk) in menu_type_ids]
+        allergy_ids = set(request.POST.getlist('allergies'))
+        selected_allergies = [a for a in allergies if str(a.pk) in allergy_ids]
 
         months = int(request.POST.get('months', 1))
         persons = int(request.POST.get('persons', 1))
@@ -87,7 +120,6 @@ def order_view(request):
         lunch = request.POST.get('lunch') == '1'
         dinner = request.POST.get('dinner') == '1'
         dessert = request.POST.get('dessert') == '1'
-        selected_allergies = request.POST.getlist('allergies')
         promocode = (request.POST.get('promocode') or '').strip()
 
         # считаем базовую цену и применяем промокод
@@ -100,106 +132,55 @@ def order_view(request):
                 messages.success(request, 'Промокод применён.')
             elif promocode:
                 messages.warning(request, 'Промокод не применён.')
-            return render(
-                request,
-                'orders/order.html',
-                {
-                    'menu_types': menu_types,
-                    'allergies': allergies,
-                    'price': final_price,
-                },
-            )
+            return render_order_page(request, menu_types, allergies, final_price, checkout_token)
 
         # "Оплатить" (нужно, чтобы был выбран тип меню)
-        if not selected_menu_types.exists():
+        if not selected_menu_types:
             messages.warning(request, 'Выберите тип меню.')
-            return render(
-                request,
-                'orders/order.html',
-                {
-                    'menu_types': menu_types,
-                    'allergies': allergies,
-                    'price': final_price,
-                },
-            )
-
-        # профиль пользователя
-        user_page, _ = UserPage.objects.get_or_create(
-            user=request.user,
-            defaults={'username': request.user.username}
-        )
-        # аллергии
-        user_page.allergies.set(FoodTag.objects.filter(id__in=selected_allergies))
-
-        # заменяем прошлую подписку новой
-        Subscription.objects.filter(user=user_page).delete()
+            return render_order_page(request, menu_types, allergies, final_price, checkout_token)
 
-        # значение для поля промокода (FK или CharField)
-        promo_value_for_save = None
         try:
-            promo_field = Subscription._meta.get_field('promocode')
-            is_fk = isinstance(promo_field, ForeignKey)
-        except Exception:
-            is_fk = False
-
-        if applied:
-            if is_fk:
-                promo_value_for_save = promo_obj
-            else:
-                promo_value_for_save = getattr(promo_obj, "code", None) if promo_obj else (promocode or None)
-
-        # создаём подписку с финальной ценой
-        subscription = Subscription.objects.create(
-            user=user_page,
-            months=months,
-            persons=persons,
-            breakfast=breakfast,
-            lunch=lunch,
-            dinner=dinner,
-            dessert=dessert,
-            price=final_price,
-            promocode=promo_value_for_save,
-        )
-
-        # привязываем выбранные типы меню к подписке и профилю
-        subscription.menu_types.set(selected_menu_types)
-        user_page.menu_types.set(selected_menu_types)
-        user_page.is_subscribed = True
-        user_page.save()
+            checkout(
+                request.user,
+                token=checkout_token,
+                menu_types=selected_menu_types,
+                allergies=selected_allergies,
+                price=final_price,
+                promo=promo_obj if applied else None,
+                months=months,
+                persons=persons,
+                breakfast=breakfast,
+                lunch=lunch,
+                dinner=dinner,
+                dessert=dessert,
+            )
+        except PromoCodeExhausted:
+            # лимит мог закончиться после "Применить"
+            messages.warning(request, 'Лимит использований промокода исчерпан.')
+            return render_order_page(request, menu_types, allergies, base_price, checkout_token)
 
         messages.success(request, 'Подписка успешно оформлена!')
         return redirect('lk')
 
     # GET
-    return render(request, 'orders/order.html', {
-        'menu_types': menu_types,
-        'allergies': allergies
-    })
+    return render_order_page(request, menu_types, allergies)
 
 
 @login_required
+@read_only_view
 def subscription_recipes_view(request):
     try:
-        user_page = UserPage.objects.get(user=request.user)
+        user_page = UserPage.objects.prefetch_related('allergies', 'menu_types').get(user=request.user)
     except UserPage.DoesNotExist:
         messages.error(request, 'Страница пользователя не найдена')
         return redirect('lk')
     
-    active_subscription = user_page.subscription.first()
+    active_subscription = user_page.subscription.prefetch_related('menu_types').first()
     
     if not active_subscription:
         messages.warning(request, 'У вас нет активной подписки')
         return redirect('lk')
     
-    safe_recipes = user_page.get_safe_recipes()
-    
-    if active_subscription.menu_types.exists():
-        subscription_recipes = safe_recipes.filter(
-            menu_types__in=active_subscription.menu_types.all()
-        ).distinct()
-    else:
-        subscription_recipes = safe_recipes
-    
     meal_types = []
     if active_subscription.breakfast:
         meal_types.append('breakfast')
@@ -209,68 +190,152 @@ def subscription_recipes_view(request):
         meal_types.append('dinner')
     if active_subscription.dessert:
         meal_types.append('dessert')
-    
-    if meal_types:
-        subscription_recipes = subscription_recipes.filter(meal_type__in=meal_types)
-    
-    recipes_by_menu_type = {}
-    for menu_type in active_subscription.menu_types.all():
-        recipes_by_menu_type[menu_type] = subscription_recipes.filter(
-            menu_types=menu_type
-        )
+
+    subscription_menu_types = list(active_subscription.menu_types.all())
+    allergy_ids = user_page.get_allergy_ids()
+
+    # id берём из общего кэша по профилю, из базы — один запрос за карточками.
+    # Рецепт должен входить и в типы меню профиля, и в типы меню подписки
+    recipe_ids = safe_recipe_cache.recipe_ids(
+        user_page.get_menu_type_ids(), allergy_ids, meal_types
+    )
+    if subscription_menu_types:
+        in_subscription = set(safe_recipe_cache.recipe_ids(
+            [menu_type.pk for menu_type in subscription_menu_types], allergy_ids, meal_types
+        ))
+        recipe_ids = [pk for pk in recipe_ids if pk in in_subscription]
+    recipes = Recipe.objects.only(*RECIPE_CARD_FIELDS).in_bulk(recipe_ids)
+    subscription_recipes = [recipes[pk] for pk in recipe_ids if pk in recipes]
+
+    menu_sections = []
+    for menu_type in subscription_menu_types:
+        ids = safe_recipe_cache.recipe_ids([menu_type.pk], allergy_ids, meal_types)
+        section_recipes = [recipes[pk] for pk in ids if pk in recipes]
+        menu_sections.append({
+            'menu_type': menu_type,
+            'recipes': section_recipes,
+            'count': len(section_recipes),
+        })
     
     return render(request, 'accounts/subscription_recipes.html', {
         'user_page': user_page,
         'active_subscription': active_subscription,
+        'subscription_menu_types': subscription_menu_types,
         'subscription_recipes': subscription_recipes,
-        'recipes_by_menu_type': recipes_by_menu_type,
-        'recipes_count': subscription_recipes.count(),
+        'menu_sections': menu_sections,
+        'recipes_count': len(subscription_recipes),
+    })
+
+
+@login_required
+def shopping_list_view(request):
+    user_page = UserPage.objects.filter(user=request.user).first()
+    active_subscription = user_page.subscription.first() if user_page else None
+
+    if not active_subscription:
+        messages.warning(request, 'У вас нет активной подписки')
+        return redirect('lk')
+
+    items = build_shopping_list(active_subscription)
+
+    return render(request, 'accounts/shopping_list.html', {
+        'user_page': user_page,
+        'active_subscription': active_subscription,
+        'items': items,
+        'total_price': sum(item['total_price'] for item in items),
     })
 
 
+class Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
 @login_required
+def shopping_list_csv_view(request):
+    user_page = UserPage.objects.filter(user=request.user).first()
+    active_subscription = user_page.subscription.first() if user_page else None
+
+    if not active_subscription:
+        messages.warning(request, 'У вас нет активной подписки')
+        return redirect('lk')
+
+    def rows():
+        writer = csv.writer(Echo(), delimiter=';')
+        # BOM — чтобы Excel открыл файл в UTF-8
+        yield '\ufeff' + writer.writerow(['Ингредиент', 'Масса, г', 'Стоимость, руб.'])
+        for item in build_shopping_list(active_subscription):
+            yield writer.writerow([item['name'], item['total_mass'], item['total_price']])
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="shopping_list.csv"'
+    return response
+
+
+@staff_member_required
+def catalog_export_view(request):
+    """
+    Выгрузка каталога для переноса между окружениями:
+    ?format=json|ndjson (по умолчанию ndjson), ?gzip=1 — сжатый файл.
+    """
+    file_format = 'json' if request.GET.get('format') == 'json' else 'ndjson'
+    compress = request.GET.get('gzip') == '1'
+    filename = f'catalog.{file_format}' + ('.gz' if compress else '')
+
+    response = StreamingHttpResponse(
+        iter_catalog_export(file_format, compress=compress),
+        content_type='application/gzip' if compress else 'application/json; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def media_view(request, path, document_root=None):
+    """
+    Раздача /media/ при разработке. Файлы с именем из хеша содержимого
+    не меняются, поэтому кэшируются браузером и прокси на год без проверок.
+    """
+    response = serve(request, path, document_root=document_root)
+    if is_content_addressed(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+@login_required
+@read_only_view
 def lk_view(request):
+    # шаблон несколько раз обращается к аллергиям и типам меню профиля и подписки;
+    # типы меню упорядочены, чтобы menu_types.first тоже брался из prefetch
+    ordered_menu_types = Prefetch('menu_types', queryset=MenuType.objects.order_by('pk'))
     try:
-        user_page = UserPage.objects.get(user=request.user)
+        user_page = UserPage.objects.prefetch_related('allergies', ordered_menu_types).get(user=request.user)
     except UserPage.DoesNotExist:
         user_page = UserPage.objects.create(
             user=request.user,
             username=request.user.username
         )
 
-    active_subscription = user_page.subscription.first()
-    safe_recipes = user_page.get_safe_recipes()
+    active_subscription = user_page.subscription.prefetch_related('menu_types').first()
+    safe_recipe_ids = safe_recipe_cache.recipe_ids(
+        user_page.get_menu_type_ids(), user_page.get_allergy_ids()
+    )
 
     return render(request, 'accounts/lk.html', {
         'user_page': user_page,
         'active_subscription': active_subscription,
-        'safe_recipes_count': safe_recipes.count(),
+        'safe_recipes_count': len(safe_recipe_ids),
     })
 
 
-def calculate_price(months, persons, breakfast, lunch, dinner, dessert):
-    prices = {
-        1: {'breakfast': 100, 'lunch': 300, 'dinner': 200, 'dessert': 100},
-        3: {'breakfast': 200, 'lunch': 600, 'dinner': 400, 'dessert': 200},
-        6: {'breakfast': 300, 'lunch': 900, 'dinner': 600, 'dessert': 300},
-        12: {'breakfast': 400, 'lunch': 1200, 'dinner': 800, 'dessert': 400}
-    }
+@staff_member_required
+def safe_recipe_cache_stats(request):
+    return JsonResponse(safe_recipe_cache.stats())
 
-    month_prices = prices.get(months, prices[1])
 
-    total_price = 0
-    if breakfast:
-        total_price += month_prices['breakfast']
-    if lunch:
-        total_price += month_prices['lunch']
-    if dinner:
-        total_price += month_prices['dinner']
-    if dessert:
-        total_price += month_prices['dessert']
-
-    total_price *= persons
-
-    return total_price
+def calculate_price(months, persons, breakfast, lunch, dinner, dessert):
+    return quote(months, persons, breakfast, lunch, dinner, dessert)
 
 
 # --- хелпер применения промокода ---
@@ -287,7 +352,7 @@ def apply_promocode_if_any(base_price: int, promocode_raw: str):
     if PromoCode is None:
         return base_price, None, False
 
-    promo = PromoCode.objects.filter(code__iexact=promocode_raw, is_active=True).first()
+    promo = get_promocode(promocode_raw)
     if not promo:
         return base_price, None, False
 
@@ -296,14 +361,16 @@ def apply_promocode_if_any(base_price: int, promocode_raw: str):
         return base_price, None, False
     if hasattr(promo, "valid_to") and promo.valid_to and today > promo.valid_to:
         return base_price, None, False
+    # счётчик в кэше может отставать — окончательно лимит проверяет redeem_promocode
+    if promo.is_exhausted():
+        return base_price, None, False
 
     try:
         discount = int(getattr(promo, "discount_percent", 0))
     except Exception:
         discount = 0
 
-    final_price = int(round(base_price * (100 - max(0, min(discount, 100))) / 100))
-    return final_price, promo, True
+    return apply_discount(base_price, discount), promo, True
 
 
 @login_required
@@ -311,6 +378,8 @@ def ajax_check_promocode(request):
     """
     GET-параметры:
       promocode, months, persons, breakfast, lunch, dinner, dessert  (значения '1'/'0')
+    Страница заказа передаёт только promocode и считает цену сама по сетке тарифа,
+    остальные параметры нужны лишь для final_price.
     Возвращает JSON: {applied: bool, final_price: int, discount: int}
     """
     promocode = (request.GET.get("promocode") or "").strip()
@@ -330,7 +399,8 @@ def ajax_check_promocode(request):
 
     base_price = calculate_price(months, persons, breakfast, lunch, dinner, dessert)
     final_price, promo_obj, applied = apply_promocode_if_any(base_price, promocode)
-    discount = int(getattr(promo_obj, "discount_percent", 0)) if applied else 0
+    # та же скидка, что попадёт в apply_discount, — страница пересчитывает цену по ней
+    discount = clamp_discount(promo_obj.discount_percent) if applied else 0
 
     return JsonResponse({
         "applied": applied,
@@ -339,19 +409,24 @@ def ajax_check_promocode(request):
     })
 
 
+def recipe_card_etag(request, recipe_id):
+    version = get_catalog_version()
+    if get_recipe_card(recipe_id, version) is None:
+        return None
+    # шапка страницы зависит от того, вошёл ли пользователь
+    return f'"{recipe_id}-{version}-{request.user.pk or 0}"'
+
+
+@cache_control(private=True, no_cache=True)
+@read_only_view
+# без Last-Modified: время отрисовки у каждого процесса своё,
+# а ETag из версии каталога одинаков во всех
+@condition(etag_func=recipe_card_etag)
 def recipe_detail(request, recipe_id):
-    try:
-        recipe = Recipe.objects.get(id=recipe_id)
-        
-        if recipe.id % 3 == 1:
-            template = 'recipes/card1.html'
-        elif recipe.id % 3 == 2:
-            template = 'recipes/card2.html'
-        else:
-            template = 'recipes/card3.html'
-        
-        return render(request, template, {'recipe': recipe})
-        
-    except Recipe.DoesNotExist:
+    # карточка рецепта с ингредиентами берётся из кэша и рисуется заново,
+    # только когда меняется версия каталога
+    card = get_recipe_card(recipe_id)
+    if card is None:
         messages.error(request, 'Рецепт не найден')
-        return redirect('subscription_recipes')
\ No newline at end of file
+        return redirect('subscription_recipes')
+    return render(request, 'recipes/detail.html', {'card': card})